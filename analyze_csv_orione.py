@@ -9,6 +9,20 @@ from typing import Dict, Any, List, Optional
 import pandas as pd
 
 from patterns import detect_pattern_indices
+from candle_store import get_store
+from ohlcv_resample import resample_df
+
+# sorgente serie: "store" (candle_store, CANDLE_STORE_DIR) oppure "csv" (cartella dump)
+SOURCE = "store"
+CSV_FOLDER = Path("dump_orione_2026_b")   # ✅ la tua cartella attuale (SOURCE="csv")
+STORE_OUT_DIR = Path("orione_hits")       # output report quando SOURCE="store"
+
+# range opzionale sullo store (ms UTC, None = tutto)
+STORE_START_MS: Optional[int] = None
+STORE_END_MS: Optional[int] = None
+
+# TF da ricostruire dai CSV 1m quando il file dedicato non c'è (es. dump scaricato solo a 1m)
+DERIVE_TFS_FROM_1M: List[str] = ["3m", "5m"]
 
 # supporta anche tf oltre 1/3/5m se in futuro li dumpi
 TF_RE = re.compile(r"_(1m|3m|5m|15m|30m|1h|2h|4h|6h|12h|1d)\.csv$", re.IGNORECASE)
@@ -98,11 +112,57 @@ def load_csv_ohlcv(path: Path) -> pd.DataFrame:
 
     return out
 
+def _with_derived(items: List[Any]):
+    """
+    items: [(label, coin, tf, load_fn)]. Yield (label, coin, tf, df) + i TF derivati da 1m
+    per le coin che non hanno già quella serie.
+    """
+    have = {(coin, tf) for _, coin, tf, _ in items}
+    for label, coin, tf, load in items:
+        df = load()
+        yield label, coin, tf, df
+
+        if tf != "1m" or "timestamp" not in df.columns:
+            continue
+        for dtf in DERIVE_TFS_FROM_1M:
+            if (coin, dtf) in have:
+                continue
+            ddf = resample_df(df.astype({"timestamp": "int64"}), dtf, only_complete=True)
+            yield f"{label}@{dtf}", coin, dtf, ddf
+
+def iter_series_csv(csvs: List[Path]):
+    items = [
+        (p.name, infer_coin_from_name(p), infer_tf_from_name(p), (lambda p=p: load_csv_ohlcv(p)))
+        for p in csvs
+    ]
+    return _with_derived(items)
+
+def iter_series_store(start_ms: Optional[int] = None, end_ms: Optional[int] = None):
+    store = get_store()
+    items = [
+        (
+            f"store:{coin}/{tf}",
+            coin.upper(),
+            tf,
+            (lambda coin=coin, tf=tf: store.read_df(coin, tf, start_ms, end_ms)),
+        )
+        for coin, tf in store.list_series()
+    ]
+    return _with_derived(items)
+
 def main():
-    folder = Path("dump_orione_2026_b")   # ✅ la tua cartella attuale
-    csvs = sorted(folder.glob("hl_rest_ohlcv_*.csv"))  # ✅ evita CSV "copia" / report / risultati
-    if not csvs:
-        raise SystemExit(f"Nessun CSV trovato in {folder.resolve()} (pattern: hl_rest_ohlcv_*.csv)")
+    if SOURCE == "store":
+        folder = STORE_OUT_DIR
+        folder.mkdir(parents=True, exist_ok=True)
+        series = iter_series_store(STORE_START_MS, STORE_END_MS)
+        if not get_store().list_series():
+            raise SystemExit(f"Candle store vuoto: {get_store().root.resolve()}")
+    else:
+        folder = CSV_FOLDER
+        csvs = sorted(folder.glob("hl_rest_ohlcv_*.csv"))  # ✅ evita CSV "copia" / report / risultati
+        if not csvs:
+            raise SystemExit(f"Nessun CSV trovato in {folder.resolve()} (pattern: hl_rest_ohlcv_*.csv)")
+        series = iter_series_csv(csvs)
 
     rows_summary: List[Dict[str, Any]] = []
     pattern_counts: Dict[str, int] = {}
@@ -114,12 +174,7 @@ def main():
     events_rows: List[Dict[str, Any]] = []
 
     with out_jsonl.open("w", encoding="utf-8") as fjsonl:
-        for p in csvs:
-            coin = infer_coin_from_name(p)
-            tf = infer_tf_from_name(p)
-
-            df = load_csv_ohlcv(p)
-
+        for fname, coin, tf, df in series:
             # NB: detect_pattern_indices tipicamente usa solo open/high/low/close
             # ma lasciamo timestamp in df per poter mappare idx -> ts_ms
             hits = detect_pattern_indices(df, timeframe=tf)
@@ -144,7 +199,7 @@ def main():
                         ts_ms = None
 
                 rec = {
-                    "file": p.name,
+                    "file": fname,
                     "coin": coin,
                     "tf": tf,
                     "timestamp_ms": ts_ms,
@@ -154,7 +209,7 @@ def main():
                 fjsonl.write(json.dumps(rec, ensure_ascii=False) + "\n")
 
                 events_rows.append({
-                    "file": p.name,
+                    "file": fname,
                     "coin": coin,
                     "tf": tf,
                     "timestamp_ms": ts_ms,
@@ -168,7 +223,7 @@ def main():
             rows_summary.append({
                 "coin": coin,
                 "tf": tf,
-                "file": p.name,
+                "file": fname,
                 "bars": int(len(df)),
                 "has_timestamp": bool("timestamp" in df.columns),
                 "hits_total": int(total),
@@ -0,0 +1,149 @@
+# tools/bench_download.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Tuple
+
+# il downloader legge HYPERLIQUID_REST_URL all'import: va puntato al mock prima
+BENCH_HOST = "127.0.0.1"
+BENCH_PORT = int(os.environ.get("BENCH_PORT", "8901"))
+os.environ["HYPERLIQUID_REST_URL"] = f"http://{BENCH_HOST}:{BENCH_PORT}"
+
+import numpy as np  # noqa: E402
+import uvicorn  # noqa: E402
+
+from download_hl_ohlcv_range_multi import MAX_CONCURRENT_JOBS, fetch_range_batch  # noqa: E402
+from hyper_rest import CandleBatch, aclose_client, hl_limiter  # noqa: E402
+from mock_hl_server import MockConfig, make_app, synthetic_candles  # noqa: E402
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+COIN_COUNTS = [1, 10, 30, 100]
+TF = "1m"
+BENCH_BARS = 6000          # barre per coin (3 pagine da REQ_LIMIT=2000)
+
+# weight/min del limiter in modalità concorrente: col budget reale (1200) il bench
+# misura il limiter, non il client; alzalo per vedere il throughput del downloader
+BENCH_WEIGHT_PER_MIN = int(os.environ.get("BENCH_WEIGHT_PER_MIN", "1000000"))
+
+MOCK = MockConfig(
+    latency_ms=float(os.environ.get("MOCK_HL_LATENCY_MS", "30")),
+    page_limit=5000,
+    rate_429=float(os.environ.get("MOCK_HL_429_RATE", "0.02")),
+    retry_after_sec=0.2,
+    missing_rate=float(os.environ.get("MOCK_HL_MISSING_RATE", "0.02")),
+)
+
+def _coins(n: int) -> List[str]:
+    return [f"SYN{i:03d}" for i in range(n)]
+
+def _check(b: CandleBatch, start_ms: int, end_ms: int) -> Tuple[int, int, int]:
+    """(gap, duplicati, valori diversi) rispetto alle candle sintetiche attese."""
+    exp = synthetic_candles(b.coin, TF, start_ms, end_ms)
+    ts = np.asarray(b.ts, dtype=np.int64)
+    dups = int(ts.shape[0] - np.unique(ts).shape[0])
+    present = np.isin(exp["ts"], ts)
+    gaps = int((~present).sum())
+
+    idx = np.searchsorted(exp["ts"], ts)
+    ok = (idx < exp["ts"].shape[0])
+    idx = idx[ok]
+    bad = int((~np.isclose(np.asarray(b.close)[ok], exp["close"][idx], rtol=1e-12)).sum())
+    return gaps, dups, bad
+
+async def _bench_mode(mode: str, coins: List[str], start_ms: int, end_ms: int, stats) -> Dict[str, float]:
+    req0 = stats.requests
+    t0 = time.perf_counter()
+    results: List[CandleBatch] = []
+    errors = 0
+
+    if mode == "sequential":
+        # baseline davvero sequenziale: una coin e una pagina alla volta
+        for c in coins:
+            try:
+                results.append(await fetch_range_batch(
+                    coin_key=c, tf=TF, start_ms=start_ms, end_ms=end_ms, page_concurrency=1
+                ))
+            except Exception:
+                errors += 1
+    else:
+        limiter = hl_limiter(BENCH_WEIGHT_PER_MIN)
+        sem = asyncio.Semaphore(max(1, int(MAX_CONCURRENT_JOBS)))
+
+        async def _one(c: str) -> None:
+            nonlocal errors
+            async with sem:
+                try:
+                    results.append(await fetch_range_batch(
+                        coin_key=c, tf=TF, start_ms=start_ms, end_ms=end_ms, limiter=limiter
+                    ))
+                except Exception:
+                    errors += 1
+
+        await asyncio.gather(*(_one(c) for c in coins))
+
+    dt = time.perf_counter() - t0
+    candles = sum(len(b) for b in results)
+    gaps = dups = bad = 0
+    for b in results:
+        g, d, x = _check(b, start_ms, end_ms)
+        gaps += g
+        dups += d
+        bad += x
+    reqs = stats.requests - req0
+    return {
+        "sec": dt,
+        "candles_s": candles / dt if dt > 0 else 0.0,
+        "req_s": reqs / dt if dt > 0 else 0.0,
+        "requests": reqs,
+        "gaps": gaps,
+        "dups": dups,
+        "bad": bad,
+        "errors": errors,
+    }
+
+async def main() -> None:
+    app = make_app(MOCK)
+    server = uvicorn.Server(uvicorn.Config(app, host=BENCH_HOST, port=BENCH_PORT, log_level="warning"))
+    srv_task = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    step = 60_000
+    now_ms = int(time.time() * 1000)
+    end_ms = now_ms - (now_ms % step) - step
+    start_ms = end_ms - (BENCH_BARS - 1) * step
+
+    print(
+        f"[BENCH] mock {os.environ['HYPERLIQUID_REST_URL']} latency={MOCK.latency_ms}ms "
+        f"429={MOCK.rate_429:.0%} missing={MOCK.missing_rate:.0%} bars/coin={BENCH_BARS}"
+    )
+    print(f"{'coins':>5} {'mode':>10} {'sec':>7} {'candles/s':>10} {'req/s':>7} {'req':>5} "
+          f"{'gaps':>5} {'dups':>5} {'bad':>4} {'err':>4}")
+    try:
+        for n in COIN_COUNTS:
+            coins = _coins(n)
+            for mode in ("sequential", "concurrent"):
+                r = await _bench_mode(mode, coins, start_ms, end_ms, app.state.stats)
+                print(
+                    f"{n:>5} {mode:>10} {r['sec']:>7.2f} {r['candles_s']:>10.0f} {r['req_s']:>7.1f} "
+                    f"{r['requests']:>5} {r['gaps']:>5} {r['dups']:>5} {r['bad']:>4} {r['errors']:>4}"
+                )
+        s = app.state.stats
+        print(f"[MOCK] requests={s.requests} 429={s.rate_limited} pagine_vuote={s.missing_pages}")
+    finally:
+        server.should_exit = True
+        await srv_task
+
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await aclose_client()
+
+if __name__ == "__main__":
+    asyncio.run(_run())
@@ -0,0 +1,207 @@
+# backend/orione/candle_codec.py
+"""
+Formato compatto per serie OHLCV (una partizione / un blocco di barre):
+
+- ts: primo ts int64 + delta in unità di `ts_unit` (gcd dei delta, di solito tf_ms)
+- prezzi: interi in tick di 10**-price_decimals (per simbolo: PENGU 0.0072 -> 72 con 4 decimali)
+  close delta-encoded sulla close precedente; open/high/low come offset dalla close
+- volume: intero in unità di 10**-volume_decimals; se non c'è un k esatto (volumi
+  sommati dal resample: 0.1 + 0.2 != 0.3) viene quantizzato a VOLUME_DECIMALS
+- ogni colonna usa il dtype intero più piccolo che la contiene (int8..int64)
+
+Decodifica vettoriale (cumsum + divisione): i prezzi tornano identici a quelli
+parsati dal testo HL, quindi i confronti nei detector non cambiano. I volumi sono
+identici se decimali esatti, altrimenti arrotondati a 10**-VOLUME_DECIMALS.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Dict, Optional
+
+import numpy as np
+
+from ohlcv_resample import OHLCV_KEYS
+
+MAGIC = b"OCC1"
+VERSION = 1
+
+# header: magic, version, n, price_dec, vol_dec, ts0, ts_unit, c0, dtype codes (6)
+_HEADER = struct.Struct("<4sBIbbqqq6s")
+
+# decimali massimi provati in inferenza (HL: max 6 decimali perp, 8 spot)
+MAX_DECIMALS = 10
+
+# override per simbolo se l'inferenza non basta (es. tick noto dall'exchange)
+PRICE_DECIMALS: Dict[str, int] = {}
+
+# quantizzazione volumi quando non sono decimali esatti (HL: max 8 decimali spot)
+VOLUME_DECIMALS = 8
+
+_INT_CODES = (b"b", b"h", b"i", b"q")
+_INT_MAX = 2**62
+
+def _min_int_dtype(x: np.ndarray) -> np.dtype:
+    if x.shape[0] == 0:
+        return np.dtype("<i1")
+    lo, hi = int(x.min()), int(x.max())
+    for code in _INT_CODES:
+        info = np.iinfo(np.dtype(code.decode()))
+        if info.min <= lo and hi <= info.max:
+            return np.dtype("<" + code.decode())
+    return np.dtype("<i8")
+
+def _roundtrips(x: np.ndarray, decimals: int) -> bool:
+    return bool(np.array_equal(from_ticks(to_ticks(x, decimals), decimals), x))
+
+def infer_decimals(x: np.ndarray, max_decimals: int = MAX_DECIMALS) -> int:
+    """
+    Minimo k tale che x -> tick (10**-k) -> float torni identico.
+    ValueError se x ha NaN/inf, se i tick uscirebbero da int64 prima di trovare k
+    o se nessun k <= max_decimals è esatto: mai un k con perdita di precisione.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if not np.all(np.isfinite(x)):
+        raise ValueError("valori NaN/inf non codificabili")
+    if x.shape[0] == 0:
+        return 0
+    amax = float(np.abs(x).max())
+    for k in range(0, int(max_decimals) + 1):
+        if amax * 10.0**k >= _INT_MAX:
+            raise ValueError(f"nessun k esatto prima dell'overflow int64 (|x| max {amax}, k={k})")
+        if _roundtrips(x, k):
+            return k
+    raise ValueError(f"valori non rappresentabili con <= {max_decimals} decimali")
+
+def to_ticks(x: np.ndarray, decimals: int) -> np.ndarray:
+    """Prezzi -> interi in tick (utile anche per confronti esatti al posto di *_EPS)."""
+    x = np.asarray(x, dtype=np.float64)
+    if not np.all(np.isfinite(x)):
+        raise ValueError("valori NaN/inf non convertibili in tick")
+    y = np.round(x * 10.0**int(decimals))
+    if y.shape[0] and float(np.abs(y).max()) >= _INT_MAX:
+        raise ValueError(f"tick fuori range int64 con {decimals} decimali")
+    return y.astype(np.int64)
+
+def from_ticks(t: np.ndarray, decimals: int) -> np.ndarray:
+    return np.asarray(t, dtype=np.int64) / 10.0**int(decimals)
+
+def encode(
+    cols: Dict[str, np.ndarray],
+    *,
+    price_decimals: Optional[int] = None,
+    volume_decimals: Optional[int] = None,
+) -> bytes:
+    """
+    Colonne OHLCV_KEYS (ts ordinati) -> bytes nel formato compatto.
+    price_decimals deve essere esatto (ValueError altrimenti); volume_decimals esplicito quantizza.
+    """
+    ts = np.asarray(cols["ts"], dtype=np.int64)
+    n = int(ts.shape[0])
+    o = np.asarray(cols["open"], dtype=np.float64)
+    h = np.asarray(cols["high"], dtype=np.float64)
+    l = np.asarray(cols["low"], dtype=np.float64)
+    c = np.asarray(cols["close"], dtype=np.float64)
+    v = np.asarray(cols.get("volume") if cols.get("volume") is not None else np.zeros(n), dtype=np.float64)
+
+    px = np.concatenate([o, h, l, c])
+    if price_decimals is None:
+        price_decimals = infer_decimals(px)
+    elif not _roundtrips(px, price_decimals):
+        raise ValueError(f"price_decimals={price_decimals} perde precisione sui prezzi")
+    if volume_decimals is None:
+        try:
+            volume_decimals = infer_decimals(v, VOLUME_DECIMALS)
+        except ValueError:
+            if not np.all(np.isfinite(v)):
+                raise
+            volume_decimals = VOLUME_DECIMALS  # somme float: quantizza (to_ticks arrotonda)
+
+    if n == 0:
+        return _HEADER.pack(MAGIC, VERSION, 0, price_decimals, volume_decimals, 0, 1, 0, b"bbbbbb")
+
+    dts = np.diff(ts)
+    unit = int(np.gcd.reduce(dts)) if dts.shape[0] and int(dts.min()) > 0 else 1
+    dts = dts // unit
+
+    ct = to_ticks(c, price_decimals)
+    parts = [
+        dts,
+        np.diff(ct),
+        to_ticks(o, price_decimals) - ct,
+        to_ticks(h, price_decimals) - ct,
+        to_ticks(l, price_decimals) - ct,
+        to_ticks(v, volume_decimals),
+    ]
+    dtypes = [_min_int_dtype(p) for p in parts]
+    codes = b"".join(dt.char.encode() for dt in dtypes)
+
+    head = _HEADER.pack(MAGIC, VERSION, n, price_decimals, volume_decimals, int(ts[0]), unit, int(ct[0]), codes)
+    return head + b"".join(p.astype(dt).tobytes() for p, dt in zip(parts, dtypes))
+
+def decode(buf: bytes) -> Dict[str, np.ndarray]:
+    """Inverso di encode(): colonne OHLCV_KEYS (ts int64, resto float64)."""
+    magic, ver, n, pdec, vdec, ts0, unit, c0, codes = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or ver != VERSION:
+        raise ValueError("formato candle compatto non riconosciuto")
+    if n == 0:
+        return {k: np.zeros(0, dtype=np.int64 if k == "ts" else np.float64) for k in OHLCV_KEYS}
+
+    off = _HEADER.size
+    lens = (n - 1, n - 1, n, n, n, n)
+    arrs = []
+    for code, ln in zip(codes, lens):
+        dt = np.dtype("<" + chr(code))
+        arrs.append(np.frombuffer(buf, dtype=dt, count=ln, offset=off).astype(np.int64))
+        off += ln * dt.itemsize
+    dts, dc, do, dh, dl, vt = arrs
+
+    ts = np.empty(n, dtype=np.int64)
+    ts[0] = ts0
+    np.cumsum(dts * unit, out=ts[1:])
+    ts[1:] += ts0
+
+    ct = np.empty(n, dtype=np.int64)
+    ct[0] = c0
+    np.cumsum(dc, out=ct[1:])
+    ct[1:] += c0
+
+    return {
+        "ts": ts,
+        "open": from_ticks(ct + do, pdec),
+        "high": from_ticks(ct + dh, pdec),
+        "low": from_ticks(ct + dl, pdec),
+        "close": from_ticks(ct, pdec),
+        "volume": from_ticks(vt, vdec),
+    }
+
+def _report(root: str) -> None:
+    """python candle_codec.py [store_root]  -> dimensioni e tempi raw vs compatto."""
+    import time
+
+    from candle_store import CandleStore
+
+    store = CandleStore(root, codec="raw")
+    raw_b = cmp_b = 0
+    t_raw = t_cmp = 0.0
+    for coin, tf in store.list_series():
+        for d in store.days(coin, tf):
+            path = store._part_path(coin, tf, d)
+            t0 = time.perf_counter()
+            rec = np.array(store._load(path))
+            t_raw += time.perf_counter() - t0
+            blob = encode({k: rec[k] for k in OHLCV_KEYS}, price_decimals=PRICE_DECIMALS.get(coin))
+            t0 = time.perf_counter()
+            back = decode(blob)
+            t_cmp += time.perf_counter() - t0
+            if not np.array_equal(back["close"], rec["close"]):
+                print(f"[WARN] {coin} {tf} {d}: close non identiche dopo roundtrip")
+            raw_b += path.stat().st_size
+            cmp_b += len(blob)
+    if raw_b:
+        print(f"[CODEC] raw={raw_b / 1e6:.1f}MB compatto={cmp_b / 1e6:.1f}MB ({raw_b / max(1, cmp_b):.1f}x) "
+              f"load raw={t_raw * 1e3:.0f}ms decode={t_cmp * 1e3:.0f}ms")
+
+if __name__ == "__main__":
+    import sys
+
+    _report(sys.argv[1] if len(sys.argv) > 1 else "candle_store")
@@ -0,0 +1,329 @@
+# backend/orione/candle_store.py
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from candle_codec import PRICE_DECIMALS, decode as _codec_decode, encode as _codec_encode
+from ohlcv_resample import OHLCV_KEYS, tf_to_ms
+
+def _env_str(name: str, default: str) -> str:
+    v = (os.getenv(name, default) or default).strip()
+    return v if v else default
+
+# root dello store: <root>/<COIN>/<TF>/<YYYY-MM-DD>.bin
+CANDLE_STORE_DIR = _env_str("CANDLE_STORE_DIR", "candle_store")
+
+# formato partizioni: "raw" (record fissi, mmap zero-copy) o "compact" (candle_codec, ~3-4x più piccolo)
+CANDLE_STORE_CODEC = _env_str("CANDLE_STORE_CODEC", "raw")
+
+DAY_MS = 86_400_000
+
+# record a larghezza fissa (48 byte): le colonne sono viste strided sul mmap
+RECORD_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+PART_SUFFIX = ".bin"
+COMPACT_SUFFIX = ".occ"
+
+def _day_name(day: int) -> str:
+    return np.datetime64(int(day), "D").astype(str)
+
+def _parse_day(name: str) -> Optional[int]:
+    try:
+        return int(np.datetime64(name, "D").astype(np.int64))
+    except Exception:
+        return None
+
+def _empty() -> Dict[str, np.ndarray]:
+    return {k: np.zeros(0, dtype=RECORD_DTYPE[k]) for k in OHLCV_KEYS}
+
+def _columns(rec: np.ndarray) -> Dict[str, np.ndarray]:
+    return {k: rec[k] for k in OHLCV_KEYS}
+
+class CandleStore:
+    """
+    Store OHLCV locale partizionato per coin / tf / giorno UTC.
+
+    - ogni partizione è un file di record fissi (RECORD_DTYPE), ordinati per ts e unici
+    - read() mappa i file con np.memmap: se il range sta in una sola partizione
+      le colonne restituite sono viste zero-copy; su più giorni vengono concatenate
+    - write() fa merge con la partizione esistente e la sostituisce in modo atomico
+      (tmp + fsync + os.replace): un lettore vede sempre la versione vecchia o la nuova
+    - codec="compact": partizioni .occ (ts delta, prezzi in tick per simbolo, volume scalato);
+      meno byte da disco, ma la lettura decodifica invece di mappare
+    """
+
+    def __init__(self, root: Union[str, Path, None] = None, *, codec: Optional[str] = None) -> None:
+        self.root = Path(root or CANDLE_STORE_DIR)
+        self.codec = (codec or CANDLE_STORE_CODEC).strip().lower()
+        if self.codec not in ("raw", "compact"):
+            raise ValueError(f"codec store non supportato: {self.codec}")
+        self.suffix = COMPACT_SUFFIX if self.codec == "compact" else PART_SUFFIX
+
+    # ----------------------------
+    # layout
+    # ----------------------------
+    def _series_dir(self, coin: str, tf: str) -> Path:
+        return self.root / str(coin).strip() / str(tf).strip().lower()
+
+    def _part_path(self, coin: str, tf: str, day: int) -> Path:
+        return self._series_dir(coin, tf) / f"{_day_name(day)}{self.suffix}"
+
+    def days(self, coin: str, tf: str) -> List[int]:
+        d = self._series_dir(coin, tf)
+        if not d.is_dir():
+            return []
+        out: List[int] = []
+        for p in d.glob(f"*{self.suffix}"):
+            day = _parse_day(p.name[: -len(self.suffix)])
+            if day is not None:
+                out.append(day)
+        out.sort()
+        return out
+
+    def list_series(self) -> List[Tuple[str, str]]:
+        if not self.root.is_dir():
+            return []
+        out: List[Tuple[str, str]] = []
+        for cdir in sorted(self.root.iterdir()):
+            if not cdir.is_dir():
+                continue
+            for tdir in sorted(cdir.iterdir()):
+                if tdir.is_dir():
+                    out.append((cdir.name, tdir.name))
+        return out
+
+    # ----------------------------
+    # read
+    # ----------------------------
+    def _load(self, path: Path) -> np.ndarray:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        if self.codec == "compact":
+            if size <= 0:
+                return np.zeros(0, dtype=RECORD_DTYPE)
+            cols = _codec_decode(path.read_bytes())
+            rec = np.empty(cols["ts"].shape[0], dtype=RECORD_DTYPE)
+            for k in OHLCV_KEYS:
+                rec[k] = cols[k]
+            return rec
+        n = size // RECORD_DTYPE.itemsize
+        if n <= 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(n,))
+
+    def _load_day(self, coin: str, tf: str, day: int) -> np.ndarray:
+        return self._load(self._part_path(coin, tf, day))
+
+    def read(
+        self,
+        coin: str,
+        tf: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Colonne OHLCV_KEYS con ts in [start_ms, end_ms] (None = aperto)."""
+        days = self.days(coin, tf)
+        if start_ms is not None:
+            days = [d for d in days if d >= int(start_ms) // DAY_MS]
+        if end_ms is not None:
+            days = [d for d in days if d <= int(end_ms) // DAY_MS]
+        if not days:
+            return _empty()
+
+        parts: List[np.ndarray] = []
+        for d in days:
+            rec = self._load_day(coin, tf, d)
+            if rec.shape[0] == 0:
+                continue
+            ts = rec["ts"]
+            i0 = 0 if start_ms is None else int(np.searchsorted(ts, int(start_ms), side="left"))
+            i1 = rec.shape[0] if end_ms is None else int(np.searchsorted(ts, int(end_ms), side="right"))
+            if i1 > i0:
+                parts.append(rec[i0:i1])
+
+        if not parts:
+            return _empty()
+        if len(parts) == 1:
+            return _columns(parts[0])
+        return _columns(np.concatenate(parts))
+
+    def tail(self, coin: str, tf: str, n: int, end_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Ultime n barre con ts <= end_ms, leggendo solo le partizioni necessarie."""
+        days = self.days(coin, tf)
+        if end_ms is not None:
+            days = [d for d in days if d <= int(end_ms) // DAY_MS]
+        parts: List[np.ndarray] = []
+        got = 0
+        for d in reversed(days):
+            rec = self._load_day(coin, tf, d)
+            if end_ms is not None and rec.shape[0]:
+                rec = rec[: int(np.searchsorted(rec["ts"], int(end_ms), side="right"))]
+            if rec.shape[0] == 0:
+                continue
+            parts.append(rec)
+            got += rec.shape[0]
+            if got >= int(n):
+                break
+        if not parts:
+            return _empty()
+        parts.reverse()
+        rec = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return _columns(rec[-int(n):] if int(n) > 0 else rec[:0])
+
+    def read_df(
+        self,
+        coin: str,
+        tf: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+    ):
+        """Come read() ma come DataFrame con colonne timestamp/open/high/low/close/volume."""
+        import pandas as pd
+
+        a = self.read(coin, tf, start_ms, end_ms)
+        return pd.DataFrame({
+            "timestamp": np.asarray(a["ts"]),
+            "open": np.asarray(a["open"]),
+            "high": np.asarray(a["high"]),
+            "low": np.asarray(a["low"]),
+            "close": np.asarray(a["close"]),
+            "volume": np.asarray(a["volume"]),
+        })
+
+    def bounds(self, coin: str, tf: str) -> Optional[Tuple[int, int]]:
+        days = self.days(coin, tf)
+        first: Optional[int] = None
+        last: Optional[int] = None
+        for d in days:
+            rec = self._load_day(coin, tf, d)
+            if rec.shape[0]:
+                first = int(rec["ts"][0])
+                break
+        for d in reversed(days):
+            rec = self._load_day(coin, tf, d)
+            if rec.shape[0]:
+                last = int(rec["ts"][-1])
+                break
+        if first is None or last is None:
+            return None
+        return first, last
+
+    def missing_intervals(
+        self,
+        coin: str,
+        tf: str,
+        start_ms: int,
+        end_ms: int,
+        *,
+        merge_gap_bars: int = 0,
+    ) -> List[Tuple[int, int]]:
+        """
+        Intervalli [a, b] (ts apertura barra, inclusi) attesi in [start_ms, end_ms]
+        ma assenti nello store, buchi interni compresi.
+        Intervalli separati da <= merge_gap_bars barre presenti vengono uniti
+        (meno richieste, a costo di riscaricare qualche barra).
+        """
+        step = tf_to_ms(tf)
+        first = int(start_ms) - (int(start_ms) % step)
+        if first < int(start_ms):
+            first += step
+        last = int(end_ms) - (int(end_ms) % step)
+        if last < first:
+            return []
+
+        expected = np.arange(first, last + step, step, dtype=np.int64)
+        have = np.asarray(self.read(coin, tf, first, last)["ts"], dtype=np.int64)
+        miss = expected[~np.isin(expected, have, assume_unique=True)] if have.shape[0] else expected
+        if miss.shape[0] == 0:
+            return []
+
+        brk = np.flatnonzero(np.diff(miss) > step * (1 + max(0, int(merge_gap_bars))))
+        starts = np.r_[miss[0], miss[brk + 1]]
+        ends = np.r_[miss[brk], miss[-1]]
+        return [(int(a), int(b)) for a, b in zip(starts, ends)]
+
+    # ----------------------------
+    # write
+    # ----------------------------
+    def _replace_part(self, path: Path, rec: np.ndarray, coin: str = "") -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        if self.codec == "compact":
+            data = _codec_encode(_columns(rec), price_decimals=PRICE_DECIMALS.get(str(coin).strip()))
+        else:
+            data = np.ascontiguousarray(rec, dtype=RECORD_DTYPE).tobytes()
+        with tmp.open("wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def write(self, coin: str, tf: str, cols: Dict[str, np.ndarray]) -> int:
+        """
+        Inserisce/aggiorna barre (dict con OHLCV_KEYS). A parità di ts vince la nuova.
+        Ritorna il numero di barre nuove (ts non presenti prima).
+        """
+        ts = np.asarray(cols["ts"], dtype=np.int64)
+        n = ts.shape[0]
+        if n == 0:
+            return 0
+
+        new = np.empty(n, dtype=RECORD_DTYPE)
+        for k in OHLCV_KEYS:
+            v = cols.get(k)
+            new[k] = np.asarray(v, dtype=RECORD_DTYPE[k]) if v is not None else 0
+        new = new[np.argsort(new["ts"], kind="stable")]
+
+        added = 0
+        day_of = new["ts"] // DAY_MS
+        cuts = np.flatnonzero(np.r_[True, day_of[1:] != day_of[:-1], True])
+        for a, b in zip(cuts[:-1], cuts[1:]):
+            chunk = new[a:b]
+            day = int(day_of[a])
+            path = self._part_path(coin, tf, day)
+            old = np.array(self._load(path))  # copia: il file verrà sostituito
+
+            merged = np.concatenate([old, chunk]) if old.shape[0] else chunk
+            merged = merged[np.argsort(merged["ts"], kind="stable")]
+            mts = merged["ts"]
+            keep = np.r_[mts[1:] != mts[:-1], True]  # dedup keep last (= nuova)
+            merged = merged[keep]
+
+            added += int(merged.shape[0] - old.shape[0])
+            self._replace_part(path, merged, coin)
+
+        return added
+
+    def write_rows(self, coin: str, tf: str, rows) -> int:
+        """Scorciatoia per liste di oggetti con ts/o/h/l/c/v (es. Row del downloader)."""
+        rows = list(rows)
+        return self.write(coin, tf, {
+            "ts": [r.ts for r in rows],
+            "open": [r.o for r in rows],
+            "high": [r.h for r in rows],
+            "low": [r.l for r in rows],
+            "close": [r.c for r in rows],
+            "volume": [r.v for r in rows],
+        })
+
+_default_store: Optional[CandleStore] = None
+
+def get_store() -> CandleStore:
+    """Store condiviso su CANDLE_STORE_DIR."""
+    global _default_store
+    if _default_store is None:
+        _default_store = CandleStore()
+    return _default_store
@@ -7,9 +7,22 @@ import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-
-from hyper_rest import _hl_rest_candles_rows
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+from hyper_rest import (
+    CANDLES_EMPTY,
+    CandleBatch,
+    HLCandlesError,
+    TokenBucket,
+    _hl_rest_candles_fetch,
+    _tf_ms,
+    aclose_client,
+    hl_limiter,
+)
+from candle_store import get_store
+from ohlcv_resample import derivable_from_1m, resample_arrays, tf_to_ms
 
 # ----------------------------
 # CONFIG
@@ -21,14 +34,28 @@ END_UTC   = "2026-03-10 12:30:59"
 
 TFS = ["1m", "3m", "5m"]
 
+# scarica solo 1m e ricostruisce gli altri TF in locale (1 download invece di len(TFS))
+DERIVE_FROM_1M = True
+
 # limit per request HL REST (se supporta 2000 meglio; altrimenti abbassa a 500/1000)
 REQ_LIMIT = 2000
 
-# micro-sleep per non martellare
+# pagine dello stesso range in volo insieme + passate di re-fetch per finestre corte
+PAGE_CONCURRENCY = 4
+GAP_RETRY_PASSES = 1
+
+# micro-sleep per non martellare (solo modalità sequenziale, senza limiter)
 RATE_SLEEP_SEC = 0.05
 
+# modalità concorrente: job (coin, tf) in parallelo sotto semaphore,
+# tutti dietro un unico token bucket sul weight HL (1200/min per IP)
+CONCURRENT = True
+MAX_CONCURRENT_JOBS = 8
+
+# destinazione principale: candle store locale (CANDLE_STORE_DIR, partizioni coin/tf/giorno)
+# il CSV in OUT_DIR resta come export opzionale
+WRITE_CSV = False
 OUT_DIR = Path("dump_orione_2026_b")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # ---------------------------------------------------------
 # COINS (da tua lista: coin_key = parte prima del "-")
@@ -87,100 +114,277 @@ class Row:
     c: float
     v: float
 
-async def fetch_range_rows(*, coin_key: str, tf: str, start_ms: int, end_ms: int) -> List[Row]:
+def _page_windows(*, start_ms: int, end_ms: int, tf_ms: int, limit: int) -> List[Tuple[int, int, int]]:
     """
-    Scarica via HL REST andando all'indietro con end_ts_ms (cursor).
-    Ritorna righe nel range [start_ms, end_ms], ordinate e dedup.
+    Divide [start_ms, end_ms] in finestre esatte da `limit` candle.
+    Ritorna (win_start, win_end, expected_bars); i timestamp HL sono multipli del TF.
     """
-    if not coin_key or not tf:
+    first = int(start_ms) - (int(start_ms) % tf_ms)
+    if first < int(start_ms):
+        first += tf_ms
+    last = int(end_ms) - (int(end_ms) % tf_ms)
+    if last < first:
         return []
 
-    cursor_end = int(end_ms)
-    acc: Dict[int, Row] = {}
-
-    # loop backward
-    for _ in range(20000):  # hard safety
-        rows = await _hl_rest_candles_rows(
-            coin_key=coin_key,
-            tf=tf,
-            limit=int(REQ_LIMIT),
-            end_ts_ms=int(cursor_end),
-        )
-
-        if not rows:
-            break
+    span = int(limit) * tf_ms
+    out: List[Tuple[int, int, int]] = []
+    ws = first
+    while ws <= last:
+        we = min(ws + span - tf_ms, last)
+        out.append((ws, we + tf_ms - 1, (we - ws) // tf_ms + 1))
+        ws = we + tf_ms
+    return out
 
-        # rows sono dict con "timestamp/open/high/low/close/volume"
-        min_ts_seen: Optional[int] = None
-        for r in rows:
-            try:
-                ts = int(r["timestamp"])
-            except Exception:
-                continue
-
-            if min_ts_seen is None or ts < min_ts_seen:
-                min_ts_seen = ts
-
-            if ts < start_ms:
-                # siamo oltre l'inizio; continuiamo solo per capire se finiamo pagina
-                pass
-
-            if start_ms <= ts <= end_ms:
-                try:
-                    acc[ts] = Row(
-                        ts=ts,
-                        o=float(r["open"]),
-                        h=float(r["high"]),
-                        l=float(r["low"]),
-                        c=float(r["close"]),
-                        v=float(r.get("volume", 0.0) or 0.0),
-                    )
-                except Exception:
-                    continue
-
-        if min_ts_seen is None:
+async def fetch_range_batch(
+    *,
+    coin_key: str,
+    tf: str,
+    start_ms: int,
+    end_ms: int,
+    limiter: Optional[TokenBucket] = None,
+    page_concurrency: Optional[int] = None,
+) -> CandleBatch:
+    """
+    Scarica via HL REST le finestre precalcolate del range [start_ms, end_ms]
+    in parallelo (dietro il limiter, max page_concurrency pagine, default PAGE_CONCURRENCY),
+    poi merge + dedup in colonne.
+    Gap-check: le finestre tornate corte vengono richieste di nuovo (GAP_RETRY_PASSES).
+    Se una pagina fallisce anche dopo i retry solleva HLCandlesError
+    (niente download troncati in silenzio).
+    """
+    if not coin_key or not tf:
+        return CandleBatch.empty(coin_key, tf)
+
+    tf_ms = _tf_ms(tf)
+    # niente attese sulle barre future: la finestra finale si ferma all'ultima barra aperta
+    now_ms = int(time.time() * 1000)
+    windows = _page_windows(start_ms=start_ms, end_ms=min(int(end_ms), now_ms), tf_ms=tf_ms, limit=int(REQ_LIMIT))
+    if not windows:
+        return CandleBatch.empty(coin_key, tf)
+
+    pages: List[CandleBatch] = []
+    sem = asyncio.Semaphore(max(1, int(PAGE_CONCURRENCY if page_concurrency is None else page_concurrency)))
+
+    async def _page(ws: int, we: int) -> None:
+        async with sem:
+            res = await _hl_rest_candles_fetch(
+                coin_key=coin_key,
+                tf=tf,
+                limit=int(REQ_LIMIT),
+                end_ts_ms=int(we),
+                start_ts_ms=int(ws),
+                limiter=limiter,
+                columnar=True,
+            )
+            if limiter is None:
+                await asyncio.sleep(RATE_SLEEP_SEC)
+
+        if res.status == CANDLES_EMPTY:
+            return
+        if not res.ok or res.batch is None:
+            raise HLCandlesError(res)
+        pages.append(res.batch.slice_ts(max(ws, int(start_ms)), min(we, int(end_ms))))
+
+    todo = windows
+    acc = CandleBatch.empty(coin_key, tf)
+    for pass_i in range(1 + max(0, int(GAP_RETRY_PASSES))):
+        await asyncio.gather(*(_page(ws, we) for ws, we, _ in todo))
+        acc = CandleBatch.concat([acc, *pages], coin=coin_key, tf=tf)
+        pages.clear()
+
+        # barre presenti per finestra (ts ordinati -> searchsorted)
+        short = []
+        missing = 0
+        for ws, we, exp in todo:
+            got = int(np.searchsorted(acc.ts, we, side="right") - np.searchsorted(acc.ts, ws, side="left"))
+            if got < exp:
+                short.append((ws, we, exp))
+                missing += exp - got
+        if not short:
             break
+        if pass_i < GAP_RETRY_PASSES:
+            todo = short
+        else:
+            print(f"[GAP] {coin_key} tf={tf} finestre corte={len(short)} barre mancanti={missing}")
+
+    return acc
+
+async def fetch_range_rows(
+    *,
+    coin_key: str,
+    tf: str,
+    start_ms: int,
+    end_ms: int,
+    limiter: Optional[TokenBucket] = None,
+) -> List[Row]:
+    """Come fetch_range_batch ma come lista di Row (compatibilità)."""
+    b = await fetch_range_batch(coin_key=coin_key, tf=tf, start_ms=start_ms, end_ms=end_ms, limiter=limiter)
+    return [
+        Row(ts=t, o=o, h=h, l=l, c=c, v=v)
+        for t, o, h, l, c, v in zip(
+            b.ts.tolist(), b.open.tolist(), b.high.tolist(), b.low.tolist(), b.close.tolist(), b.volume.tolist()
+        )
+    ]
 
-        # se la pagina più vecchia è già sotto start_ms, possiamo chiudere
-        if int(min_ts_seen) <= int(start_ms):
-            break
+def _write_csv(*, coin_key: str, tf: str, b: CandleBatch) -> Path:
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = OUT_DIR / f"hl_rest_ohlcv_{coin_key}_{tf}.csv"
 
-        # avanti all'indietro
-        cursor_end = int(min_ts_seen) - 1
-        await asyncio.sleep(RATE_SLEEP_SEC)
+    with out_path.open("w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["coin_key", "tf", "timestamp_ms", "open", "high", "low", "close", "volume"])
+        for t, o, h, l, c, v in zip(
+            b.ts.tolist(), b.open.tolist(), b.high.tolist(), b.low.tolist(), b.close.tolist(), b.volume.tolist()
+        ):
+            w.writerow([coin_key, tf, t, o, h, l, c, v])
 
-    out = list(acc.values())
-    out.sort(key=lambda x: x.ts)
-    return out
+    return out_path
 
-async def dump_one(*, label: str, hyper: str, tf: str, start_ms: int, end_ms: int) -> None:
+def _save_batch(*, coin_key: str, tf: str, b: CandleBatch) -> str:
+    """
+    Scrive nello store (+ CSV se WRITE_CSV). Ritorna la destinazione per il log.
+    Solo barre chiuse (ts < floor(now, tf)), come sync_candles: la barra in formazione
+    nello store non verrebbe più riparata dai resume successivi.
+    """
+    now_ms = int(time.time() * 1000)
+    step = _tf_ms(tf)
+    b = b.slice_ts(-(2 ** 62), now_ms - (now_ms % step) - 1)
+    store = get_store()
+    added = store.write(coin_key, tf, b.columns())
+    dest = f"store:{store.root}/{coin_key}/{tf} (+{added} nuove)"
+    if WRITE_CSV:
+        dest += f" + {_write_csv(coin_key=coin_key, tf=tf, b=b)}"
+    return dest
+
+async def dump_one(
+    *,
+    label: str,
+    hyper: str,
+    tf: str,
+    start_ms: int,
+    end_ms: int,
+    limiter: Optional[TokenBucket] = None,
+) -> int:
     coin_key = _hyper_to_coin_key(hyper)
     if not coin_key:
         print(f"[SKIP] {label} hyper='{hyper}' -> coin_key vuoto")
-        return
-
-    rows = await fetch_range_rows(coin_key=coin_key, tf=tf, start_ms=start_ms, end_ms=end_ms)
-    out_path = OUT_DIR / f"hl_rest_ohlcv_{coin_key}_{tf}.csv"
+        return 0
+
+    b = await fetch_range_batch(coin_key=coin_key, tf=tf, start_ms=start_ms, end_ms=end_ms, limiter=limiter)
+    out_path = _save_batch(coin_key=coin_key, tf=tf, b=b)
+
+    print(f"[OK] {label} ({coin_key}) tf={tf} rows={len(b)} -> {out_path}")
+    return len(b)
+
+async def dump_one_derived(
+    *,
+    label: str,
+    hyper: str,
+    tfs: List[str],
+    start_ms: int,
+    end_ms: int,
+    limiter: Optional[TokenBucket] = None,
+) -> int:
+    """
+    Scarica solo 1m e deriva gli altri TF con ohlcv_resample.
+    I bucket derivati da scrivere sono i buchi dello store per quel TF (missing_intervals),
+    ricostruiti solo se completi: il bucket finale ancora parziale resta un buco e viene
+    ripreso al run successivo.
+    """
+    coin_key = _hyper_to_coin_key(hyper)
+    if not coin_key:
+        print(f"[SKIP] {label} hyper='{hyper}' -> coin_key vuoto")
+        return 0
+
+    store = get_store()
+    derived = derivable_from_1m(tfs)
+    gaps = {tf: store.missing_intervals(coin_key, tf, start_ms, end_ms) for tf in derived}
+
+    # range 1m da scaricare: il range richiesto (se serve 1m) + tutte le 1m dei bucket mancanti
+    spans = [(int(start_ms), int(end_ms))] if "1m" in tfs else []
+    for tf, iv in gaps.items():
+        spans += [(a, b + tf_to_ms(tf) - 1) for a, b in iv]
+    if not spans:
+        print(f"[OK] {label} ({coin_key}) tf={','.join(derived)} niente da derivare")
+        return 0
+
+    b1 = await fetch_range_batch(
+        coin_key=coin_key,
+        tf="1m",
+        start_ms=min(a for a, _ in spans),
+        end_ms=max(b for _, b in spans),
+        limiter=limiter,
+    )
+
+    if "1m" in tfs:
+        b = b1.slice_ts(start_ms, end_ms)
+        out_path = _save_batch(coin_key=coin_key, tf="1m", b=b)
+        print(f"[OK] {label} ({coin_key}) tf=1m rows={len(b)} -> {out_path}")
+
+    for tf in derived:
+        step = tf_to_ms(tf)
+        parts: List[CandleBatch] = []
+        for a, b in gaps[tf]:
+            src = b1.slice_ts(a, b + step - 1)
+            r = resample_arrays(src.ts, src.open, src.high, src.low, src.close, src.volume, tf=tf, only_complete=True)
+            parts.append(CandleBatch.from_columns(coin_key, tf, r))
+        b = CandleBatch.concat(parts, coin=coin_key, tf=tf)
+        out_path = _save_batch(coin_key=coin_key, tf=tf, b=b)
+        print(f"[OK] {label} ({coin_key}) tf={tf} rows={len(b)} buchi={len(gaps[tf])} (da 1m) -> {out_path}")
+
+    return len(b1)
+
+def _build_jobs(start_ms: int, end_ms: int, limiter: Optional[TokenBucket]):
+    """Lista di (tag, coroutine factory): un job per coin (DERIVE_FROM_1M) o per (coin, tf)."""
+    jobs = []
+    for label, hyper in HYPER_PAIRS:
+        if DERIVE_FROM_1M:
+            jobs.append((
+                f"{label} tfs={','.join(TFS)}",
+                lambda label=label, hyper=hyper: dump_one_derived(
+                    label=label, hyper=hyper, tfs=list(TFS), start_ms=start_ms, end_ms=end_ms, limiter=limiter
+                ),
+            ))
+            continue
+        for tf in TFS:
+            jobs.append((
+                f"{label} tf={tf}",
+                lambda label=label, hyper=hyper, tf=tf: dump_one(
+                    label=label, hyper=hyper, tf=tf, start_ms=start_ms, end_ms=end_ms, limiter=limiter
+                ),
+            ))
+    return jobs
+
+async def run_sequential(start_ms: int, end_ms: int) -> None:
+    for tag, make in _build_jobs(start_ms, end_ms, None):
+        try:
+            await make()
+        except Exception as e:
+            print(f"[ERR] {tag} -> {type(e).__name__}: {e}")
+
+async def run_concurrent(start_ms: int, end_ms: int, *, max_jobs: int = MAX_CONCURRENT_JOBS) -> None:
+    limiter = hl_limiter()
+    jobs = _build_jobs(start_ms, end_ms, limiter)
+    sem = asyncio.Semaphore(max(1, int(max_jobs)))
+    total = len(jobs)
+    done = 0
+    t_all = time.perf_counter()
+
+    async def _one(tag: str, make) -> None:
+        nonlocal done
+        async with sem:
+            t0 = time.perf_counter()
+            rows = 0
+            try:
+                rows = await make()
+            except Exception as e:
+                print(f"[ERR] {tag} -> {type(e).__name__}: {e}")
+            dt = time.perf_counter() - t0
+            done += 1
+            print(f"[{done}/{total}] {tag} rows={rows} {dt:.2f}s (elapsed {time.perf_counter() - t_all:.1f}s)")
 
-    with out_path.open("w", newline="") as f:
-        w = csv.DictWriter(
-            f,
-            fieldnames=["coin_key", "tf", "timestamp_ms", "open", "high", "low", "close", "volume"],
-        )
-        w.writeheader()
-        for r in rows:
-            w.writerow({
-                "coin_key": coin_key,
-                "tf": tf,
-                "timestamp_ms": int(r.ts),
-                "open": float(r.o),
-                "high": float(r.h),
-                "low": float(r.l),
-                "close": float(r.c),
-                "volume": float(r.v),
-            })
-
-    print(f"[OK] {label} ({coin_key}) tf={tf} rows={len(rows)} -> {out_path}")
+    await asyncio.gather(*(_one(tag, make) for tag, make in jobs))
+    print(f"[RATE] attesa limiter totale {limiter.waited_sec:.1f}s")
 
 async def main() -> None:
     start_ms = _dt_utc_to_ms(START_UTC)
@@ -188,17 +392,21 @@ async def main() -> None:
 
     print("[RANGE]", START_UTC, "->", END_UTC, "UTC")
     print("[MS]", start_ms, "->", end_ms)
-    print("[OUT]", OUT_DIR.resolve())
+    print("[OUT]", get_store().root.resolve(), f"(csv: {OUT_DIR.resolve()})" if WRITE_CSV else "")
 
-    # sequenziale (più safe). Se vuoi, poi lo parallelizziamo con semaphore.
-    for label, hyper in HYPER_PAIRS:
-        for tf in TFS:
-            try:
-                await dump_one(label=label, hyper=hyper, tf=tf, start_ms=start_ms, end_ms=end_ms)
-            except Exception as e:
-                print(f"[ERR] {label} ({hyper}) tf={tf} -> {type(e).__name__}: {e}")
+    t0 = time.perf_counter()
+    if CONCURRENT:
+        await run_concurrent(start_ms, end_ms)
+    else:
+        await run_sequential(start_ms, end_ms)
+
+    print(f"[DONE] {time.perf_counter() - t0:.1f}s")
 
-    print("[DONE]")
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await aclose_client()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(_run())
\ No newline at end of file
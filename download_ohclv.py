@@ -7,7 +7,7 @@ import time
 from pathlib import Path
 from typing import List, Tuple
 
-from hyper_rest import _hl_rest_candles_rows
+from hyper_rest import _hl_rest_candles_rows, aclose_client
 
 # (LABEL, HYPER_SYMBOL)
 PAIRS: List[Tuple[str, str]] = [
@@ -79,5 +79,11 @@ async def main() -> None:
 
     print(f"[DONE] scritto in {OUT_DIR}")
 
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await aclose_client()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(_run())
\ No newline at end of file
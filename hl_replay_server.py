@@ -0,0 +1,167 @@
+# tools/hl_replay_server.py
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import websockets  # type: ignore
+except Exception:  # pragma: no cover - dipendenza opzionale
+    websockets = None  # type: ignore
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+# CSV registrati (formato dump: hl_rest_ohlcv_<COIN>_<TF>.csv)
+REPLAY_DIR = Path("dump_orione_live")
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# barre al secondo (per coin/tf); 0 = più veloce possibile
+BARS_PER_SEC = 20.0
+
+# update intra-barra prima di quello finale (simula la candela in formazione)
+INTRABAR_UPDATES = 2
+
+Bar = Tuple[int, float, float, float, float, float]
+
+def load_csv_bars(path: Path) -> List[Bar]:
+    out: List[Bar] = []
+    with path.open(newline="") as f:
+        for r in csv.DictReader(f):
+            try:
+                ts = int(float(r.get("timestamp") or r.get("timestamp_ms") or r.get("ts") or ""))
+                out.append((
+                    ts,
+                    float(r["open"]),
+                    float(r["high"]),
+                    float(r["low"]),
+                    float(r["close"]),
+                    float(r.get("volume") or 0.0),
+                ))
+            except Exception:
+                continue
+    out.sort(key=lambda b: b[0])
+    return out
+
+def _candle_msg(coin: str, tf: str, tf_ms: int, bar: Bar) -> str:
+    t, o, h, l, c, v = bar
+    return json.dumps({
+        "channel": "candle",
+        "data": {
+            "t": t,
+            "T": t + tf_ms - 1,
+            "s": coin,
+            "i": tf,
+            "o": str(o),
+            "h": str(h),
+            "l": str(l),
+            "c": str(c),
+            "v": str(v),
+            "n": 0,
+            "_replay_sent_ns": time.time_ns(),
+        },
+    })
+
+def _intrabar(bar: Bar, k: int, n: int) -> Bar:
+    """Update parziale k/n: close interpolato open->close, high/low coerenti."""
+    t, o, h, l, c, v = bar
+    pc = o + (c - o) * k / n
+    return (t, o, max(o, pc), min(o, pc), pc, v * k / n)
+
+def _tf_ms(tf: str) -> int:
+    t = (tf or "").strip().lower()
+    mult = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}.get(t[-1:], 60_000)
+    try:
+        return int(t[:-1]) * mult
+    except Exception:
+        return 60_000
+
+class ReplayServer:
+    """
+    Stand-in locale del WebSocket HL: accetta subscribe "candle" e
+    ristreamma i CSV registrati come messaggi channel="candle".
+    Ogni messaggio porta _replay_sent_ns per misurare la latenza lato client.
+    """
+
+    def __init__(
+        self,
+        replay_dir: Path = REPLAY_DIR,
+        *,
+        bars_per_sec: float = BARS_PER_SEC,
+        intrabar_updates: int = INTRABAR_UPDATES,
+    ) -> None:
+        self.replay_dir = Path(replay_dir)
+        self.bars_per_sec = float(bars_per_sec)
+        self.intrabar_updates = max(0, int(intrabar_updates))
+        self._cache: Dict[Tuple[str, str], List[Bar]] = {}
+        self.sent = 0
+
+    def _bars(self, coin: str, tf: str) -> List[Bar]:
+        k = (coin, tf)
+        if k not in self._cache:
+            p = self.replay_dir / f"hl_rest_ohlcv_{coin}_{tf}.csv"
+            self._cache[k] = load_csv_bars(p) if p.exists() else []
+        return self._cache[k]
+
+    async def _stream(self, ws: Any, coin: str, tf: str) -> None:
+        bars = self._bars(coin, tf)
+        tf_ms = _tf_ms(tf)
+        pause = (1.0 / self.bars_per_sec) if self.bars_per_sec > 0 else 0.0
+        for bar in bars:
+            n = self.intrabar_updates + 1
+            for k in range(1, n):
+                await ws.send(_candle_msg(coin, tf, tf_ms, _intrabar(bar, k, n)))
+                self.sent += 1
+            await ws.send(_candle_msg(coin, tf, tf_ms, bar))
+            self.sent += 1
+            await asyncio.sleep(pause)
+
+    async def handler(self, ws: Any, path: Optional[str] = None) -> None:
+        tasks: List[asyncio.Task] = []
+        try:
+            async for raw in ws:
+                try:
+                    msg = json.loads(raw)
+                except Exception:
+                    continue
+                method = msg.get("method")
+                if method == "ping":
+                    await ws.send(json.dumps({"channel": "pong"}))
+                    continue
+                if method != "subscribe":
+                    continue
+                sub = msg.get("subscription") or {}
+                await ws.send(json.dumps({"channel": "subscriptionResponse", "data": msg}))
+                if sub.get("type") == "candle":
+                    coin = str(sub.get("coin") or "")
+                    tf = str(sub.get("interval") or "").lower()
+                    tasks.append(asyncio.ensure_future(self._stream(ws, coin, tf)))
+        except Exception:
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def serve(self, host: str = HOST, port: int = PORT):
+        if websockets is None:
+            raise RuntimeError("pacchetto 'websockets' non installato")
+        return await websockets.serve(self.handler, host, int(port))
+
+async def main() -> None:
+    srv = ReplayServer()
+    server = await srv.serve()
+    print(f"[REPLAY] ws://{HOST}:{PORT} da {REPLAY_DIR.resolve()} ({BARS_PER_SEC} barre/s)")
+    try:
+        await asyncio.Future()
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
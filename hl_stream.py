@@ -0,0 +1,288 @@
+# backend/orione/hl_stream.py
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from hyper_rest import CandleBatch, _backoff_sec, _env_int, _env_str, _hl_rest_candles_batch, _tf_ms
+
+try:
+    import websockets  # type: ignore
+except Exception:  # pragma: no cover - dipendenza opzionale
+    websockets = None  # type: ignore
+
+HL_WS_URL = _env_str("HYPERLIQUID_WS_URL", "wss://api.hyperliquid.xyz/ws")
+
+# barre tenute in memoria per (coin, tf)
+HL_STREAM_RING_BARS = _env_int("HL_STREAM_RING_BARS", 1500)
+
+# HL chiude la connessione se non riceve nulla per 60s
+HL_STREAM_PING_SEC = 30.0
+
+Bar = Tuple[int, float, float, float, float, float]  # ts, o, h, l, c, v
+BarCallback = Callable[[str, str, Bar], Union[None, Awaitable[None]]]
+TradeCallback = Callable[[str, Dict[str, Any]], Union[None, Awaitable[None]]]
+
+class CandleRing:
+    """
+    Ring buffer a capacità fissa per una serie (ts crescenti).
+    upsert() aggiorna la barra in formazione o ne apre una nuova;
+    quando si apre una barra nuova restituisce quella appena chiusa.
+    """
+
+    def __init__(self, capacity: int = HL_STREAM_RING_BARS) -> None:
+        self.cap = max(2, int(capacity))
+        self._ts = np.zeros(self.cap, dtype=np.int64)
+        self._px = np.zeros((self.cap, 5), dtype=np.float64)
+        self._n = 0
+        self._head = 0  # prossimo slot da scrivere
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _order_idx(self) -> np.ndarray:
+        """Slot fisici in ordine cronologico (0 = più vecchia)."""
+        start = (self._head - self._n) % self.cap
+        return (start + np.arange(self._n, dtype=np.int64)) % self.cap
+
+    def last_ts(self) -> Optional[int]:
+        if self._n == 0:
+            return None
+        return int(self._ts[(self._head - 1) % self.cap])
+
+    def last_bar(self) -> Optional[Bar]:
+        if self._n == 0:
+            return None
+        k = (self._head - 1) % self.cap
+        return (int(self._ts[k]), *(float(x) for x in self._px[k]))  # type: ignore[return-value]
+
+    def upsert(self, ts: int, o: float, h: float, l: float, c: float, v: float) -> Optional[Bar]:
+        ts = int(ts)
+        last = self.last_ts()
+        if last is not None and ts == last:
+            k = (self._head - 1) % self.cap
+            self._px[k] = (o, h, l, c, v)
+            return None
+        if last is not None and ts < last:
+            # update tardivo di una barra già in buffer (es. backfill REST)
+            idx = self._order_idx()
+            i = int(np.searchsorted(self._ts[idx], ts))
+            if i < self._n and int(self._ts[idx[i]]) == ts:
+                self._px[idx[i]] = (o, h, l, c, v)
+            return None
+
+        closed = self.last_bar()
+        self._ts[self._head] = ts
+        self._px[self._head] = (o, h, l, c, v)
+        self._head = (self._head + 1) % self.cap
+        self._n = min(self._n + 1, self.cap)
+        return closed
+
+    def to_batch(self, coin: str = "", tf: str = "") -> CandleBatch:
+        if self._n == 0:
+            return CandleBatch.empty(coin, tf)
+        idx = self._order_idx()
+        px = self._px[idx]
+        return CandleBatch(coin, tf, self._ts[idx].copy(), px[:, 0], px[:, 1], px[:, 2], px[:, 3], px[:, 4])
+
+def _bar_from_msg(d: Dict[str, Any]) -> Bar:
+    return (
+        int(d["t"]),
+        float(d["o"]),
+        float(d["h"]),
+        float(d["l"]),
+        float(d["c"]),
+        float(d.get("v") or 0.0),
+    )
+
+async def _maybe_await(x: Any) -> None:
+    if asyncio.iscoroutine(x) or isinstance(x, asyncio.Future):
+        await x
+
+class HLStreamClient:
+    """
+    Client WebSocket HL per subscription candle (e opzionalmente trades).
+
+    - un CandleRing per (coin, tf)
+    - on_bar_close(coin, tf, bar) appena arriva il primo update della barra successiva
+    - riconnessione con backoff + jitter; a ogni (ri)connessione backfill via
+      _hl_rest_candles_batch delle barre perse, con on_bar_close per quelle chiuse nel frattempo
+    - url puntabile al replay server locale (hl_replay_server.py) per test/benchmark offline
+    """
+
+    def __init__(
+        self,
+        series: List[Tuple[str, str]],
+        *,
+        url: str = HL_WS_URL,
+        trades: Optional[List[str]] = None,
+        ring_bars: int = HL_STREAM_RING_BARS,
+        on_bar_close: Optional[BarCallback] = None,
+        on_trade: Optional[TradeCallback] = None,
+        backfill: bool = True,
+    ) -> None:
+        self.url = url
+        self.series = [(str(c), str(tf).lower()) for c, tf in series]
+        self.trade_coins = list(trades or [])
+        self.rings: Dict[Tuple[str, str], CandleRing] = {k: CandleRing(ring_bars) for k in self.series}
+        self.on_bar_close = on_bar_close
+        self.on_trade = on_trade
+        self.backfill_enabled = bool(backfill)
+
+        self._stop = asyncio.Event()
+        self.connects = 0
+        self.messages = 0
+        self.bars_closed = 0
+        self.close_latency_ms: List[float] = []
+
+    # ----------------------------
+    # subscribe / messaggi
+    # ----------------------------
+    def _subscriptions(self) -> List[Dict[str, Any]]:
+        subs: List[Dict[str, Any]] = [
+            {"method": "subscribe", "subscription": {"type": "candle", "coin": c, "interval": tf}}
+            for c, tf in self.series
+        ]
+        subs += [
+            {"method": "subscribe", "subscription": {"type": "trades", "coin": c}}
+            for c in self.trade_coins
+        ]
+        return subs
+
+    async def _emit_close(self, coin: str, tf: str, bar: Bar) -> None:
+        self.bars_closed += 1
+        if self.on_bar_close is not None:
+            await _maybe_await(self.on_bar_close(coin, tf, bar))
+
+    async def _handle(self, raw: Union[str, bytes]) -> None:
+        self.messages += 1
+        try:
+            msg = json.loads(raw)
+        except Exception:
+            return
+        ch = msg.get("channel")
+        data = msg.get("data")
+
+        if ch == "candle" and isinstance(data, dict):
+            coin = str(data.get("s") or "")
+            tf = str(data.get("i") or "").lower()
+            ring = self.rings.get((coin, tf))
+            if ring is None:
+                return
+            try:
+                bar = _bar_from_msg(data)
+            except Exception:
+                return
+            closed = ring.upsert(*bar)
+            if closed is not None:
+                await self._emit_close(coin, tf, closed)
+                # replay locale: latenza emissione -> fine callback di detection
+                sent_ns = data.get("_replay_sent_ns")
+                if sent_ns is not None:
+                    self.close_latency_ms.append((time.time_ns() - int(sent_ns)) / 1e6)
+            return
+
+        if ch == "trades" and isinstance(data, list) and self.on_trade is not None:
+            for t in data:
+                if isinstance(t, dict):
+                    await _maybe_await(self.on_trade(str(t.get("coin") or ""), t))
+
+    # ----------------------------
+    # backfill REST
+    # ----------------------------
+    async def _backfill_one(self, coin: str, tf: str) -> None:
+        ring = self.rings[(coin, tf)]
+        step = _tf_ms(tf)
+        now_ms = int(time.time() * 1000)
+        last = ring.last_ts()
+        missing = ring.cap if last is None else int((now_ms - last) // step) + 2
+        if missing <= 1:
+            return
+
+        b = await _hl_rest_candles_batch(
+            coin, tf, limit=min(ring.cap, missing), end_ts_ms=now_ms, use_cache=False
+        )
+        # primo caricamento: solo warm-up, niente on_bar_close sullo storico
+        initial = last is None
+        for t, o, h, l, c, v in zip(
+            b.ts.tolist(), b.open.tolist(), b.high.tolist(), b.low.tolist(), b.close.tolist(), b.volume.tolist()
+        ):
+            closed = ring.upsert(t, o, h, l, c, v)
+            if closed is not None and not initial:
+                await self._emit_close(coin, tf, closed)
+
+    async def backfill(self) -> None:
+        if not self.backfill_enabled:
+            return
+        await asyncio.gather(*(self._backfill_one(c, tf) for c, tf in self.series), return_exceptions=True)
+
+    # ----------------------------
+    # loop
+    # ----------------------------
+    async def _heartbeat(self, ws: Any) -> None:
+        while True:
+            await asyncio.sleep(HL_STREAM_PING_SEC)
+            await ws.send(json.dumps({"method": "ping"}))
+
+    async def run(self, *, max_connects: Optional[int] = None) -> None:
+        if websockets is None:
+            raise RuntimeError("pacchetto 'websockets' non installato")
+
+        attempt = 0
+        while not self._stop.is_set():
+            if max_connects is not None and self.connects >= int(max_connects):
+                return
+            hb: Optional[asyncio.Task] = None
+            try:
+                async with websockets.connect(self.url, ping_interval=None, max_size=None) as ws:
+                    self.connects += 1
+                    attempt = 0
+                    for sub in self._subscriptions():
+                        await ws.send(json.dumps(sub))
+                    await self.backfill()
+                    hb = asyncio.ensure_future(self._heartbeat(ws))
+                    async for raw in ws:
+                        await self._handle(raw)
+                        if self._stop.is_set():
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[STREAM] disconnesso: {type(e).__name__}: {e}")
+            finally:
+                if hb is not None:
+                    hb.cancel()
+
+            if self._stop.is_set():
+                return
+            attempt += 1
+            await asyncio.sleep(_backoff_sec(attempt, None))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def batch(self, coin: str, tf: str) -> CandleBatch:
+        ring = self.rings.get((coin, tf.lower()))
+        return ring.to_batch(coin, tf) if ring is not None else CandleBatch.empty(coin, tf)
+
+async def _demo() -> None:
+    """python hl_stream.py  (HYPERLIQUID_WS_URL=ws://127.0.0.1:8765 per il replay locale)"""
+    t0 = time.perf_counter()
+
+    def _on_close(coin: str, tf: str, bar: Bar) -> None:
+        print(f"[CLOSE] {coin} {tf} t={bar[0]} c={bar[4]} (+{time.perf_counter() - t0:.2f}s)")
+
+    cli = HLStreamClient([("PENGU", "1m")], on_bar_close=_on_close)
+    try:
+        await cli.run()
+    finally:
+        if cli.close_latency_ms:
+            lat = np.asarray(cli.close_latency_ms)
+            print(f"[LAT] bar-close p50={np.percentile(lat, 50):.3f}ms p99={np.percentile(lat, 99):.3f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -1,10 +1,25 @@
 # backend/orione/hyper_rest.py
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import asyncio
 import os
+import random
+import time
 import httpx
+import numpy as np
+
+from ohlcv_resample import OHLCV_KEYS
+
+try:
+    import orjson as _fastjson  # decoder più veloce se installato
+except Exception:
+    _fastjson = None
 
 def _env_str(name: str, default: str) -> str:
     v = (os.getenv(name, default) or default).strip()
@@ -13,6 +28,107 @@ def _env_str(name: str, default: str) -> str:
 HL_REST_URL = _env_str("HYPERLIQUID_REST_URL", "https://api.hyperliquid.xyz")
 HL_REST_URL = HL_REST_URL.rstrip("/")
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name, str(default)) or str(default)).strip())
+    except Exception:
+        return default
+
+# pool HTTP condiviso (keep-alive): evita un handshake TCP+TLS per ogni richiesta
+HL_HTTP_MAX_CONN = _env_int("HL_HTTP_MAX_CONN", 20)
+HL_HTTP_MAX_KEEPALIVE = _env_int("HL_HTTP_MAX_KEEPALIVE", 10)
+HL_HTTP_TIMEOUT_SEC = 6.0
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """Client condiviso a livello di modulo, creato al primo uso."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HL_HTTP_TIMEOUT_SEC),
+            limits=httpx.Limits(
+                max_connections=HL_HTTP_MAX_CONN,
+                max_keepalive_connections=HL_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=30.0,
+            ),
+        )
+    return _client
+
+async def aclose_client() -> None:
+    """Chiude il client condiviso (da chiamare a fine script / nel lifespan dell'app)."""
+    global _client
+    c, _client = _client, None
+    if c is not None and not c.is_closed:
+        await c.aclose()
+
+@asynccontextmanager
+async def client_lifespan() -> AsyncIterator[httpx.AsyncClient]:
+    """async with client_lifespan() as c: ... -> chiude il pool all'uscita."""
+    try:
+        yield get_client()
+    finally:
+        await aclose_client()
+
+# ----------------------------
+# Rate limit (token bucket sul "weight" HL)
+# Doc HL: 1200 weight/min per IP; candleSnapshot = 20 + 1 ogni 60 candle restituite.
+# ----------------------------
+HL_RATE_WEIGHT_PER_MIN = _env_int("HL_RATE_WEIGHT_PER_MIN", 1200)
+HL_CANDLE_BASE_WEIGHT = 20
+HL_CANDLE_ITEMS_PER_WEIGHT = 60
+
+class TokenBucket:
+    """
+    Token bucket asyncio condiviso tra più task.
+    acquire(w) attende finché ci sono w token; charge(w) addebita a posteriori
+    (il saldo può andare in negativo e rallenta i prossimi acquire).
+    """
+
+    def __init__(self, *, rate_per_sec: float, capacity: float) -> None:
+        self.rate = float(rate_per_sec)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_sec = 0.0
+
+    @classmethod
+    def per_minute(cls, weight_per_min: float, *, safety: float = 0.9) -> "TokenBucket":
+        w = max(1.0, float(weight_per_min) * float(safety))
+        # burst = 1/6 del budget al minuto: evita di bruciare tutto il minuto all'avvio
+        return cls(rate_per_sec=w / 60.0, capacity=max(float(HL_CANDLE_BASE_WEIGHT), w / 6.0))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, weight: float = 1.0) -> None:
+        w = min(float(weight), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= w:
+                    self.tokens -= w
+                    return
+                wait = (w - self.tokens) / self.rate
+                self.waited_sec += wait
+                await asyncio.sleep(wait)
+
+    def charge(self, weight: float) -> None:
+        self._refill()
+        self.tokens -= float(weight)
+
+    def pause(self, sec: float) -> None:
+        """Blocca tutti i task per ~sec (es. dopo un 429)."""
+        self._refill()
+        self.tokens = min(self.tokens, -float(sec) * self.rate)
+
+def hl_limiter(weight_per_min: Optional[int] = None) -> TokenBucket:
+    """Limiter dimensionato sul budget HL (env HL_RATE_WEIGHT_PER_MIN)."""
+    return TokenBucket.per_minute(weight_per_min or HL_RATE_WEIGHT_PER_MIN)
+
 def _tf_ms(tf: str) -> int:
     t = (tf or "").strip().lower()
     try:
@@ -26,43 +142,194 @@ def _tf_ms(tf: str) -> int:
         pass
     return 60_000
 
-async def _hl_rest_candles_rows(
-    coin_key: str,
-    tf: str,
-    *,
-    limit: int,
-    end_ts_ms: int,
-) -> List[Dict[str, Any]]:
-    tf = (tf or "").strip().lower()
-    if tf not in ("1m", "3m", "5m", "15m", "1h", "4h", "1d"):
-        return []
+# ----------------------------
+# Batch colonnare (niente dict per riga)
+# ----------------------------
+@dataclass
+class CandleBatch:
+    """
+    Candle in colonne numpy (ts int64 ms, OHLCV float64), ordinate per ts e uniche.
+    columns() va dritto in CandleStore.write / ohlcv_resample; to_df() ai detector.
+    """
 
-    tfms = _tf_ms(tf)
-    end_ms = int(end_ts_ms)
-    start_ms = end_ms - int(max(int(limit), 10) * tfms * 2)
+    coin: str
+    tf: str
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
 
-    payload = {
-        "type": "candleSnapshot",
-        "req": {
-            "coin": str(coin_key),
-            "interval": tf,
-            "startTime": int(start_ms),
-            "endTime": int(end_ms),
-        },
-    }
+    def __len__(self) -> int:
+        return int(self.ts.shape[0])
+
+    @classmethod
+    def empty(cls, coin: str = "", tf: str = "") -> "CandleBatch":
+        f = np.zeros(0, dtype=np.float64)
+        return cls(coin, tf, np.zeros(0, dtype=np.int64), f, f, f, f, f)
+
+    @classmethod
+    def from_columns(cls, coin: str, tf: str, cols: Dict[str, Any]) -> "CandleBatch":
+        """Da dict OHLCV_KEYS; ordina e deduplica (keep last) in modo vettoriale."""
+        ts = np.asarray(cols["ts"], dtype=np.int64)
+        arrs = [np.asarray(cols[k], dtype=np.float64) for k in OHLCV_KEYS[1:]]
+        if ts.shape[0] > 1 and not bool(np.all(ts[1:] > ts[:-1])):
+            order = np.argsort(ts, kind="stable")
+            ts = ts[order]
+            arrs = [a[order] for a in arrs]
+            keep = np.r_[ts[1:] != ts[:-1], True]
+            ts = ts[keep]
+            arrs = [a[keep] for a in arrs]
+        return cls(coin, tf, ts, *arrs)
+
+    @classmethod
+    def concat(cls, batches: List["CandleBatch"], *, coin: str = "", tf: str = "") -> "CandleBatch":
+        bs = [b for b in batches if len(b)]
+        if not bs:
+            return cls.empty(coin, tf)
+        if len(bs) == 1:
+            return bs[0]
+        cols = {k: np.concatenate([getattr(b, k) for b in bs]) for k in OHLCV_KEYS}
+        return cls.from_columns(coin or bs[0].coin, tf or bs[0].tf, cols)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {k: getattr(self, k) for k in OHLCV_KEYS}
+
+    def slice_ts(self, start_ms: int, end_ms: int) -> "CandleBatch":
+        i0 = int(np.searchsorted(self.ts, int(start_ms), side="left"))
+        i1 = int(np.searchsorted(self.ts, int(end_ms), side="right"))
+        return CandleBatch(self.coin, self.tf, *(getattr(self, k)[i0:i1] for k in OHLCV_KEYS))
 
+    def tail(self, n: int) -> "CandleBatch":
+        if len(self) <= int(n):
+            return self
+        return CandleBatch(self.coin, self.tf, *(getattr(self, k)[-int(n):] for k in OHLCV_KEYS))
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Formato legacy di _hl_rest_candles_rows."""
+        return [
+            {"timestamp": int(t), "open": float(o), "high": float(h), "low": float(l), "close": float(c), "volume": float(v)}
+            for t, o, h, l, c, v in zip(
+                self.ts.tolist(), self.open.tolist(), self.high.tolist(),
+                self.low.tolist(), self.close.tolist(), self.volume.tolist(),
+            )
+        ]
+
+    def to_df(self):
+        import pandas as pd
+
+        return pd.DataFrame({
+            "timestamp": self.ts,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+        })
+
+def _parse_candle_batch(arr: List[Any], *, coin: str, tf: str, limit: int) -> CandleBatch:
+    """
+    Una passata sulla lista JSON HL ({"t","o","h","l","c","v",...}, prezzi come stringhe):
+    numpy converte direttamente str -> float64. Se il formato non è quello compatto
+    (chiavi lunghe / righe sporche) ripiega sul parser per-riga.
+    """
+    if not arr:
+        return CandleBatch.empty(coin, tf)
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(6.0)) as c:
-            r = await c.post(f"{HL_REST_URL}/info", json=payload)
-            if r.status_code < 200 or r.status_code >= 300:
-                return []
-            arr = r.json()
+        ts = np.fromiter((x["t"] for x in arr), dtype=np.int64, count=len(arr))
+        px = np.array([(x["o"], x["h"], x["l"], x["c"], x.get("v") or 0.0) for x in arr], dtype=np.float64)
+        b = CandleBatch.from_columns(coin, tf, {
+            "ts": ts,
+            "open": px[:, 0],
+            "high": px[:, 1],
+            "low": px[:, 2],
+            "close": px[:, 3],
+            "volume": px[:, 4],
+        })
     except Exception:
-        return []
+        rows = _parse_candle_rows(arr, limit)
+        if not rows:
+            return CandleBatch.empty(coin, tf)
+        b = CandleBatch.from_columns(coin, tf, {
+            "ts": [r["timestamp"] for r in rows],
+            "open": [r["open"] for r in rows],
+            "high": [r["high"] for r in rows],
+            "low": [r["low"] for r in rows],
+            "close": [r["close"] for r in rows],
+            "volume": [r["volume"] for r in rows],
+        })
+    return b.tail(int(limit))
 
-    if not isinstance(arr, list) or not arr:
-        return []
+def _decode_json(r: httpx.Response) -> Any:
+    if _fastjson is not None:
+        return _fastjson.loads(r.content)
+    return r.json()
+
+# ----------------------------
+# Esito tipizzato + retry
+# ----------------------------
+HL_MAX_RETRIES = _env_int("HL_MAX_RETRIES", 3)
+HL_BACKOFF_BASE_SEC = 0.5
+HL_BACKOFF_MAX_SEC = 20.0
+
+CANDLES_OK = "ok"                      # righe presenti
+CANDLES_EMPTY = "empty"                # risposta valida ma vuota -> fine dati
+CANDLES_RATE_LIMITED = "rate_limited"  # 429 -> riprovare più tardi
+CANDLES_ERROR = "error"                # timeout / rete / 5xx -> riprovare
+CANDLES_INVALID = "invalid"            # tf non supportato / 4xx -> inutile riprovare
 
+class HLCandlesError(RuntimeError):
+    """Fetch fallito dopo i retry (distinto da "nessun dato")."""
+
+    def __init__(self, result: "CandlesResult") -> None:
+        super().__init__(
+            f"candleSnapshot {result.status} http={result.http_status} "
+            f"attempts={result.attempts} {result.error}".strip()
+        )
+        self.result = result
+
+@dataclass
+class CandlesResult:
+    status: str
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    batch: Optional[CandleBatch] = None
+    http_status: Optional[int] = None
+    retry_after_sec: Optional[float] = None
+    attempts: int = 1
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status == CANDLES_OK
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in (CANDLES_RATE_LIMITED, CANDLES_ERROR)
+
+def _parse_retry_after(v: Optional[str]) -> Optional[float]:
+    if not v:
+        return None
+    v = v.strip()
+    try:
+        return max(0.0, float(v))
+    except Exception:
+        pass
+    try:
+        dt = parsedate_to_datetime(v)
+        return max(0.0, dt.timestamp() - time.time())
+    except Exception:
+        return None
+
+def _backoff_sec(attempt: int, retry_after: Optional[float]) -> float:
+    # exponential backoff con full jitter; Retry-After fa da minimo
+    cap = min(HL_BACKOFF_MAX_SEC, HL_BACKOFF_BASE_SEC * (2 ** max(0, attempt - 1)))
+    wait = random.uniform(0.0, cap)
+    if retry_after is not None:
+        wait = max(wait, min(float(retry_after), HL_BACKOFF_MAX_SEC * 3))
+    return wait
+
+def _parse_candle_rows(arr: List[Any], limit: int) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
     for x in arr:
         if not isinstance(x, dict):
@@ -100,4 +367,370 @@ async def _hl_rest_candles_rows(
     if len(ded) > int(limit):
         ded = ded[-int(limit) :]
 
-    return ded
\ No newline at end of file
+    return ded
+
+async def _hl_rest_candles_once(
+    c: httpx.AsyncClient,
+    payload: Dict[str, Any],
+    *,
+    limit: int,
+    limiter: Optional[TokenBucket],
+    columnar: bool = False,
+) -> CandlesResult:
+    if limiter is not None:
+        await limiter.acquire(HL_CANDLE_BASE_WEIGHT)
+    try:
+        r = await c.post(f"{HL_REST_URL}/info", json=payload)
+    except Exception as e:
+        # timeout / connessione / protocollo: transitorio
+        return CandlesResult(CANDLES_ERROR, error=f"{type(e).__name__}: {e}")
+
+    if r.status_code == 429:
+        ra = _parse_retry_after(r.headers.get("Retry-After"))
+        if limiter is not None:
+            # senza Retry-After: equal jitter, mai sotto HL_BACKOFF_BASE_SEC (full jitter può dare ~0s)
+            limiter.pause(ra if ra is not None else HL_BACKOFF_BASE_SEC + random.uniform(0.0, HL_BACKOFF_BASE_SEC))
+        return CandlesResult(CANDLES_RATE_LIMITED, http_status=429, retry_after_sec=ra)
+    if r.status_code >= 500 or r.status_code in (408, 425):
+        ra = _parse_retry_after(r.headers.get("Retry-After"))
+        return CandlesResult(CANDLES_ERROR, http_status=r.status_code, retry_after_sec=ra)
+    if r.status_code < 200 or r.status_code >= 300:
+        return CandlesResult(CANDLES_INVALID, http_status=r.status_code, error=r.text[:200])
+
+    try:
+        arr = _decode_json(r)
+    except Exception as e:
+        return CandlesResult(CANDLES_ERROR, http_status=r.status_code, error=f"bad json: {e}")
+
+    if limiter is not None and isinstance(arr, list):
+        limiter.charge(len(arr) // HL_CANDLE_ITEMS_PER_WEIGHT)
+
+    if not isinstance(arr, list):
+        return CandlesResult(CANDLES_INVALID, http_status=r.status_code, error="risposta non-lista")
+
+    req = payload.get("req") or {}
+    if not arr:
+        empty = CandleBatch.empty(str(req.get("coin") or ""), str(req.get("interval") or "")) if columnar else None
+        return CandlesResult(CANDLES_EMPTY, batch=empty, http_status=r.status_code)
+
+    # lista non vuota ma nessuna riga valida: pagina rotta, non "fine dati"
+    if columnar:
+        b = _parse_candle_batch(arr, coin=str(req.get("coin") or ""), tf=str(req.get("interval") or ""), limit=limit)
+        if not len(b):
+            return CandlesResult(CANDLES_ERROR, http_status=r.status_code, error=f"parse: 0/{len(arr)} righe valide")
+        return CandlesResult(CANDLES_OK, batch=b, http_status=r.status_code)
+
+    rows = _parse_candle_rows(arr, limit)
+    if not rows:
+        return CandlesResult(CANDLES_ERROR, http_status=r.status_code, error=f"parse: 0/{len(arr)} righe valide")
+    return CandlesResult(CANDLES_OK, rows=rows, http_status=r.status_code)
+
+async def _hl_rest_candles_fetch(
+    coin_key: str,
+    tf: str,
+    *,
+    limit: int,
+    end_ts_ms: int,
+    client: Optional[httpx.AsyncClient] = None,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: Optional[int] = None,
+    start_ts_ms: Optional[int] = None,
+    columnar: bool = False,
+) -> CandlesResult:
+    """
+    Come _hl_rest_candles_rows ma con esito tipizzato (ok / empty / rate_limited /
+    error / invalid) e retry con backoff esponenziale + jitter su 429, timeout e 5xx.
+    Con start_ts_ms la finestra è esatta [start_ts_ms, end_ts_ms] (niente over-fetch 2x).
+    Con columnar=True il risultato è in .batch (CandleBatch) invece di .rows.
+    """
+    tf = (tf or "").strip().lower()
+    if tf not in ("1m", "3m", "5m", "15m", "1h", "4h", "1d"):
+        return CandlesResult(CANDLES_INVALID, error=f"tf non supportato: {tf}")
+
+    tfms = _tf_ms(tf)
+    end_ms = int(end_ts_ms)
+    if start_ts_ms is not None:
+        start_ms = int(start_ts_ms)
+    else:
+        start_ms = end_ms - int(max(int(limit), 10) * tfms * 2)
+
+    payload = {
+        "type": "candleSnapshot",
+        "req": {
+            "coin": str(coin_key),
+            "interval": tf,
+            "startTime": int(start_ms),
+            "endTime": int(end_ms),
+        },
+    }
+
+    c = client if client is not None else get_client()
+    retries = HL_MAX_RETRIES if max_retries is None else max(0, int(max_retries))
+
+    attempt = 0
+    while True:
+        attempt += 1
+        res = await _hl_rest_candles_once(c, payload, limit=int(limit), limiter=limiter, columnar=columnar)
+        res.attempts = attempt
+        if not res.retryable or attempt > retries:
+            return res
+        await asyncio.sleep(_backoff_sec(attempt, res.retry_after_sec))
+
+# ----------------------------
+# Cache TTL a barra chiusa + single-flight
+# ----------------------------
+HL_CANDLE_CACHE_MAX = _env_int("HL_CANDLE_CACHE_MAX", 512)
+
+@dataclass
+class _CacheEntry:
+    batch: CandleBatch
+    limit: int
+    expires_ms: int
+
+class CandleCache:
+    """
+    Cache in-process per (coin, tf, confine ultima barra chiusa).
+    - contiene solo barre chiuse (ts < confine): la barra in formazione non viene mai
+      servita dalla cache, su ogni hit è riscaricata (fetch_forming) e appesa in coda
+    - l'entry scade quando chiude la barra successiva
+    - tiene il limit più grande scaricato: limit più piccoli sono slice (tail)
+    - richieste identiche concorrenti condividono un solo fetch in volo (single-flight)
+    - LRU con max_entries; contatori hits / misses / coalesced
+    """
+
+    def __init__(self, max_entries: int = HL_CANDLE_CACHE_MAX) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[Tuple[str, str, int], _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, int], "asyncio.Task[CandlesResult]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def bar_key(coin: str, tf: str, now_ms: int) -> Tuple[Tuple[str, str, int], int]:
+        step = _tf_ms(tf)
+        boundary = int(now_ms) - (int(now_ms) % step)
+        return (str(coin), str(tf), boundary), boundary + step
+
+    def _get(self, key: Tuple[str, str, int], limit: int, now_ms: int) -> Optional[CandleBatch]:
+        e = self._data.get(key)
+        if e is None:
+            return None
+        if now_ms >= e.expires_ms:
+            self._data.pop(key, None)
+            return None
+        if e.limit < int(limit):
+            return None
+        self._data.move_to_end(key)
+        return e.batch.tail(int(limit))
+
+    def _put(self, key: Tuple[str, str, int], batch: CandleBatch, limit: int, expires_ms: int) -> None:
+        old = self._data.get(key)
+        if old is not None and old.limit >= int(limit):
+            return
+        self._data[key] = _CacheEntry(batch=batch, limit=int(limit), expires_ms=int(expires_ms))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get_batch(
+        self,
+        coin_key: str,
+        tf: str,
+        *,
+        limit: int,
+        fetch,
+        fetch_forming,
+    ) -> CandlesResult:
+        """
+        fetch: coroutine factory () -> CandlesResult (columnar) usata solo sui miss.
+        fetch_forming: coroutine factory (boundary_ms) -> CandlesResult (columnar) con la
+        sola barra in formazione, chiamata a ogni hit.
+        """
+        now_ms = int(time.time() * 1000)
+        key, expires_ms = self.bar_key(coin_key, tf, now_ms)
+        boundary = key[2]
+
+        b = self._get(key, limit, now_ms)
+        if b is not None:
+            self.hits += 1
+            return await self._with_forming(b, boundary, limit, fetch_forming)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            res = await asyncio.shield(task)
+            b = self._get(key, limit, int(time.time() * 1000))
+            if b is not None:
+                return await self._with_forming(b, boundary, limit, fetch_forming)
+            if res.ok and res.batch is not None and len(res.batch) >= int(limit):
+                return CandlesResult(CANDLES_OK, batch=res.batch.tail(int(limit)), attempts=0)
+            # il fetch condiviso aveva un limit più piccolo: ne serve uno nostro
+
+        self.misses += 1
+        task = asyncio.ensure_future(fetch())
+        self._inflight[key] = task
+        try:
+            res = await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key) is task:
+                self._inflight.pop(key, None)
+
+        if res.ok and res.batch is not None:
+            # in cache solo le chiuse; la risposta di questo miss è già fresca
+            self._put(key, res.batch.slice_ts(-(2 ** 62), boundary - 1), limit, expires_ms)
+            return CandlesResult(res.status, batch=res.batch.tail(int(limit)), http_status=res.http_status, attempts=res.attempts)
+        return res
+
+    @staticmethod
+    async def _with_forming(closed: CandleBatch, boundary: int, limit: int, fetch_forming) -> CandlesResult:
+        res = await fetch_forming(boundary)
+        if res.status == CANDLES_EMPTY:
+            # nessun trade ancora nella barra corrente
+            return CandlesResult(CANDLES_OK, batch=closed.tail(int(limit)), attempts=res.attempts)
+        if not res.ok or res.batch is None:
+            return res
+        forming = res.batch.slice_ts(boundary, 2 ** 62)
+        b = CandleBatch.concat([closed, forming], coin=closed.coin, tf=closed.tf)
+        return CandlesResult(CANDLES_OK, batch=b.tail(int(limit)), http_status=res.http_status, attempts=res.attempts)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        tot = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / tot, 4) if tot else 0.0,
+        }
+
+candle_cache = CandleCache()
+
+def _is_live_request(tf: str, end_ts_ms: int) -> bool:
+    """Solo le richieste che arrivano alla barra corrente sono cacheabili per barra."""
+    step = _tf_ms(tf)
+    now_ms = int(time.time() * 1000)
+    return int(end_ts_ms) >= now_ms - (now_ms % step)
+
+async def _hl_rest_candles_cached(
+    coin_key: str,
+    tf: str,
+    *,
+    limit: int,
+    end_ts_ms: int,
+    client: Optional[httpx.AsyncClient],
+    limiter: Optional[TokenBucket],
+    max_retries: Optional[int],
+) -> CandlesResult:
+    tf = (tf or "").strip().lower()
+
+    def _fetch():
+        return _hl_rest_candles_fetch(
+            coin_key,
+            tf,
+            limit=limit,
+            end_ts_ms=end_ts_ms,
+            client=client,
+            limiter=limiter,
+            max_retries=max_retries,
+            columnar=True,
+        )
+
+    def _fetch_forming(boundary_ms: int):
+        return _hl_rest_candles_fetch(
+            coin_key,
+            tf,
+            limit=1,
+            start_ts_ms=boundary_ms,
+            end_ts_ms=end_ts_ms,
+            client=client,
+            limiter=limiter,
+            max_retries=max_retries,
+            columnar=True,
+        )
+
+    if not _is_live_request(tf, end_ts_ms):
+        return await _fetch()
+    return await candle_cache.get_batch(
+        str(coin_key), tf, limit=int(limit), fetch=_fetch, fetch_forming=_fetch_forming
+    )
+
+async def _hl_rest_candles_rows(
+    coin_key: str,
+    tf: str,
+    *,
+    limit: int,
+    end_ts_ms: int,
+    client: Optional[httpx.AsyncClient] = None,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: Optional[int] = None,
+    use_cache: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Candle come lista di dict. use_cache=True (opt-in) passa da candle_cache: barre
+    chiuse dalla cache + barra in formazione sempre riscaricata.
+    """
+    if use_cache:
+        res = await _hl_rest_candles_cached(
+            coin_key,
+            tf,
+            limit=limit,
+            end_ts_ms=end_ts_ms,
+            client=client,
+            limiter=limiter,
+            max_retries=max_retries,
+        )
+        return res.batch.to_rows() if res.batch is not None else []
+
+    res = await _hl_rest_candles_fetch(
+        coin_key,
+        tf,
+        limit=limit,
+        end_ts_ms=end_ts_ms,
+        client=client,
+        limiter=limiter,
+        max_retries=max_retries,
+    )
+    return res.rows
+
+async def _hl_rest_candles_batch(
+    coin_key: str,
+    tf: str,
+    *,
+    limit: int,
+    end_ts_ms: int,
+    client: Optional[httpx.AsyncClient] = None,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: Optional[int] = None,
+    use_cache: bool = False,
+) -> CandleBatch:
+    """Variante colonnare di _hl_rest_candles_rows (batch vuoto se non ok)."""
+    if use_cache:
+        res = await _hl_rest_candles_cached(
+            coin_key,
+            tf,
+            limit=limit,
+            end_ts_ms=end_ts_ms,
+            client=client,
+            limiter=limiter,
+            max_retries=max_retries,
+        )
+    else:
+        res = await _hl_rest_candles_fetch(
+            coin_key,
+            tf,
+            limit=limit,
+            end_ts_ms=end_ts_ms,
+            client=client,
+            limiter=limiter,
+            max_retries=max_retries,
+            columnar=True,
+        )
+    return res.batch if res.batch is not None else CandleBatch.empty(str(coin_key), tf)
@@ -0,0 +1,368 @@
+# backend/orione/live_scanner.py
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from hl_stream import Bar, HLStreamClient, _maybe_await
+from hyper_rest import _env_int, _env_str, _tf_ms, aclose_client
+from patterns import RAW_CONF_BASE, detect_pattern_indices
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+# file di checkpoint (npz: finestre barre + stato json)
+LIVE_CHECKPOINT_PATH = _env_str("LIVE_CHECKPOINT_PATH", "live_state/scanner.npz")
+
+# ogni quanto salvare (secondi, solo su chiusura barra)
+LIVE_CHECKPOINT_EVERY_SEC = _env_int("LIVE_CHECKPOINT_EVERY_SEC", 60)
+
+# barre di finestra passate ai detector
+LIVE_WINDOW_BARS = _env_int("LIVE_WINDOW_BARS", 1000)
+
+# barre di silenzio per lo stesso pattern dopo un'emissione (0 = solo dedup per barra)
+LIVE_COOLDOWN_BARS = _env_int("LIVE_COOLDOWN_BARS", 3)
+
+CHECKPOINT_VERSION = 2
+
+EMA_SPANS = (9, 21, 50)
+RSI_LEN = 14
+
+HitCallback = Callable[[str, str, Dict[str, Any]], Union[None, Awaitable[None]]]
+
+@dataclass
+class IndicatorState:
+    """EMA/RSI (Wilder) aggiornati barra per barra: contesto O(1) allegato alle hit."""
+
+    ema: Dict[str, float] = field(default_factory=dict)
+    rsi_avg_gain: Optional[float] = None
+    rsi_avg_loss: Optional[float] = None
+    rsi_seed: List[float] = field(default_factory=list)
+    prev_close: Optional[float] = None
+
+    def update(self, close: float) -> None:
+        for span in EMA_SPANS:
+            k = str(span)
+            a = 2.0 / (span + 1.0)
+            prev = self.ema.get(k)
+            self.ema[k] = close if prev is None else prev + a * (close - prev)
+
+        if self.prev_close is not None:
+            ch = close - self.prev_close
+            g, l = max(ch, 0.0), max(-ch, 0.0)
+            if self.rsi_avg_gain is None or self.rsi_avg_loss is None:
+                self.rsi_seed.append(ch)
+                if len(self.rsi_seed) >= RSI_LEN:
+                    s = np.asarray(self.rsi_seed, dtype=np.float64)
+                    self.rsi_avg_gain = float(np.clip(s, 0, None).mean())
+                    self.rsi_avg_loss = float(np.clip(-s, 0, None).mean())
+                    self.rsi_seed = []
+            else:
+                self.rsi_avg_gain = (self.rsi_avg_gain * (RSI_LEN - 1) + g) / RSI_LEN
+                self.rsi_avg_loss = (self.rsi_avg_loss * (RSI_LEN - 1) + l) / RSI_LEN
+        self.prev_close = close
+
+    def rsi(self) -> Optional[float]:
+        if self.rsi_avg_gain is None or self.rsi_avg_loss is None:
+            return None
+        if self.rsi_avg_loss == 0:
+            return 100.0
+        rs = self.rsi_avg_gain / self.rsi_avg_loss
+        return 100.0 - 100.0 / (1.0 + rs)
+
+@dataclass
+class SeriesState:
+    """Stato di detection per (coin, tf) oltre alle barre: cosa è già stato emesso e cosa attende conferma."""
+
+    last_ts: Optional[int] = None                               # ultima barra chiusa ricevuta
+    emitted: Dict[str, int] = field(default_factory=dict)       # pattern -> ts ultima emissione
+    cooldown: Dict[str, int] = field(default_factory=dict)      # pattern -> silenzio fino a questo ts (incluso)
+    pending: List[Dict[str, Any]] = field(default_factory=list) # raw (ts, direzione, high/low) in attesa della barra di conferma
+    ind: IndicatorState = field(default_factory=IndicatorState)
+
+class LiveScanner:
+    """
+    Detection live su HLStreamClient con checkpoint periodico.
+
+    - a ogni barra chiusa (nel loop, O(1)): aggiorna EMA/RSI, risolve le raw in
+      pending contro la barra appena chiusa (conferma A: close oltre high/low della
+      raw -> <pattern>_confirmed) e accoda la barra al worker della serie
+    - il worker lancia detect_pattern_indices nel thread pool (run_in_executor) e
+      notifica le hit sull'ultima barra non già emesse e fuori cooldown
+    - in catch-up (backfill dopo un riavvio) il worker valuta solo la barra più
+      recente in coda: indicatori e pending avanzano comunque barra per barra
+    - checkpoint (atomico) di ring + SeriesState ogni LIVE_CHECKPOINT_EVERY_SEC
+    - al riavvio restore() ripopola i ring: il backfill del client scarica solo
+      le barre successive all'ultima salvata
+    """
+
+    def __init__(
+        self,
+        series: List[Tuple[str, str]],
+        *,
+        patterns: Optional[Sequence[str]] = None,
+        window_bars: int = LIVE_WINDOW_BARS,
+        cooldown_bars: int = LIVE_COOLDOWN_BARS,
+        checkpoint_path: Union[str, Path, None] = LIVE_CHECKPOINT_PATH,
+        checkpoint_every_sec: float = LIVE_CHECKPOINT_EVERY_SEC,
+        on_hit: Optional[HitCallback] = None,
+        **client_kw: Any,
+    ) -> None:
+        self.patterns = list(patterns) if patterns else None
+        self.window_bars = max(50, int(window_bars))
+        self.cooldown_bars = max(0, int(cooldown_bars))
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.checkpoint_every_sec = float(checkpoint_every_sec)
+        self.on_hit = on_hit
+
+        self.client = HLStreamClient(
+            series, ring_bars=self.window_bars, on_bar_close=self._on_bar_close, **client_kw
+        )
+        self.states: Dict[Tuple[str, str], SeriesState] = {k: SeriesState() for k in self.client.series}
+        self._last_checkpoint = time.monotonic()
+        self.hits_emitted = 0
+        self.bars_detected = 0
+        self.bars_skipped = 0   # barre di catch-up non passate ai detector
+
+        # coda per serie: ultima barra chiusa da valutare + ctx indicatori a quella barra
+        self._latest: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+        self._queued: Dict[Tuple[str, str], int] = {}
+        self._wake: Dict[Tuple[str, str], asyncio.Event] = {}
+        self._workers: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    # ----------------------------
+    # detection
+    # ----------------------------
+    def _window_df(self, coin: str, tf: str, closed_ts: int):
+        # il ring ha già la barra appena aperta: la finestra si ferma alla barra chiusa
+        b = self.client.rings[(coin, tf)].to_batch(coin, tf)
+        b = b.slice_ts(int(b.ts[0]), closed_ts) if len(b) else b
+        return b.to_df()
+
+    def _can_emit(self, st: SeriesState, pat: str, ts: int) -> bool:
+        return st.emitted.get(pat) != ts and st.cooldown.get(pat, -1) < ts
+
+    def _mark_emitted(self, st: SeriesState, tf: str, pat: str, ts: int) -> None:
+        st.emitted[pat] = ts
+        if self.cooldown_bars:
+            st.cooldown[pat] = ts + self.cooldown_bars * _tf_ms(tf)
+
+    def _confirm(self, st: SeriesState, tf: str, p: Dict[str, Any], ts: int, close: float,
+                 ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Conferma A di una raw in pending sulla barra successiva (stessa regola di patterns._confirm_A)."""
+        d = str(p.get("direction") or "").upper()
+        ok = (d == "BULL" and close > float(p["high"])) or (d == "BEAR" and close < float(p["low"]))
+        pat = f"{p['pattern']}_confirmed"
+        if not ok or not self._can_emit(st, pat, ts):
+            return None
+        self._mark_emitted(st, tf, pat, ts)
+        return {"pattern": pat, "direction": p.get("direction"), "ts": ts, "raw_ts": int(p["ts"]), "ctx": ctx}
+
+    def _apply(self, coin: str, tf: str, st: SeriesState, df, ts: int, ctx: Dict[str, Any],
+               hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filtra le hit dei detector sull'ultima barra (nel loop: qui si tocca lo stato)."""
+        last_idx = len(df) - 1
+        out: List[Dict[str, Any]] = []
+        raws: List[Dict[str, Any]] = []
+        for h in hits:
+            if int(h.get("index", -1)) != last_idx:
+                continue
+            pat = str(h.get("pattern") or h.get("name") or "").lower()
+            base = pat[: -len("_raw")] if pat.endswith("_raw") else None
+            if pat.endswith("_confirmed") and pat[: -len("_confirmed")] in RAW_CONF_BASE:
+                continue  # le conferme arrivano da st.pending, non dal rescan
+            if base in RAW_CONF_BASE:
+                raws.append({
+                    "pattern": base,
+                    "ts": ts,
+                    "direction": h.get("direction"),
+                    "high": float(df["high"].iloc[last_idx]),
+                    "low": float(df["low"].iloc[last_idx]),
+                })
+            if not self._can_emit(st, pat, ts):
+                continue
+            self._mark_emitted(st, tf, pat, ts)
+            hit = dict(h)
+            hit["pattern"] = pat
+            hit["ts"] = ts
+            hit["ctx"] = ctx
+            out.append(hit)
+
+        if st.last_ts == ts:
+            st.pending = raws
+        else:
+            # la barra di conferma è già chiusa (worker in ritardo): risolvi subito dal ring
+            b = self.client.rings[(coin, tf)].to_batch(coin, tf)
+            k = int(np.searchsorted(b.ts, ts, side="right"))
+            if k < len(b) and int(b.ts[k]) <= int(st.last_ts or 0):
+                nts = int(b.ts[k])
+                for p in raws:
+                    c = self._confirm(st, tf, p, nts, float(b.close[k]), ctx)
+                    if c is not None:
+                        out.append(c)
+        return out
+
+    async def _emit(self, coin: str, tf: str, hits: List[Dict[str, Any]]) -> None:
+        for h in hits:
+            self.hits_emitted += 1
+            if self.on_hit is not None:
+                await _maybe_await(self.on_hit(coin, tf, h))
+
+    async def _worker(self, coin: str, tf: str) -> None:
+        key = (coin, tf)
+        ev = self._wake[key]
+        loop = asyncio.get_running_loop()
+        while True:
+            await ev.wait()
+            ev.clear()
+            ts, ctx = self._latest[key]
+            self.bars_skipped += max(0, self._queued.pop(key, 1) - 1)
+            st = self.states[key]
+            try:
+                df = self._window_df(coin, tf, ts)
+                if df.empty:
+                    continue
+                hits = await loop.run_in_executor(
+                    None, functools.partial(detect_pattern_indices, df, self.patterns, tf, coin=coin)
+                )
+                self.bars_detected += 1
+                await self._emit(coin, tf, self._apply(coin, tf, st, df, ts, ctx, hits))
+            except Exception as e:
+                print(f"[LIVE] detection {coin} {tf} fallita: {type(e).__name__}: {e}")
+
+    async def _on_bar_close(self, coin: str, tf: str, bar: Bar) -> None:
+        key = (coin, tf)
+        st = self.states.get(key)
+        if st is None:
+            return
+        ts = int(bar[0])
+        if st.last_ts is not None and ts <= st.last_ts:
+            return  # già valutata prima del checkpoint
+        if st.ind.prev_close is None:
+            # primo close dopo il warm-up: semina EMA/RSI con lo storico del ring
+            b = self.client.rings[key].to_batch(coin, tf)
+            for c in b.close[b.ts < ts].tolist():
+                st.ind.update(float(c))
+        st.ind.update(float(bar[4]))
+        st.last_ts = ts
+        st.cooldown = {p: t for p, t in st.cooldown.items() if t >= ts}
+        ctx = {"ema": dict(st.ind.ema), "rsi": st.ind.rsi()}
+
+        # raw della barra precedente: confermate o scadute su questa
+        confirmed = [c for c in (self._confirm(st, tf, p, ts, float(bar[4]), ctx) for p in st.pending) if c is not None]
+        st.pending = []
+        await self._emit(coin, tf, confirmed)
+
+        self._latest[key] = (ts, ctx)
+        self._queued[key] = self._queued.get(key, 0) + 1
+        if key not in self._wake:
+            self._wake[key] = asyncio.Event()
+        task = self._workers.get(key)
+        if task is None or task.done():
+            self._workers[key] = asyncio.ensure_future(self._worker(coin, tf))
+        self._wake[key].set()
+
+        if self.checkpoint_path is not None and time.monotonic() - self._last_checkpoint >= self.checkpoint_every_sec:
+            self.checkpoint()
+
+    # ----------------------------
+    # checkpoint / restore
+    # ----------------------------
+    def checkpoint(self) -> Optional[Path]:
+        """Salva ring + stato in modo atomico (tmp + os.replace)."""
+        path = self.checkpoint_path
+        if path is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        arrays: Dict[str, np.ndarray] = {}
+        meta: Dict[str, Any] = {"version": CHECKPOINT_VERSION, "saved_ms": int(time.time() * 1000), "series": []}
+        for i, (coin, tf) in enumerate(self.client.series):
+            b = self.client.rings[(coin, tf)].to_batch(coin, tf)
+            arrays[f"ts_{i}"] = np.asarray(b.ts, dtype=np.int64)
+            arrays[f"px_{i}"] = np.column_stack([b.open, b.high, b.low, b.close, b.volume]).astype(np.float64)
+            meta["series"].append({"coin": coin, "tf": tf, "state": asdict(self.states[(coin, tf)])})
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._last_checkpoint = time.monotonic()
+        return path
+
+    def restore(self) -> int:
+        """Carica il checkpoint se compatibile. Ritorna il numero di serie ripristinate."""
+        path = self.checkpoint_path
+        if path is None or not path.exists():
+            return 0
+        try:
+            with np.load(path) as z:
+                meta = json.loads(bytes(z["meta"]).decode("utf-8"))
+                if int(meta.get("version", 0)) != CHECKPOINT_VERSION:
+                    return 0
+                restored = 0
+                for i, s in enumerate(meta.get("series") or []):
+                    key = (str(s["coin"]), str(s["tf"]))
+                    ring = self.client.rings.get(key)
+                    if ring is None:
+                        continue
+                    ts, px = z[f"ts_{i}"], z[f"px_{i}"]
+                    for t, row in zip(ts[-ring.cap:].tolist(), px[-ring.cap:].tolist()):
+                        ring.upsert(t, *row)
+                    raw = s.get("state") or {}
+                    self.states[key] = SeriesState(
+                        last_ts=raw.get("last_ts"),
+                        emitted={str(k): int(v) for k, v in (raw.get("emitted") or {}).items()},
+                        cooldown={str(k): int(v) for k, v in (raw.get("cooldown") or {}).items()},
+                        pending=list(raw.get("pending") or []),
+                        ind=IndicatorState(**(raw.get("ind") or {})),
+                    )
+                    restored += 1
+        except Exception as e:
+            print(f"[LIVE] checkpoint ignorato ({type(e).__name__}: {e})")
+            return 0
+        return restored
+
+    # ----------------------------
+    # loop
+    # ----------------------------
+    async def run(self, **run_kw: Any) -> None:
+        t0 = time.perf_counter()
+        n = self.restore()
+        if n:
+            print(f"[LIVE] ripristinate {n}/{len(self.client.series)} serie da {self.checkpoint_path} "
+                  f"({(time.perf_counter() - t0) * 1e3:.0f}ms)")
+        try:
+            await self.client.run(**run_kw)
+        finally:
+            for t in self._workers.values():
+                t.cancel()
+            self.checkpoint()
+
+    def stop(self) -> None:
+        self.client.stop()
+
+async def _run() -> None:
+    def _on_hit(coin: str, tf: str, h: Dict[str, Any]) -> None:
+        print(f"[HIT] {coin} {tf} {h['pattern']} {h.get('direction')} ts={h['ts']}")
+
+    scanner = LiveScanner([("PENGU", "1m"), ("PENGU", "5m")], on_hit=_on_hit)
+    try:
+        await scanner.run()
+    finally:
+        await aclose_client()
+
+if __name__ == "__main__":
+    asyncio.run(_run())
@@ -1,12 +1,19 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Header, Query, HTTPException
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Any, Dict, List, Optional, Tuple, Union
 from datetime import datetime, timezone
-from contextlib import contextmanager
 import warnings
+import gzip
+import hashlib
 import os
 import sys
 import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 # =====================================================
 #  CONFIG
@@ -14,19 +21,44 @@ import random
 ANALISI_ROOT = os.environ.get("ANALISI_PATH") or "/Users/marcocontiero/Downloads/cassandra_railway-main-3"
 warnings.filterwarnings("ignore", message="pkg_resources is deprecated")
 
-@contextmanager
-def pushd(path: str):
-    cur = os.getcwd()
-    os.chdir(path)
-    try:
-        yield
-    finally:
-        os.chdir(cur)
+# I moduli 'analisi' risolvono file relativi alla cwd. Invece di un os.chdir per richiesta
+# (globale al processo: con il threadpool di FastAPI le richieste concorrenti si
+# scavalcano la cwd) la fissiamo una volta sola all'import, prima di servire richieste.
+# I path locali di questo backend vanno resi assoluti e i moduli locali importati
+# (da HERE) prima del cambio.
+os.environ.setdefault("CANDLE_STORE_DIR", os.path.abspath("candle_store"))
+
+def _pin_analisi_cwd(path: str) -> bool:
+    if not os.path.isdir(path):
+        return False
+    if os.path.abspath(os.getcwd()) != os.path.abspath(path):
+        os.chdir(path)
+    return True
 
 # =====================================================
 #  PATH SETUP
 # =====================================================
 HERE = os.path.dirname(os.path.abspath(__file__))
+
+# moduli locali di questo backend: da HERE esplicito, non da '' / cwd (che cambia sotto)
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+# candle store locale (storico HL scaricato da download_hl_ohlcv_range_multi)
+try:
+    from candle_store import get_store as _get_candle_store
+except Exception as e:
+    _get_candle_store = None  # type: ignore
+    print("⚠️ candle_store non disponibile:", e)
+
+# pattern in formazione (hit provvisorie sulla candela aperta)
+try:
+    from patterns import FORMING_WINDOW_BARS, FormingTracker
+except Exception as e:
+    FORMING_WINDOW_BARS = 60  # type: ignore
+    FormingTracker = None  # type: ignore
+    print("⚠️ patterns non disponibile:", e)
+
 CANDIDATE_ROOTS = [
     HERE,
     os.path.abspath(os.path.join(HERE, "..")),
@@ -39,43 +71,211 @@ for root in CANDIDATE_ROOTS:
         break
 
 try:
-    with pushd(ANALISI_ROOT):
-        from analisi.analizza_coin_light import scarica_ohlcv_binance  # type: ignore
-        from analisi.sr_pipeline import genera_supporti_e_resistenze    # type: ignore
+    if not _pin_analisi_cwd(ANALISI_ROOT):
+        raise FileNotFoundError(f"ANALISI_PATH non trovato: {ANALISI_ROOT}")
+    from analisi.analizza_coin_light import scarica_ohlcv_binance  # type: ignore
+    from analisi.sr_pipeline import genera_supporti_e_resistenze    # type: ignore
 except Exception as e:
     scarica_ohlcv_binance = None  # type: ignore
     genera_supporti_e_resistenze = None  # type: ignore
     print("⚠️ Moduli 'analisi' non disponibili:", e)
 
-# --- Hot patch estrai_livelli: stringhe/tuple -> dict ---
+# msgpack opzionale (solo per /api/chart?format=msgpack)
 try:
-    with pushd(ANALISI_ROOT):
-        import analisi.sr_pipeline as _srp  # type: ignore
-        if hasattr(_srp, "estrai_livelli"):
-            _orig_estrai = _srp.estrai_livelli  # type: ignore[attr-defined]
-
-            def _patched_estrai_livelli(lista_indicatori, prezzo_attuale, *args, **kwargs):
-                cleaned = []
-                for ind in lista_indicatori:
-                    if isinstance(ind, dict):
-                        cleaned.append(ind)
-                    elif isinstance(ind, (list, tuple)) and len(ind) >= 2:
-                        nome, val = ind[0], ind[1]
-                        if isinstance(val, (int, float)):
-                            cleaned.append({"nome": str(nome), "livello": float(val)})
-                    else:
-                        continue
-                return _orig_estrai(cleaned, prezzo_attuale, *args, **kwargs)  # type: ignore[misc]
+    import msgpack  # type: ignore
+except Exception:
+    msgpack = None  # type: ignore
 
-            _srp.estrai_livelli = _patched_estrai_livelli  # type: ignore[attr-defined]
-            print("✅ Patch 'estrai_livelli' applicata")
+# --- Hot patch estrai_livelli: stringhe/tuple -> dict ---
+try:
+    import analisi.sr_pipeline as _srp  # type: ignore
+    if hasattr(_srp, "estrai_livelli"):
+        _orig_estrai = _srp.estrai_livelli  # type: ignore[attr-defined]
+
+        def _patched_estrai_livelli(lista_indicatori, prezzo_attuale, *args, **kwargs):
+            cleaned = []
+            for ind in lista_indicatori:
+                if isinstance(ind, dict):
+                    cleaned.append(ind)
+                elif isinstance(ind, (list, tuple)) and len(ind) >= 2:
+                    nome, val = ind[0], ind[1]
+                    if isinstance(val, (int, float)):
+                        cleaned.append({"nome": str(nome), "livello": float(val)})
+                else:
+                    continue
+            return _orig_estrai(cleaned, prezzo_attuale, *args, **kwargs)  # type: ignore[misc]
+
+        _srp.estrai_livelli = _patched_estrai_livelli  # type: ignore[attr-defined]
+        print("✅ Patch 'estrai_livelli' applicata")
 except Exception as e:
     print("⚠️ Patch 'estrai_livelli' non applicata:", e)
 
+# =====================================================
+#  Risposte: JSON veloce + compressione
+# =====================================================
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name, str(default)) or str(default)).strip())
+    except Exception:
+        return default
+
+# sotto questa dimensione (byte) la compressione costa più di quanto risparmia
+RESPONSE_COMPRESS_MIN_BYTES = _env_int("RESPONSE_COMPRESS_MIN_BYTES", 1024)
+RESPONSE_GZIP_LEVEL = _env_int("RESPONSE_GZIP_LEVEL", 5)
+RESPONSE_BROTLI_QUALITY = _env_int("RESPONSE_BROTLI_QUALITY", 4)
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+    print("⚠️ orjson non disponibile: risposte JSON con json stdlib")
+
+try:
+    import brotli  # type: ignore
+except Exception:
+    brotli = None  # type: ignore
+
+class _ResponseMetrics:
+    """Contatori thread-safe di serializzazione/compressione: ms e byte per tipo."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._d: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, ms: float, size_in: int, size_out: int) -> None:
+        with self._lock:
+            m = self._d.setdefault(kind, {"count": 0, "ms": 0.0, "max_ms": 0.0, "bytes_in": 0, "bytes_out": 0})
+            m["count"] += 1
+            m["ms"] += ms
+            m["max_ms"] = max(m["max_ms"], ms)
+            m["bytes_in"] += size_in
+            m["bytes_out"] += size_out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for kind, m in self._d.items():
+                n = int(m["count"])
+                out[kind] = {
+                    "count": n,
+                    "avg_ms": round(m["ms"] / n, 3) if n else 0.0,
+                    "max_ms": round(m["max_ms"], 3),
+                    "bytes_in": int(m["bytes_in"]),
+                    "bytes_out": int(m["bytes_out"]),
+                    "ratio": round(m["bytes_out"] / m["bytes_in"], 4) if m["bytes_in"] else 0.0,
+                }
+            return out
+
+_resp_metrics = _ResponseMetrics()
+
+def _json_default(obj: Any) -> Any:
+    # tipi non nativi per orjson (Decimal, set, oggetti numpy non coperti, ...)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    try:
+        return float(obj)
+    except Exception:
+        return str(obj)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializzata con orjson (numpy incluso); fallback su json stdlib."""
+
+    def render(self, content: Any) -> bytes:
+        t0 = time.perf_counter()
+        if orjson is not None:
+            body = orjson.dumps(
+                content,
+                default=_json_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+        else:
+            body = super().render(content)
+        _resp_metrics.record("json", (time.perf_counter() - t0) * 1e3, len(body), len(body))
+        return body
+
+def _pick_encoding(accept: str) -> Optional[str]:
+    offered = set()
+    for part in (accept or "").lower().split(","):
+        tok, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        offered.add(tok.strip())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+def _compress(body: bytes, enc: str) -> bytes:
+    if enc == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)  # type: ignore[union-attr]
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+class _CompressionMiddleware:
+    """
+    ASGI: gzip/brotli negoziati via Accept-Encoding per risposte a corpo unico
+    (JSON/msgpack) oltre `minimum_size` byte; le risposte in streaming passano intatte.
+    """
+
+    def __init__(self, app: Any, minimum_size: int = RESPONSE_COMPRESS_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = int(minimum_size)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        enc = _pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+
+        start: Optional[Dict[str, Any]] = None
+        passthrough = False
+
+        async def _send(message: Dict[str, Any]) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                eligible = "content-encoding" not in headers and (
+                    headers.get("content-type", "").startswith(_COMPRESSIBLE_TYPES)
+                    or message.get("status") == 304
+                )
+                # Vary su ogni risposta negoziabile, compressa o no: una cache davanti
+                # non deve servire la variante identity a chi accetta gzip/br (o viceversa)
+                if eligible:
+                    headers.add_vary_header("Accept-Encoding")
+                if enc is None or not eligible or message.get("status") == 304:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body") or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            t0 = time.perf_counter()
+            out = _compress(body, enc)
+            _resp_metrics.record(enc, (time.perf_counter() - t0) * 1e3, len(body), len(out))
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = enc
+            headers["Content-Length"] = str(len(out))
+            await send(start)
+            await send({"type": "http.response.body", "body": out})
+
+        await self.app(scope, receive, _send)
+
 # =====================================================
 #  APP
 # =====================================================
-app = FastAPI(title="Cassandra Glass API", version="0.5.0")
+app = FastAPI(title="Cassandra Glass API", version="0.5.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -84,6 +284,190 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(_CompressionMiddleware, minimum_size=RESPONSE_COMPRESS_MIN_BYTES)
+
+# =====================================================
+#  Cache OHLCV (condivisa da analisi_light / chart / delta 24h)
+# =====================================================
+# limite totale di barre tenute in memoria (somma su tutte le serie)
+OHLCV_CACHE_MAX_BARS = _env_int("OHLCV_CACHE_MAX_BARS", 400_000)
+
+# la barra in formazione cambia di continuo: anche sui TF lunghi non serviamo dati più vecchi di così
+OHLCV_CACHE_MAX_AGE_SEC = _env_int("OHLCV_CACHE_MAX_AGE_SEC", 30)
+
+_TF_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+def _tf_to_ms(tf: str) -> int:
+    t = (tf or "").strip()
+    if t == "1M":
+        return 30 * 86_400_000
+    try:
+        return int(t[:-1]) * _TF_MS[t[-1:].lower()]
+    except Exception:
+        return 60_000
+
+class _OhlcvCache:
+    """
+    Cache in-process per (coin, tf):
+    - tiene la finestra più lunga scaricata finora; limit più piccoli sono slice (tail)
+    - scade alla chiusura della barra corrente del TF (o dopo OHLCV_CACHE_MAX_AGE_SEC)
+    - eviction LRU limitata dal numero totale di barre
+    """
+
+    def __init__(self, max_bars: int = OHLCV_CACHE_MAX_BARS, max_age_sec: int = OHLCV_CACHE_MAX_AGE_SEC) -> None:
+        self.max_bars = int(max_bars)
+        self.max_age_ms = int(max_age_sec) * 1000
+        self._d: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._bars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expiry_ms(self, tf: str, now_ms: int) -> int:
+        step = _tf_to_ms(tf)
+        next_close = (now_ms // step + 1) * step
+        return min(next_close, now_ms + self.max_age_ms) if self.max_age_ms > 0 else next_close
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        ent = self._d.pop(key, None)
+        if ent is not None:
+            self._bars -= ent["bars"]
+
+    def get(self, coin: str, tf: str, limit: int, fetch) -> Any:
+        key = (coin.strip().upper(), tf.strip())
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            ent = self._d.get(key)
+            if ent is not None and now_ms < ent["expires_ms"] and ent["limit"] >= int(limit):
+                self._d.move_to_end(key)
+                self.hits += 1
+                return ent["df"].tail(int(limit)).copy()
+            self.misses += 1
+            # ancora valida ma corta: riscarica alla lunghezza maggiore
+            want = max(int(limit), ent["limit"]) if ent is not None and now_ms < ent["expires_ms"] else int(limit)
+
+        df = fetch(coin, tf, want)
+        if df is None:
+            return None
+
+        with self._lock:
+            self._drop(key)
+            n = int(len(df))
+            self._d[key] = {"df": df, "limit": want, "bars": n, "expires_ms": self._expiry_ms(tf, now_ms)}
+            self._bars += n
+            while self._bars > self.max_bars and len(self._d) > 1:
+                self._drop(next(iter(self._d)))
+        return df.tail(int(limit)).copy()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tot = self.hits + self.misses
+            return {
+                "entries": len(self._d),
+                "bars": self._bars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / tot, 4) if tot else 0.0,
+            }
+
+_ohlcv_cache = _OhlcvCache()
+
+def _fetch_ohlcv_binance(coin: str, tf: str, limit: int):
+    return scarica_ohlcv_binance(coin, tf, limit=limit)  # type: ignore[misc]
+
+def get_ohlcv(coin: str, tf: str, limit: int):
+    """OHLCV Binance (DataFrame) passando dalla cache condivisa."""
+    return _ohlcv_cache.get(coin, tf, limit, _fetch_ohlcv_binance)
+
+# download dei TF di una richiesta in parallelo, entro una deadline complessiva
+OHLCV_FETCH_WORKERS = _env_int("OHLCV_FETCH_WORKERS", 8)
+OHLCV_FETCH_DEADLINE_SEC = float(_env_int("OHLCV_FETCH_DEADLINE_SEC", 20))
+
+# attesa massima in coda (pool condiviso saturo) prima che un TF parta: non consuma la deadline
+OHLCV_FETCH_QUEUE_MAX_SEC = float(_env_int("OHLCV_FETCH_QUEUE_MAX_SEC", 60))
+
+_fetch_pool = ThreadPoolExecutor(max_workers=max(1, OHLCV_FETCH_WORKERS), thread_name_prefix="ohlcv")
+
+def get_ohlcv_many(
+    coin: str,
+    tf_list: List[str],
+    limit: int,
+    *,
+    deadline_sec: float = OHLCV_FETCH_DEADLINE_SEC,
+    queue_max_sec: float = OHLCV_FETCH_QUEUE_MAX_SEC,
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    (dfs per tf nell'ordine di tf_list, errori per tf).
+    La deadline di ogni TF parte quando il suo download inizia, non al submit: col pool
+    condiviso sotto carico il tempo in coda non fa scadere i TF (fino a queue_max_sec).
+    """
+    started: Dict[str, float] = {}
+
+    def _run(tf: str):
+        started[tf] = time.monotonic()
+        return get_ohlcv(coin, tf, limit)
+
+    t0 = time.monotonic()
+    futs = {tf: _fetch_pool.submit(_run, tf) for tf in dict.fromkeys(tf_list)}
+
+    def _expires(tf: str) -> float:
+        s = started.get(tf)
+        return s + deadline_sec if s is not None else t0 + queue_max_sec
+
+    results: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    left = dict(futs)
+    while left:
+        for tf in [tf for tf, f in left.items() if f.done()]:
+            try:
+                results[tf] = left.pop(tf).result()
+            except Exception as e:
+                errors[tf] = str(e)
+        now = time.monotonic()
+        for tf in [tf for tf in left if _expires(tf) <= now]:
+            f = left.pop(tf)
+            if tf in started:
+                errors[tf] = f"timeout dopo {deadline_sec:.0f}s"
+            else:
+                f.cancel()
+                errors[tf] = f"in coda oltre {queue_max_sec:.0f}s (pool download occupato)"
+        if left:
+            wait(list(left.values()), timeout=max(0.0, min(_expires(tf) for tf in left) - now),
+                 return_when=FIRST_COMPLETED)
+
+    dfs = {tf: results[tf] for tf in futs if tf in results}
+    return dfs, errors
+
+class RequestData:
+    """
+    OHLCV di una singola richiesta: ogni TF viene letto una volta e riusato da tutta la pipeline
+    (S/R, prezzo di riferimento, delta 24h). `dfs` contiene solo i TF di analisi;
+    i TF chiesti in più (es. 1h per il delta) stanno a parte e non entrano nella pipeline S/R.
+    """
+
+    def __init__(self, coin: str) -> None:
+        self.coin = coin
+        self.dfs: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self._extra: Dict[str, Any] = {}
+
+    def load(self, tf_list: List[str], limit: int) -> None:
+        missing = [tf for tf in tf_list if tf not in self.dfs]
+        if not missing:
+            return
+        dfs, errors = get_ohlcv_many(self.coin, missing, limit)
+        self.dfs.update(dfs)
+        self.errors.update(errors)
+
+    def frame(self, tf: str, min_bars: int) -> Any:
+        """DataFrame di `tf` con almeno min_bars barre: dal contesto se c'è, altrimenti un solo download."""
+        for src in (self.dfs, self._extra):
+            df = src.get(tf)
+            if df is not None and len(df) >= int(min_bars):
+                return df
+        df = get_ohlcv(self.coin, tf, int(min_bars))
+        self._extra[tf] = df
+        return df
 
 # =====================================================
 #  Utils S/R
@@ -199,73 +583,102 @@ def _unpack_sr(sr: Union[Dict[str, Any], List[Any], Tuple[Any, ...]], prezzo: Op
     return {"supporti": supporti, "resistenze": resistenze}
 
 def _genera_sr_safe(dfs: Dict[str, Any], prezzo: float) -> Dict[str, List[Dict[str, Any]]]:
-    with pushd(ANALISI_ROOT):
+    try:
+        raw = genera_supporti_e_resistenze(dfs, prezzo_attuale=prezzo)  # type: ignore[arg-type]
+    except TypeError:
         try:
-            raw = genera_supporti_e_resistenze(dfs, prezzo_attuale=prezzo)  # type: ignore[arg-type]
+            raw = genera_supporti_e_resistenze(dfs, prezzo)  # type: ignore[misc]
         except TypeError:
-            try:
-                raw = genera_supporti_e_resistenze(dfs, prezzo)  # type: ignore[misc]
-            except TypeError:
-                raw = genera_supporti_e_resistenze(dfs)  # type: ignore[misc]
+            raw = genera_supporti_e_resistenze(dfs)  # type: ignore[misc]
     return _unpack_sr(raw, prezzo)
 
 # ---------------- Fallback da OHLCV (se la pipeline non produce nulla) ----------------
+def _swing_arrays(df) -> Tuple[Any, Any, Any]:
+    """(livelli, kind 0=low/1=high, indice barra) degli swing a 3 barre, con confronti su array shiftati."""
+    import numpy as np
+
+    empty = (np.zeros(0), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64))
+    if "low" not in df.columns:
+        return empty
+    lows = np.asarray(df["low"].to_numpy(), dtype=np.float64)
+    n = lows.shape[0]
+    if n < 5:
+        return empty
+    mid = slice(2, n - 2)
+    idx = np.arange(2, n - 2, dtype=np.int64)
+    lo_m = (lows[mid] < lows[1:n - 3]) & (lows[mid] < lows[3:n - 1])
+
+    lv = [lows[mid][lo_m]]
+    kind = [np.zeros(int(lo_m.sum()), dtype=np.int8)]
+    pos = [idx[lo_m]]
+    if "high" in df.columns:
+        highs = np.asarray(df["high"].to_numpy(), dtype=np.float64)
+        hi_m = (highs[mid] > highs[1:n - 3]) & (highs[mid] > highs[3:n - 1])
+        lv.append(highs[mid][hi_m])
+        kind.append(np.ones(int(hi_m.sum()), dtype=np.int8))
+        pos.append(idx[hi_m])
+    return np.concatenate(lv), np.concatenate(kind), np.concatenate(pos)
+
 def _fallback_sr_from_ohlcv(dfs: Dict[str, Any], prezzo: float) -> Dict[str, List[Dict[str, Any]]]:
-    candidates: List[Dict[str, Any]] = []
+    import numpy as np
+
     tol_pct = 0.003  # 0.3% per clustering
+    fonte = {0: ("swing low", 3), 1: ("swing high", 3)}
 
+    tf_names: List[str] = []
+    parts = []
     for tf, df in dfs.items():
         if df is None or len(df) < 10:
             continue
-        lows = df["low"].values.tolist() if "low" in df.columns else []
-        highs = df["high"].values.tolist() if "high" in df.columns else []
-        n = len(lows)
-        for i in range(2, n - 2):
-            try:
-                if lows[i] < lows[i-1] and lows[i] < lows[i+1]:
-                    lvl = float(lows[i])
-                    candidates.append({"tipo":"livello","livello":lvl,"tf":tf,"fonti":[("swing low",3)],"forza":3})
-                if highs[i] > highs[i-1] and highs[i] > highs[i+1]:
-                    lvl = float(highs[i])
-                    candidates.append({"tipo":"livello","livello":lvl,"tf":tf,"fonti":[("swing high",3)],"forza":3})
-            except Exception:
-                continue
+        lv, kind, pos = _swing_arrays(df)
+        if lv.shape[0]:
+            parts.append((lv, kind, pos, np.full(lv.shape[0], len(tf_names), dtype=np.int32)))
+            tf_names.append(tf)
 
-    if not candidates:
+    if not parts:
         return {"supporti": [], "resistenze": []}
 
-    candidates.sort(key=lambda x: x["livello"] if "livello" in x else (x["min"]+x["max"])/2)
-    clusters: List[List[Dict[str, Any]]] = []
-    for it in candidates:
-        placed = False
-        for cl in clusters:
-            ref = cl[0]["livello"] if "livello" in cl[0] else (cl[0]["min"]+cl[0]["max"])/2
-            if abs((it["livello"] - ref)/prezzo) <= tol_pct:
-                cl.append(it)
-                placed = True
-                break
-        if not placed:
-            clusters.append([it])
+    lv = np.concatenate([p[0] for p in parts])
+    kind = np.concatenate([p[1] for p in parts])
+    pos = np.concatenate([p[2] for p in parts])
+    tfi = np.concatenate([p[3] for p in parts])
+
+    # ordine per livello; a parità l'ordine di inserimento (tf, barra, low prima di high)
+    order = np.lexsort((kind, pos, tfi, lv))
+    lv, kind, tfi = lv[order], kind[order], tfi[order]
+
+    # livelli ordinati: un candidato può cadere solo nell'ultimo cluster aperto,
+    # quindi basta una passata che apre un cluster nuovo quando supera l'ancora di tol_pct
+    n = lv.shape[0]
+    starts: List[int] = []
+    a = 0
+    while a < n:
+        starts.append(a)
+        b = int(np.searchsorted(lv, lv[a] + tol_pct * prezzo, side="right"))
+        # allinea il bordo al confronto originale abs((x - ancora) / prezzo) <= tol
+        while b < n and abs((lv[b] - lv[a]) / prezzo) <= tol_pct:
+            b += 1
+        while b - 1 > a and abs((lv[b - 1] - lv[a]) / prezzo) > tol_pct:
+            b -= 1
+        a = max(b, a + 1)
+
+    st = np.asarray(starts, dtype=np.int64)
+    ends = np.r_[st[1:], n]
+    mn = np.minimum.reduceat(lv, st)
+    mx = np.maximum.reduceat(lv, st)
+    multi = np.minimum.reduceat(tfi, st) != np.maximum.reduceat(tfi, st)
+    forza = (ends - st) * 3
 
     results: List[Dict[str, Any]] = []
-    for cl in clusters:
-        vals = [x["livello"] for x in cl if "livello" in x]
-        mn, mx = min(vals), max(vals)
-        fonti = []
-        forza = 0
-        tfs = set()
-        for x in cl:
-            for f in x.get("fonti", []):
-                fonti.append(f)
-                if isinstance(f, tuple) and len(f) == 2 and isinstance(f[1], (int,float)):
-                    forza += int(f[1])
-            tfs.add(x.get("tf","1h"))
-        tf_label = "multi" if len(tfs) > 1 else list(tfs)[0]
-        if abs(mx - mn)/prezzo >= 0.001:
-            results.append(mk_zona(mn, mx, tf_label, fonti, forza))
+    for k in range(st.shape[0]):
+        a, b = int(st[k]), int(ends[k])
+        fonti = [fonte[int(x)] for x in kind[a:b]]
+        tf_label = "multi" if multi[k] else tf_names[int(tfi[a])]
+        lo, hi = float(mn[k]), float(mx[k])
+        if abs(hi - lo) / prezzo >= 0.001:
+            results.append(mk_zona(lo, hi, tf_label, fonti, int(forza[k])))
         else:
-            mid = (mn + mx)/2
-            results.append(mk_level(mid, tf_label, fonti, forza))
+            results.append(mk_level((lo + hi) / 2, tf_label, fonti, int(forza[k])))
 
     supporti = []
     resistenze = []
@@ -277,20 +690,18 @@ def _fallback_sr_from_ohlcv(dfs: Dict[str, Any], prezzo: float) -> Dict[str, Lis
 
     return {"supporti": supporti, "resistenze": resistenze}
 
-def build_sr_candidates(coin: str, tf_list: List[str]):
+def build_sr_candidates(coin: str, tf_list: List[str], data: Optional[RequestData] = None):
     """Restituisce (supporti, resistenze, supporti_extra, resistenze_extra, prezzo, debug_info)."""
     debug_info: Dict[str, Any] = {}
 
     if scarica_ohlcv_binance is None or genera_supporti_e_resistenze is None:
         return [], [], [], [], None, {"errore": "moduli analisi non disponibili"}
 
-    dfs: Dict[str, Any] = {}
-    with pushd(ANALISI_ROOT):
-        for tf in tf_list:
-            try:
-                dfs[tf] = scarica_ohlcv_binance(coin, tf, limit=1000)  # pandas.DataFrame
-            except Exception as e:
-                debug_info.setdefault("download_error", {})[tf] = str(e)
+    data = data or RequestData(coin)
+    data.load(tf_list, 1000)  # tf -> pandas.DataFrame
+    if data.errors:
+        debug_info["download_error"] = dict(data.errors)
+    dfs = {tf: data.dfs[tf] for tf in tf_list if tf in data.dfs}
     if not dfs:
         return [], [], [], [], None, {"errore": "download ohlcv vuoto", **debug_info}
 
@@ -345,7 +756,10 @@ def pick_top3(items: List[Dict[str, Any]], prezzo: Optional[float], k: int = 3)
 
 def _compute_bias_and_recos(prezzo: float,
                             supporti: List[Dict[str, Any]],
-                            resistenze: List[Dict[str, Any]]):
+                            resistenze: List[Dict[str, Any]],
+                            *,
+                            with_trades: bool = True,
+                            with_grafici: bool = True):
     def center(x):
         return (x["livello"] if x["tipo"] == "livello" else (x["min"] + x["max"]) / 2.0)
 
@@ -395,8 +809,9 @@ def _compute_bias_and_recos(prezzo: float,
         sl = c * 1.012
         return {"direzione": "SHORT","tf": it.get("tf", "1h"),"entry": round(c, 2),"sl": round(sl, 2),"tp": round(tp, 2),"note": "Rejection in area di offerta","fonti": it.get("fonti", [])}
 
-    entrate = [mk_trade_from_support(x) for x in supp_sorted[:3]]
-    uscite  = [mk_trade_from_resistenza(x) for x in res_sorted[:3]]
+    # trade/scenari/grafici solo se richiesti (compact/fields li possono escludere)
+    entrate = [mk_trade_from_support(x) for x in supp_sorted[:3]] if with_trades else []
+    uscite  = [mk_trade_from_resistenza(x) for x in res_sorted[:3]] if with_trades else []
 
     scenari_attivi = []
     for e in entrate:
@@ -405,9 +820,9 @@ def _compute_bias_and_recos(prezzo: float,
         scenari_attivi.append({"titolo": f"Rejection short {u['tf']} @ {u['entry']:.0f}","direzione": "SHORT","entry": u["entry"], "sl": u["sl"], "tp": u["tp"],"validita": "finché regge la resistenza"})
 
     grafici = []
-    if nearest_s:
+    if nearest_s and with_grafici:
         grafici.append({"tf": nearest_s.get("tf","1h"),"direzione": "LONG","titolo": f"Zona di domanda @ {center(nearest_s):.0f}","annotazioni": [f"fonti: {', '.join(n for n,_ in nearest_s.get('fonti',[])[:3])}"] if nearest_s.get('fonti') else []})
-    if nearest_r:
+    if nearest_r and with_grafici:
         grafici.append({"tf": nearest_r.get("tf","1h"),"direzione": "SHORT","titolo": f"Zona di offerta @ {center(nearest_r):.0f}","annotazioni": [f"fonti: {', '.join(n for n,_ in nearest_r.get('fonti',[])[:3])}"] if nearest_r.get('fonti') else []})
 
     spiegazione = (f"Bias {direzione}: confronto tra distanza dal supporto più vicino ({dS*100:.2f}%) "
@@ -416,40 +831,47 @@ def _compute_bias_and_recos(prezzo: float,
     return direzione, score, motivi, entrate, uscite, scenari_attivi, grafici, spiegazione
 
 
-def _delta_24h(coin: str) -> Dict[str, float]:
+def _delta_24h(coin: str, data: Optional[RequestData] = None) -> Dict[str, float]:
     """Delta rispetto a ~24h: {'abs': x, 'pct': y}. Sempre presente e con valori numerici."""
+    data = data or RequestData(coin)
+    # Prova con 1h (24 barre fa)
     try:
-        with pushd(ANALISI_ROOT):
-            # Prova con 1h (24 barre fa)
-            try:
-                df = scarica_ohlcv_binance(coin, "1h", limit=30)  # type: ignore
-                if df is not None and len(df) >= 25 and "close" in df.columns:
-                    last = float(df["close"].iloc[-1])
-                    prev = float(df["close"].iloc[-25])
-                    abs_ = float(last - prev)
-                    pct_ = float((abs_ / prev) if prev else 0.0)
-                    return {"abs": round(abs_, 2), "pct": round(pct_, 4)}
-            except Exception:
-                pass
-            # Fallback: 1d (ultimo vs precedente)
-            try:
-                df = scarica_ohlcv_binance(coin, "1d", limit=2)  # type: ignore
-                if df is not None and len(df) >= 2 and "close" in df.columns:
-                    last = float(df["close"].iloc[-1]); prev = float(df["close"].iloc[-2])
-                    abs_ = float(last - prev)
-                    pct_ = float((abs_ / prev) if prev else 0.0)
-                    return {"abs": round(abs_, 2), "pct": round(pct_, 4)}
-            except Exception:
-                pass
+        df = data.frame("1h", 30)
+        if df is not None and len(df) >= 25 and "close" in df.columns:
+            last = float(df["close"].iloc[-1])
+            prev = float(df["close"].iloc[-25])
+            abs_ = float(last - prev)
+            pct_ = float((abs_ / prev) if prev else 0.0)
+            return {"abs": round(abs_, 2), "pct": round(pct_, 4)}
+    except Exception:
+        pass
+    # Fallback: 1d (ultimo vs precedente)
+    try:
+        df = data.frame("1d", 2)
+        if df is not None and len(df) >= 2 and "close" in df.columns:
+            last = float(df["close"].iloc[-1]); prev = float(df["close"].iloc[-2])
+            abs_ = float(last - prev)
+            pct_ = float((abs_ / prev) if prev else 0.0)
+            return {"abs": round(abs_, 2), "pct": round(pct_, 4)}
     except Exception:
         pass
     # default sicuro
     return {"abs": 0.0, "pct": 0.0}
 
-def _df_to_chart_payload(df, coin: str, timeframe: str) -> Dict[str, Any]:
+CHART_FORMATS = ("full", "rows", "columns", "msgpack")
+
+_CHART_COLS = (
+    ("o", ("open", "Open", "o")),
+    ("h", ("high", "High", "h")),
+    ("l", ("low", "Low", "l")),
+    ("c", ("close", "Close", "c")),
+    ("v", ("volume", "Volume", "v", "vol")),
+)
+
+def _chart_frame(df) -> Tuple[Any, Any]:
+    """df OHLCV -> (df ordinato per tempo, ts in ms come array int64)."""
+    import numpy as np
     import pandas as pd
-    if df is None or len(df) == 0:
-        return {"ok": True, "coin": coin, "timeframe": timeframe, "bars": 0, "data": [], "ohlcv": []}
 
     try:
         if isinstance(df.index, pd.DatetimeIndex):
@@ -461,6 +883,7 @@ def _df_to_chart_payload(df, coin: str, timeframe: str) -> Dict[str, Any]:
     except Exception:
         pass
 
+    n = len(df)
     try:
         if "time" in df.columns:
             t = df["time"]
@@ -469,78 +892,244 @@ def _df_to_chart_payload(df, coin: str, timeframe: str) -> Dict[str, Any]:
         elif isinstance(df.index, pd.DatetimeIndex):
             t = df.index
         else:
-            t = pd.Series(range(len(df)))
-        ts = pd.to_datetime(t, utc=True, errors='coerce')
-        ts_ms = (ts.view('int64') // 10**6).astype('int64').tolist()
+            t = pd.Series(range(n))
+        ts = pd.DatetimeIndex(pd.to_datetime(t, utc=True, errors="coerce")).tz_convert(None)
+        ts_ms = np.asarray(ts, dtype="datetime64[ms]").astype(np.int64)
     except Exception:
-        ts_ms = list(range(len(df)))
+        ts_ms = np.arange(n, dtype=np.int64)
+    return df, ts_ms
 
-    def col(*names):
-        for n in names:
-            if n in df.columns:
-                return df[n]
-        return None
-
-    o = col("open", "Open", "o")
-    h = col("high", "High", "h")
-    l = col("low", "Low", "l")
-    c = col("close", "Close", "c")
-    v = col("volume", "Volume", "v", "vol")
+def _chart_columns(df) -> Tuple[List[int], Dict[str, List[Optional[float]]]]:
+    """df OHLCV -> (ts in ms, colonne t/o/h/l/c/v come liste) in un solo passaggio vettoriale."""
+    import numpy as np
+    import pandas as pd
 
-    data = []
-    ohlcv = []
+    df, ts = _chart_frame(df)
+    ts_ms = ts.tolist()
     n = len(ts_ms)
-    for i in range(n):
-        def get_val(series):
-            if series is None:
-                return None
-            try:
-                return float(series.iloc[i])
-            except Exception:
-                return None
-        oi = get_val(o); hi = get_val(h); li = get_val(l); ci = get_val(c); vi = get_val(v)
-        data.append({"t": int(ts_ms[i]), "o": oi, "h": hi, "l": li, "c": ci, "v": vi})
-        ohlcv.append([int(ts_ms[i]), oi, hi, li, ci, vi])
-
-    return {"ok": True, "coin": coin, "timeframe": timeframe, "bars": len(data), "data": data, "ohlcv": ohlcv}
+    cols: Dict[str, List[Optional[float]]] = {}
+    for key, names in _CHART_COLS:
+        name = next((x for x in names if x in df.columns), None)
+        if name is None:
+            cols[key] = [None] * n
+            continue
+        a = pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+        vals = a.tolist()
+        if np.isnan(a).any():
+            vals = [None if x != x else x for x in vals]
+        cols[key] = vals
+    return ts_ms, cols
+
+def _df_to_chart_payload(df, coin: str, timeframe: str, fmt: str = "full") -> Dict[str, Any]:
+    """
+    Payload /api/chart. fmt:
+    - full: data (lista di dict) + ohlcv (righe), come da sempre
+    - rows: solo ohlcv [[t, o, h, l, c, v], ...]
+    - columns / msgpack: columns {t: [...], o: [...], ...}
+    """
+    head = {"ok": True, "coin": coin, "timeframe": timeframe}
+    if df is None or len(df) == 0:
+        ts_ms, cols = [], {k: [] for k, _ in _CHART_COLS}
+    else:
+        ts_ms, cols = _chart_columns(df)
+
+    if fmt in ("columns", "msgpack"):
+        return {**head, "bars": len(ts_ms), "columns": {"t": ts_ms, **cols}}
+
+    ohlcv = [list(r) for r in zip(ts_ms, cols["o"], cols["h"], cols["l"], cols["c"], cols["v"])]
+    if fmt == "rows":
+        return {**head, "bars": len(ohlcv), "ohlcv": ohlcv}
+    data = [{"t": t, "o": o, "h": h, "l": l, "c": c, "v": v} for t, o, h, l, c, v in ohlcv]
+    return {**head, "bars": len(data), "data": data, "ohlcv": ohlcv}
+
+def _chart_response(payload: Dict[str, Any], fmt: str, headers: Optional[Dict[str, str]] = None):
+    if fmt != "msgpack":
+        return FastJSONResponse(payload, headers=headers)
+    if msgpack is None:
+        raise HTTPException(status_code=400, detail="format=msgpack non disponibile (pacchetto msgpack mancante).")
+    return Response(content=msgpack.packb(payload, use_bin_type=True), media_type="application/msgpack", headers=headers)
+
+def _chart_etag(df, ts_ms, coin: str, timeframe: str, variant: str) -> str:
+    """ETag da (coin, tf, ultima barra: ts + valori) più i parametri che cambiano il corpo."""
+    last: List[Any] = [int(ts_ms[-1]) if len(ts_ms) else None, len(ts_ms)]
+    if len(df):
+        row = df.iloc[-1]
+        for _, names in _CHART_COLS:
+            name = next((x for x in names if x in df.columns), None)
+            last.append(None if name is None else repr(row[name]))
+    src = f"{coin}|{timeframe}|{variant}|{last}".encode("utf-8")
+    return '"' + hashlib.blake2b(src, digest_size=12).hexdigest() + '"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _chart_conditional(df, coin: str, timeframe: str, fmt: str, bars: int,
+                       since: Optional[int], if_none_match: Optional[str]):
+    """304 se il client ha già l'ultima barra, altrimenti payload (solo barre >= since se richiesto)."""
+    df, ts_ms = _chart_frame(df)
+    etag = _chart_etag(df, ts_ms, coin, timeframe, f"{fmt}|{bars}|{since}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if since is not None:
+        df = df.iloc[ts_ms >= int(since)]
+    payload = _df_to_chart_payload(df, coin, timeframe, fmt)
+    if since is not None:
+        payload["since"] = int(since)
+    return _chart_response(payload, fmt, headers)
+
+def _store_ohlcv_df(coin: str, timeframe: str, limit: int):
+    """Ultime `limit` barre dal candle store locale, nel formato atteso da _df_to_chart_payload."""
+    import pandas as pd
+    a = _get_candle_store().tail(coin, timeframe, int(limit))  # type: ignore[misc]
+    if len(a["ts"]) == 0:
+        return None
+    return pd.DataFrame({
+        "time": pd.to_datetime(a["ts"], unit="ms", utc=True),
+        "open": a["open"],
+        "high": a["high"],
+        "low": a["low"],
+        "close": a["close"],
+        "volume": a["volume"],
+    })
 
 @app.get("/api/chart")
 def api_chart(
     coin: str,
     timeframe: str = Query("1h"),
-    bars: int = Query(800, ge=2, le=3000)
+    bars: int = Query(800, ge=2, le=3000),
+    source: str = Query("binance", description="binance | store (candle store locale)"),
+    format: str = Query("full", description="full | rows | columns | msgpack"),
+    since: Optional[int] = Query(None, description="Solo barre con ts >= since (ms), inclusa quella in formazione"),
+    if_none_match: Optional[str] = Header(None),
+):
+    if format not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format non valido: {format} (ammessi: {', '.join(CHART_FORMATS)})")
+    if source == "store":
+        if _get_candle_store is None:
+            raise HTTPException(status_code=500, detail="candle_store non disponibile.")
+        df = _store_ohlcv_df(coin, timeframe, bars)
+        if df is None:
+            raise HTTPException(status_code=404, detail=f"Nessuna barra nello store per {coin} {timeframe}.")
+        return _chart_conditional(df, coin, timeframe, format, bars, since, if_none_match)
+
+    if scarica_ohlcv_binance is None:
+        raise HTTPException(status_code=500, detail="Modulo 'analisi' non disponibile.")
+    try:
+        df = get_ohlcv(coin, timeframe, bars)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore scarico OHLCV: {e}")
+    if df is None or len(df) == 0:
+        return _chart_response(_df_to_chart_payload(df, coin, timeframe, format), format)
+    return _chart_conditional(df, coin, timeframe, format, bars, since, if_none_match)
+
+# stato condiviso tra le richieste: finestra chiusa + hit attive per (coin, tf)
+_forming_tracker = FormingTracker() if FormingTracker is not None else None
+
+@app.get("/api/pattern-forming")
+def api_pattern_forming(
+    coin: str,
+    timeframes: str = Query("15m,1h,4h", description="Lista separata da virgole"),
+    client: Optional[str] = Query(None, description="Id client: abilita gli stati CLOSED/FAILED (emessi una volta per client)"),
 ) -> Dict[str, Any]:
+    if _forming_tracker is None:
+        raise HTTPException(status_code=500, detail="Modulo 'patterns' non disponibile.")
     if scarica_ohlcv_binance is None:
         raise HTTPException(status_code=500, detail="Modulo 'analisi' non disponibile.")
-    with pushd(ANALISI_ROOT):
+
+    out: List[Dict[str, Any]] = []
+    errors: Dict[str, str] = {}
+    for tf in [t.strip() for t in timeframes.split(",") if t.strip()]:
         try:
-            df = scarica_ohlcv_binance(coin, timeframe, limit=bars)
+            df = get_ohlcv(coin, tf, FORMING_WINDOW_BARS + 1)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Errore scarico OHLCV: {e}")
-    payload = _df_to_chart_payload(df, coin, timeframe)
+            errors[tf] = str(e)
+            continue
+        rows = _df_to_chart_payload(df, coin, tf, "rows")["ohlcv"]
+        if len(rows) < 3:
+            continue
+        # l'ultima kline Binance è quella aperta: le precedenti sono la finestra chiusa
+        closed, forming = rows[:-1], rows[-1]
+        if _forming_tracker.closed_last_ts(coin, tf) != int(closed[-1][0]):
+            _forming_tracker.set_closed(coin, tf, {
+                "timestamp": [r[0] for r in closed],
+                "open": [r[1] for r in closed],
+                "high": [r[2] for r in closed],
+                "low": [r[3] for r in closed],
+                "close": [r[4] for r in closed],
+                "volume": [r[5] or 0.0 for r in closed],
+            })
+        out.extend(_forming_tracker.update(coin, tf, {
+            "timestamp": forming[0],
+            "open": forming[1],
+            "high": forming[2],
+            "low": forming[3],
+            "close": forming[4],
+            "volume": forming[5] or 0.0,
+        }, client=client))
+
+    payload: Dict[str, Any] = {"ok": True, "coin": coin, "patterns": out, "ts": datetime.now(timezone.utc).isoformat()}
+    if errors:
+        payload["errors"] = errors
     return payload
 
 # ----------------------- CORE & ROUTES -----------------------
-def _analisi_light_core(coin: str, timeframes: str, tipo: str, debug: int):
+# sezioni selezionabili con fields= (compact=1 senza fields -> ANALISI_COMPACT_DEFAULT)
+ANALISI_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "delta": ("delta",),
+    "sr": ("supporti", "resistenze", "supporti_extra", "resistenze_extra"),
+    "scenari": ("scenari",),
+    "longshort": ("longshort", "spiegazione"),
+    "trades": ("entrate", "uscite", "scenari_attivi"),
+    "grafici": ("grafici",),
+    "trend": ("trend_tf", "trend_tf_score"),
+}
+ANALISI_COMPACT_DEFAULT = frozenset({"delta", "sr", "longshort"})
+
+def _parse_fields(compact: int, fields: Optional[str]) -> Optional[frozenset]:
+    """None = payload completo legacy; altrimenti l'insieme di sezioni da costruire."""
+    if fields:
+        names = frozenset(f.strip().lower() for f in fields.split(",") if f.strip())
+        unknown = sorted(names - set(ANALISI_SECTIONS))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"fields non validi: {', '.join(unknown)} (ammessi: {', '.join(ANALISI_SECTIONS)})",
+            )
+        return names
+    return ANALISI_COMPACT_DEFAULT if compact else None
+
+def _analisi_light_core(coin: str, timeframes: str, tipo: str, debug: int, fields: Optional[frozenset] = None):
     tf_list = [t.strip() for t in timeframes.split(",") if t.strip()]
     if not tf_list:
         raise HTTPException(status_code=400, detail="Parametro 'timeframes' mancante o vuoto.")
 
-    supporti, resistenze, supporti_extra, resistenze_extra, prezzo, dbg = build_sr_candidates(coin, tf_list)
+    def want(section: str) -> bool:
+        return fields is None or section in fields
+
+    data = RequestData(coin)
+    supporti, resistenze, supporti_extra, resistenze_extra, prezzo, dbg = build_sr_candidates(coin, tf_list, data)
 
     if scarica_ohlcv_binance is None or genera_supporti_e_resistenze is None:
         raise HTTPException(status_code=500, detail="Modulo 'analisi' non disponibile nel PYTHONPATH.")
     if prezzo is None:
         raise HTTPException(status_code=500, detail="Prezzo di riferimento non disponibile.")
 
-    pullback_long = pick_top3(supporti, prezzo)
-    reset_short = pick_top3(resistenze, prezzo)
+    pullback_long = pick_top3(supporti, prezzo) if want("scenari") else []
+    reset_short = pick_top3(resistenze, prezzo) if want("scenari") else []
 
-    trend_tf = {tf: random.choice(["↑", "↓", "→"]) for tf in tf_list}
-    trend_tf_score = {tf: {"bias": random.choice(["long","short","neutro"]), "score": random.randint(-30, 30)} for tf in tf_list}
+    if want("trend"):
+        trend_tf = {tf: random.choice(["↑", "↓", "→"]) for tf in tf_list}
+        trend_tf_score = {tf: {"bias": random.choice(["long","short","neutro"]), "score": random.randint(-30, 30)} for tf in tf_list}
+    else:
+        trend_tf, trend_tf_score = {}, {}
 
     direzione, score, motivi, entrate, uscite, scenari_attivi, grafici, spiegazione = _compute_bias_and_recos(
-        prezzo, supporti + supporti_extra, resistenze + resistenze_extra
+        prezzo, supporti + supporti_extra, resistenze + resistenze_extra,
+        with_trades=want("trades"), with_grafici=want("grafici"),
     )
 
     # SCORE 0..100 (50 = neutro) mappato da -30..30
@@ -548,8 +1137,8 @@ def _analisi_light_core(coin: str, timeframes: str, tipo: str, debug: int):
     if score_100 < 0: score_100 = 0
     if score_100 > 100: score_100 = 100
 
-    # DELTA rispetto a ieri
-    delta_ieri = _delta_24h(coin)
+    # DELTA rispetto a ieri (scarica 1h/1d: solo se richiesto)
+    delta_ieri = _delta_24h(coin, data) if want("delta") else {"abs": 0.0, "pct": 0.0}
     delta_pct = round(float(delta_ieri.get('pct', 0.0)) * 100.0, 2)
     delta_abs = round(float(delta_ieri.get('abs', 0.0)), 2)
     delta_pct_str = f"{delta_pct:+.2f}%"
@@ -557,6 +1146,41 @@ def _analisi_light_core(coin: str, timeframes: str, tipo: str, debug: int):
     delta_text_alias = delta_pct_str
     delta_abs_str = f"{delta_abs:+.2f}"
 
+    if fields is not None:
+        # compatto: ogni valore una volta sola, niente alias per i componenti legacy
+        values: Dict[str, Any] = {
+            "delta": {"pct": delta_pct, "abs": delta_abs, "pct_str": delta_pct_str, "abs_str": delta_abs_str, "sign": delta_sign},
+            "supporti": supporti,
+            "resistenze": resistenze,
+            "supporti_extra": supporti_extra,
+            "resistenze_extra": resistenze_extra,
+            "scenari": {"pullback_long": pullback_long, "reset_short": reset_short},
+            "longshort": {"direzione": direzione, "score": score, "motivi": motivi},
+            "spiegazione": spiegazione,
+            "entrate": entrate,
+            "uscite": uscite,
+            "scenari_attivi": scenari_attivi,
+            "grafici": grafici,
+            "trend_tf": trend_tf,
+            "trend_tf_score": trend_tf_score,
+        }
+        payload: Dict[str, Any] = {
+            "ok": True,
+            "coin": coin,
+            "timeframes": tf_list,
+            "tipo": tipo,
+            "prezzo": prezzo,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "score": score_100,
+            "fields": sorted(fields),
+        }
+        for section in ANALISI_SECTIONS:
+            if section in fields:
+                payload.update({k: values[k] for k in ANALISI_SECTIONS[section]})
+        if debug == 1:
+            payload["debug"] = dbg
+        return payload
+
     payload = {
         "ok": True,
         "coin": coin,
@@ -602,15 +1226,185 @@ def _analisi_light_core(coin: str, timeframes: str, tipo: str, debug: int):
         payload["debug"] = dbg
     return payload
 
+# =====================================================
+#  Cache risultati analisi_light (stale-while-revalidate)
+# =====================================================
+# 0 = cache disattivata
+ANALISI_CACHE_MAX_ENTRIES = _env_int("ANALISI_CACHE_MAX_ENTRIES", 256)
+
+# oltre questa età un risultato è stale anche se la barra non è cambiata (prezzo/delta si muovono)
+ANALISI_CACHE_MAX_AGE_SEC = _env_int("ANALISI_CACHE_MAX_AGE_SEC", 60)
+
+# fino a questa età uno stale si serve subito rinfrescandolo in background; oltre si ricalcola in linea
+ANALISI_CACHE_STALE_MAX_SEC = _env_int("ANALISI_CACHE_STALE_MAX_SEC", 900)
+
+# thread dedicati ai refresh: non usano _fetch_pool, su cui il refresh stesso resta in attesa
+ANALISI_REFRESH_WORKERS = _env_int("ANALISI_REFRESH_WORKERS", 2)
+
+_refresh_pool = ThreadPoolExecutor(max_workers=max(1, ANALISI_REFRESH_WORKERS), thread_name_prefix="analisi")
+
+def _split_tfs(timeframes: str) -> List[str]:
+    """TF unici nell'ordine del chiamante: 1h,15m,1h -> [1h, 15m]."""
+    return list(dict.fromkeys(t.strip() for t in (timeframes or "").split(",") if t.strip()))
+
+def _normalize_tfs(tfs: List[str]) -> Tuple[str, ...]:
+    """Insieme di TF per la chiave di cache, ordinato per durata: [1h, 15m] -> (15m, 1h)."""
+    return tuple(sorted(tfs, key=lambda tf: (_tf_to_ms(tf), tf)))
+
+def _for_caller(payload: Dict[str, Any], coin: str, tfs: List[str]) -> Dict[str, Any]:
+    """Payload in cache -> copia superficiale con coin e ordine dei TF di questo chiamante."""
+    if payload.get("coin") == coin and payload.get("timeframes") == tfs:
+        return payload
+    out = dict(payload)
+    out["coin"] = coin
+    out["timeframes"] = tfs
+    holders = [out]
+    if isinstance(out.get("risposte"), dict):
+        out["risposte"] = dict(out["risposte"])
+        holders.append(out["risposte"])
+    for h in holders:
+        for k in ("trend_tf", "trend_tf_score"):
+            if isinstance(h.get(k), dict):
+                h[k] = {tf: h[k][tf] for tf in tfs if tf in h[k]}
+    return out
+
+def _last_closed_bar_ms(tf: str, now_ms: int) -> int:
+    step = _tf_to_ms(tf)
+    return (now_ms // step) * step - step
+
+class _ResultCache:
+    """
+    Payload per chiave + ultima barra chiusa del TF più piccolo.
+
+    - stessa barra e più giovane di max_age: hit
+    - barra cambiata o scaduto, ma entro stale_max: serve lo stale e rinfresca in background
+    - altrimenti (o assente): calcolo in linea
+    Un solo calcolo per chiave alla volta: chi arriva nel frattempo attende lo stesso Future.
+    """
+
+    def __init__(self, max_entries: int = ANALISI_CACHE_MAX_ENTRIES,
+                 max_age_sec: float = ANALISI_CACHE_MAX_AGE_SEC,
+                 stale_max_sec: float = ANALISI_CACHE_STALE_MAX_SEC) -> None:
+        self.max_entries = int(max_entries)
+        self.max_age_sec = float(max_age_sec)
+        self.stale_max_sec = float(stale_max_sec)
+        self._lock = threading.Lock()
+        self._d: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[Any, ...], Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0   # refresh in background falliti (resta servito lo stale)
+        self.miss_errors = 0      # calcoli in linea falliti (errore propagato al client)
+        self._refresh_ms = 0.0
+        self._refresh_max_ms = 0.0
+
+    def get(self, key: Tuple[Any, ...], bar_ms: int, compute) -> Tuple[Any, str]:
+        """Ritorna (payload, 'hit' | 'stale' | 'miss')."""
+        now = time.time()
+        with self._lock:
+            e = self._d.get(key)
+            if e is not None:
+                self._d.move_to_end(key)
+                age = now - e["at"]
+                if e["bar"] == bar_ms and age < self.max_age_sec:
+                    self.hits += 1
+                    return e["value"], "hit"
+                if age < self.stale_max_sec:
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        fut: Future = Future()
+                        self._inflight[key] = fut
+                        _refresh_pool.submit(self._run, key, bar_ms, compute, fut, True)
+                    return e["value"], "stale"
+            self.misses += 1
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[key] = fut
+        if owner:
+            self._run(key, bar_ms, compute, fut, False)
+        return fut.result(), "miss"
+
+    def _run(self, key: Tuple[Any, ...], bar_ms: int, compute, fut: Future, background: bool) -> None:
+        t0 = time.perf_counter()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                if background:
+                    self.refresh_errors += 1
+                else:
+                    self.miss_errors += 1
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            return
+        ms = (time.perf_counter() - t0) * 1e3
+        with self._lock:
+            self._d[key] = {"value": value, "bar": bar_ms, "at": time.time()}
+            self._d.move_to_end(key)
+            while len(self._d) > self.max_entries:
+                self._d.popitem(last=False)
+            self.refreshes += 1
+            self._refresh_ms += ms
+            self._refresh_max_ms = max(self._refresh_max_ms, ms)
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tot = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._d),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / tot, 4) if tot else 0.0,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "miss_errors": self.miss_errors,
+                "refresh_avg_ms": round(self._refresh_ms / self.refreshes, 1) if self.refreshes else 0.0,
+                "refresh_max_ms": round(self._refresh_max_ms, 1),
+            }
+
+_analisi_cache = _ResultCache()
+
 @app.get("/api/analisi_light")
 @app.get("/api/analisi_light/")
 def analisi_light_api(
     coin: str,
     timeframes: str = Query(..., description="Lista separata da virgole, es: 15m,1h,4h,1d"),
     tipo: str = Query("Analisi Tecnica Avanzata"),
-    debug: int = Query(0, description="Se 1, include informazioni di debug")
-) -> Dict[str, Any]:
-    return _analisi_light_core(coin, timeframes, tipo, debug)
+    debug: int = Query(0, description="Se 1, include informazioni di debug"),
+    compact: int = Query(0, description="Se 1, payload senza alias legacy (sezioni: delta, sr, longshort)"),
+    fields: Optional[str] = Query(None, description="Sezioni da calcolare: delta,sr,scenari,longshort,trades,grafici,trend"),
+):
+    sections = _parse_fields(compact, fields)
+    tfs = _split_tfs(timeframes)
+    if debug == 1 or not tfs or _analisi_cache.max_entries <= 0:
+        # payload già fatto di tipi base: niente jsonable_encoder, direttamente orjson
+        return FastJSONResponse(_analisi_light_core(coin, timeframes, tipo, debug, sections))
+
+    tf_key = _normalize_tfs(tfs)
+    key = (coin.strip().upper(), tf_key, tipo, sections)
+    bar_ms = _last_closed_bar_ms(tf_key[0], int(time.time() * 1000))
+    payload, status = _analisi_cache.get(
+        key, bar_ms, lambda: _analisi_light_core(coin, ",".join(tfs), tipo, 0, sections)
+    )
+    return FastJSONResponse(_for_caller(payload, coin, tfs), headers={"X-Cache": status})
+
+@app.get("/api/metrics")
+def api_metrics() -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "responses": _resp_metrics.stats(),
+        "ohlcv_cache": _ohlcv_cache.stats(),
+        "analisi_cache": _analisi_cache.stats(),
+        "ts": datetime.now(timezone.utc).isoformat(),
+    }
 
 # --- Indice API ---
 @app.get("/")
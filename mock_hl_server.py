@@ -0,0 +1,155 @@
+# tools/mock_hl_server.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ohlcv_resample import TF_MS
+
+# ----------------------------
+# CONFIG (env MOCK_HL_*)
+# ----------------------------
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name, str(default)) or str(default)).strip())
+    except Exception:
+        return default
+
+@dataclass
+class MockConfig:
+    latency_ms: float = _env_float("MOCK_HL_LATENCY_MS", 30.0)
+    page_limit: int = int(_env_float("MOCK_HL_PAGE_LIMIT", 5000))   # candle max per risposta
+    rate_429: float = _env_float("MOCK_HL_429_RATE", 0.0)           # prob. 429 per richiesta
+    retry_after_sec: float = _env_float("MOCK_HL_RETRY_AFTER", 1.0)
+    missing_rate: float = _env_float("MOCK_HL_MISSING_RATE", 0.0)   # prob. pagina vuota (transitoria)
+    now_ms: int = 0                                                 # 0 = orologio reale
+    seed: int = int(_env_float("MOCK_HL_SEED", 7))
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    served_candles: int = 0
+    rate_limited: int = 0
+    missing_pages: int = 0
+    bad_requests: int = 0
+    by_coin: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "served_candles": self.served_candles,
+            "rate_limited": self.rate_limited,
+            "missing_pages": self.missing_pages,
+            "bad_requests": self.bad_requests,
+        }
+
+def _coin_base(coin: str) -> float:
+    h = int(hashlib.sha1(coin.encode("utf-8")).hexdigest()[:8], 16)
+    # prezzi da 0.001 (stile kPEPE/PENGU) a ~10k (stile BTC)
+    return float(10 ** ((h % 700) / 100.0 - 3))
+
+def synthetic_candles(coin: str, tf: str, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+    """Candle deterministiche per (coin, tf): stesso input -> stessi valori, sempre."""
+    step = TF_MS[tf]
+    first = int(start_ms) - (int(start_ms) % step)
+    if first < int(start_ms):
+        first += step
+    ts = np.arange(first, int(end_ms) + 1, step, dtype=np.int64)
+    if ts.shape[0] == 0:
+        z = np.zeros(0, dtype=np.float64)
+        return {"ts": ts, "open": z, "high": z, "low": z, "close": z, "volume": z}
+
+    k = (ts // step).astype(np.float64)
+    base = _coin_base(coin)
+    px = lambda kk: base * (1.0 + 0.02 * np.sin(kk / 50.0) + 0.004 * np.sin(kk * 1.7))  # noqa: E731
+    close = px(k)
+    open_ = px(k - 1.0)
+    high = np.maximum(open_, close) * 1.0005
+    low = np.minimum(open_, close) * 0.9995
+    vol = 1000.0 + (ts // step % 97).astype(np.float64)
+    return {"ts": ts, "open": open_, "high": high, "low": low, "close": close, "volume": vol}
+
+def make_app(cfg: MockConfig | None = None) -> FastAPI:
+    """App FastAPI che imita POST /info type=candleSnapshot di Hyperliquid."""
+    cfg = cfg or MockConfig()
+    rng = random.Random(cfg.seed)
+    stats = MockStats()
+
+    app = FastAPI(title="Mock HL /info")
+    app.state.cfg = cfg
+    app.state.stats = stats
+
+    @app.post("/info")
+    async def info(request: Request):
+        stats.requests += 1
+        if cfg.latency_ms > 0:
+            await asyncio.sleep(cfg.latency_ms / 1000.0)
+
+        try:
+            body = await request.json()
+            req = body.get("req") or {}
+            coin = str(req["coin"])
+            tf = str(req["interval"])
+            start_ms = int(req["startTime"])
+            end_ms = int(req["endTime"])
+        except Exception:
+            stats.bad_requests += 1
+            return JSONResponse({"error": "bad request"}, status_code=400)
+        if body.get("type") != "candleSnapshot" or tf not in TF_MS:
+            stats.bad_requests += 1
+            return JSONResponse({"error": "unsupported"}, status_code=400)
+
+        if cfg.rate_429 > 0 and rng.random() < cfg.rate_429:
+            stats.rate_limited += 1
+            return JSONResponse(
+                {"error": "rate limited"},
+                status_code=429,
+                headers={"Retry-After": str(cfg.retry_after_sec)},
+            )
+        if cfg.missing_rate > 0 and rng.random() < cfg.missing_rate:
+            stats.missing_pages += 1
+            return JSONResponse([])
+
+        now_ms = cfg.now_ms or int(time.time() * 1000)
+        a = synthetic_candles(coin, tf, start_ms, min(end_ms, now_ms))
+        n = a["ts"].shape[0]
+        if n > cfg.page_limit:
+            a = {k: v[-cfg.page_limit:] for k, v in a.items()}
+            n = cfg.page_limit
+
+        step = TF_MS[tf]
+        out = [
+            {
+                "t": int(t), "T": int(t) + step - 1, "s": coin, "i": tf,
+                "o": repr(o), "c": repr(c), "h": repr(h), "l": repr(l), "v": repr(v), "n": 1,
+            }
+            for t, o, h, l, c, v in zip(
+                a["ts"].tolist(), a["open"].tolist(), a["high"].tolist(),
+                a["low"].tolist(), a["close"].tolist(), a["volume"].tolist(),
+            )
+        ]
+        stats.served_candles += n
+        stats.by_coin[coin] = stats.by_coin.get(coin, 0) + 1
+        return JSONResponse(out)
+
+    @app.get("/stats")
+    def get_stats() -> Dict[str, Any]:
+        return stats.as_dict()
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # HYPERLIQUID_REST_URL=http://127.0.0.1:8900 per puntare hyper_rest qui
+    uvicorn.run(make_app(), host="127.0.0.1", port=int(os.environ.get("PORT", "8900")))
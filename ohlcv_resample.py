@@ -0,0 +1,203 @@
+# backend/orione/ohlcv_resample.py
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# TF derivabili da 1m (bucket allineati all'epoch UTC, come i candle HL)
+TF_MS: Dict[str, int] = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "2h": 2 * 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+}
+
+DERIVABLE_TFS = ("3m", "5m", "15m", "1h", "4h", "1d")
+
+OHLCV_KEYS = ("ts", "open", "high", "low", "close", "volume")
+
+def tf_to_ms(tf: str) -> int:
+    t = (tf or "").strip().lower()
+    if t not in TF_MS:
+        raise ValueError(f"tf non supportato: {tf!r}")
+    return TF_MS[t]
+
+def bucket_start(ts_ms: int, tf: str) -> int:
+    """Inizio del bucket (ms) che contiene ts_ms."""
+    step = tf_to_ms(tf)
+    return int(ts_ms) - (int(ts_ms) % step)
+
+def cover_range(start_ms: int, end_ms: int, tfs: Iterable[str]) -> tuple[int, int]:
+    """
+    Estende [start_ms, end_ms] ai confini del TF più grande, così che
+    ogni bucket derivato che inizia nel range abbia tutte le sue 1m.
+    """
+    steps = [tf_to_ms(tf) for tf in tfs] or [TF_MS["1m"]]
+    step = max(steps)
+    s = int(start_ms) - (int(start_ms) % step)
+    e = int(end_ms) - (int(end_ms) % step) + step - 1
+    return s, e
+
+def _as_arrays(ts, o, h, l, c, v) -> Dict[str, np.ndarray]:
+    ts_a = np.asarray(ts, dtype=np.int64)
+    n = ts_a.shape[0]
+    out = {
+        "ts": ts_a,
+        "open": np.asarray(o, dtype=np.float64),
+        "high": np.asarray(h, dtype=np.float64),
+        "low": np.asarray(l, dtype=np.float64),
+        "close": np.asarray(c, dtype=np.float64),
+        "volume": np.asarray(v, dtype=np.float64) if v is not None else np.zeros(n, dtype=np.float64),
+    }
+    for k, a in out.items():
+        if a.shape[0] != n:
+            raise ValueError(f"lunghezza colonna {k}={a.shape[0]} != ts={n}")
+
+    if n > 1 and not bool(np.all(ts_a[1:] > ts_a[:-1])):
+        # ordina + dedup (keep last), come _hl_rest_candles_rows
+        order = np.argsort(ts_a, kind="stable")
+        out = {k: a[order] for k, a in out.items()}
+        ts_s = out["ts"]
+        keep = np.r_[ts_s[1:] != ts_s[:-1], True]
+        out = {k: a[keep] for k, a in out.items()}
+    return out
+
+def resample_arrays(
+    ts,
+    o,
+    h,
+    l,
+    c,
+    v=None,
+    *,
+    tf: str,
+    base_tf: str = "1m",
+    only_complete: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Costruisce barre `tf` da barre `base_tf` con una riduzione segmentata
+    (niente loop Python): open=first, high=max, low=min, close=last, volume=sum.
+
+    Ritorna dict di array con chiavi OHLCV_KEYS + "count" (n. barre base per bucket).
+    Con only_complete=True scarta i bucket a cui mancano barre base
+    (es. prima/ultima barra di un range tagliato, o buchi nei dati).
+    """
+    step = tf_to_ms(tf)
+    base = tf_to_ms(base_tf)
+    if step % base != 0 or step < base:
+        raise ValueError(f"{tf} non è multiplo di {base_tf}")
+
+    src = _as_arrays(ts, o, h, l, c, v)
+    n = src["ts"].shape[0]
+    if n == 0:
+        empty = {k: src[k][:0] for k in OHLCV_KEYS}
+        empty["count"] = np.zeros(0, dtype=np.int64)
+        return empty
+
+    if step == base:
+        out = dict(src)
+        out["count"] = np.ones(n, dtype=np.int64)
+        return out
+
+    buckets = src["ts"] - (src["ts"] % step)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], n]
+
+    out = {
+        "ts": buckets[starts],
+        "open": src["open"][starts],
+        "high": np.maximum.reduceat(src["high"], starts),
+        "low": np.minimum.reduceat(src["low"], starts),
+        "close": src["close"][ends - 1],
+        "volume": np.add.reduceat(src["volume"], starts),
+        "count": (ends - starts).astype(np.int64),
+    }
+
+    if only_complete:
+        full = out["count"] == (step // base)
+        out = {k: a[full] for k, a in out.items()}
+
+    return out
+
+def derive_many(
+    ts,
+    o,
+    h,
+    l,
+    c,
+    v=None,
+    *,
+    tfs: Iterable[str] = DERIVABLE_TFS,
+    base_tf: str = "1m",
+    only_complete: bool = False,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """Deriva più TF dalla stessa serie base (la serie viene normalizzata una volta sola)."""
+    src = _as_arrays(ts, o, h, l, c, v)
+    res: Dict[str, Dict[str, np.ndarray]] = {}
+    for tf in tfs:
+        res[tf] = resample_arrays(
+            src["ts"], src["open"], src["high"], src["low"], src["close"], src["volume"],
+            tf=tf,
+            base_tf=base_tf,
+            only_complete=only_complete,
+        )
+    return res
+
+def resample_df(df, tf: str, *, base_tf: str = "1m", only_complete: bool = False):
+    """
+    Variante pandas: df con colonne timestamp (ms) / open / high / low / close [/ volume].
+    Ritorna un DataFrame con le stesse colonne standard.
+    """
+    import pandas as pd
+
+    cols = {str(c).lower().strip(): c for c in df.columns}
+    ts_col = None
+    for k in ("timestamp", "timestamp_ms", "ts", "ts_ms", "time", "t"):
+        if k in cols:
+            ts_col = cols[k]
+            break
+    if ts_col is None:
+        raise ValueError("resample_df: manca colonna timestamp")
+
+    vol = df[cols["volume"]].to_numpy(dtype=np.float64) if "volume" in cols else None
+    r = resample_arrays(
+        df[ts_col].to_numpy(dtype=np.int64),
+        df[cols["open"]].to_numpy(dtype=np.float64),
+        df[cols["high"]].to_numpy(dtype=np.float64),
+        df[cols["low"]].to_numpy(dtype=np.float64),
+        df[cols["close"]].to_numpy(dtype=np.float64),
+        vol,
+        tf=tf,
+        base_tf=base_tf,
+        only_complete=only_complete,
+    )
+    return pd.DataFrame({
+        "timestamp": r["ts"],
+        "open": r["open"],
+        "high": r["high"],
+        "low": r["low"],
+        "close": r["close"],
+        "volume": r["volume"],
+    })
+
+def slice_range(arrs: Dict[str, np.ndarray], start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+    """Taglia un dict di colonne a ts in [start_ms, end_ms] (ts ordinati)."""
+    ts = arrs["ts"]
+    i0 = int(np.searchsorted(ts, int(start_ms), side="left"))
+    i1 = int(np.searchsorted(ts, int(end_ms), side="right"))
+    return {k: a[i0:i1] for k, a in arrs.items()}
+
+def derivable_from_1m(tfs: Iterable[str]) -> List[str]:
+    """TF (diversi da 1m) che si possono ricostruire da 1m."""
+    out: List[str] = []
+    for tf in tfs:
+        t = (tf or "").strip().lower()
+        if t != "1m" and t in TF_MS:
+            out.append(t)
+    return out
@@ -12,10 +12,16 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional, Sequence, Set, TypedDict, Tuple
 
+import numpy as np
+
 import pandas as pd
 
 import time
 
+import threading
+
+from collections import OrderedDict
+
 import json
 
 import os
@@ -949,7 +955,7 @@ def _dbg_engulfing_last(df: pd.DataFrame, strict: Dict[str, Any], i: int) -> Dic
         out["ok"] = True
     return out
 
-def _detect_engulfing(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_engulfing(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     c = df["close"].astype(float)
     h = df["high"].astype(float)
@@ -959,7 +965,7 @@ def _detect_engulfing(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternH
     if len(df) < 2:
         return hits
 
-    for i in range(1, len(df)):
+    for i in range(max(1, int(start)), len(df)):
         o1, c1, h1, l1 = float(o.iloc[i - 1]), float(c.iloc[i - 1]), float(h.iloc[i - 1]), float(l.iloc[i - 1])
         o2, c2, h2, l2 = float(o.iloc[i]), float(c.iloc[i]), float(h.iloc[i]), float(l.iloc[i])
 
@@ -1086,7 +1092,7 @@ def _dbg_shooting_last(df: pd.DataFrame, strict: Dict[str, Any], i: int) -> Dict
         out["ok"] = True
     return out
 
-def _detect_hammer(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_hammer(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1096,7 +1102,7 @@ def _detect_hammer(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]
     if df.empty:
         return hits
 
-    for i in range(len(df)):
+    for i in range(max(0, int(start)), len(df)):
         open_ = float(o.iloc[i]); high = float(h.iloc[i]); low = float(l.iloc[i]); close = float(c.iloc[i])
 
         rng = _rng(high, low)
@@ -1140,7 +1146,7 @@ def _detect_hammer(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]
     return hits
 
 
-def _detect_shooting_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_shooting_star(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1150,7 +1156,7 @@ def _detect_shooting_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patt
     if df.empty:
         return hits
 
-    for i in range(len(df)):
+    for i in range(max(0, int(start)), len(df)):
         open_ = float(o.iloc[i]); high = float(h.iloc[i]); low = float(l.iloc[i]); close = float(c.iloc[i])
 
         rng = _rng(high, low)
@@ -1193,7 +1199,7 @@ def _detect_shooting_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patt
 
     return hits
 
-def _detect_break_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_break_high_low(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0, last_hit_i: int = -10_000) -> List[PatternHit]:
     h = df["high"].astype(float)
     l = df["low"].astype(float)
     c = df["close"].astype(float)
@@ -1219,9 +1225,7 @@ def _detect_break_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Pat
         float(strict.get("THIRD_MIN_STRENGTH_BREAK", 0.0)),
     ))
 
-    last_hit_i = -10_000
-
-    for i in range(len(df)):
+    for i in range(max(0, int(start)), len(df)):
         if i - lb < 0:
             continue
         if (i - last_hit_i) <= cooldown_bars:
@@ -1353,7 +1357,7 @@ def _detect_break_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Pat
 # REJECTION HIGH/LOW (strict sweep + re-entry) + strength “vera”
 # ---------------------------------------------------------------------------
 
-def _detect_rejection_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_rejection_high_low(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0, last_hit_i: int = -10_000) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1374,9 +1378,7 @@ def _detect_rejection_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List
     # evita spam su barre contigue
     cooldown_bars = int(strict.get("REJ_COOLDOWN_BARS", 2))
 
-    last_hit_i = -10_000
-
-    for i in range(1, len(df)):
+    for i in range(max(1, int(start)), len(df)):
         if (i - last_hit_i) <= cooldown_bars:
             continue
 
@@ -1500,7 +1502,7 @@ def _detect_rejection_high_low(df: pd.DataFrame, strict: Dict[str, Any]) -> List
 # MORNING / EVENING STAR
 # ---------------------------------------------------------------------------
 
-def _detect_morning_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_morning_star(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1513,7 +1515,7 @@ def _detect_morning_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patte
     lookback = int(strict["TREND_LOOKBACK"])
     trend_min = float(strict["STAR_TREND_MIN_PCT"])
 
-    for i in range(2, len(df)):
+    for i in range(max(2, int(start)), len(df)):
         o1, c1, h1, l1 = float(o.iloc[i - 2]), float(c.iloc[i - 2]), float(h.iloc[i - 2]), float(l.iloc[i - 2])
         o2, c2, h2, l2 = float(o.iloc[i - 1]), float(c.iloc[i - 1]), float(h.iloc[i - 1]), float(l.iloc[i - 1])
         o3, c3, h3, l3 = float(o.iloc[i]), float(c.iloc[i]), float(h.iloc[i]), float(l.iloc[i])
@@ -1562,7 +1564,7 @@ def _detect_morning_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patte
     return hits
 
 
-def _detect_evening_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_evening_star(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1575,7 +1577,7 @@ def _detect_evening_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patte
     lookback = int(strict["TREND_LOOKBACK"])
     trend_min = float(strict["STAR_TREND_MIN_PCT"])
 
-    for i in range(2, len(df)):
+    for i in range(max(2, int(start)), len(df)):
         o1, c1, h1, l1 = float(o.iloc[i - 2]), float(c.iloc[i - 2]), float(h.iloc[i - 2]), float(l.iloc[i - 2])
         o2, c2, h2, l2 = float(o.iloc[i - 1]), float(c.iloc[i - 1]), float(h.iloc[i - 1]), float(l.iloc[i - 1])
         o3, c3, h3, l3 = float(o.iloc[i]), float(c.iloc[i]), float(h.iloc[i]), float(l.iloc[i])
@@ -1633,7 +1635,7 @@ def _detect_evening_star(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patte
 # PIERCING LINE
 # ---------------------------------------------------------------------------
 
-def _detect_piercing_line(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_piercing_line(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1643,7 +1645,7 @@ def _detect_piercing_line(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patt
     if len(df) < 2:
         return hits
 
-    for i in range(1, len(df)):
+    for i in range(max(1, int(start)), len(df)):
         o1, c1, h1, l1 = float(o.iloc[i - 1]), float(c.iloc[i - 1]), float(h.iloc[i - 1]), float(l.iloc[i - 1])
         o2, c2, h2, l2 = float(o.iloc[i]), float(c.iloc[i]), float(h.iloc[i]), float(l.iloc[i])
 
@@ -1701,7 +1703,7 @@ def _detect_piercing_line(df: pd.DataFrame, strict: Dict[str, Any]) -> List[Patt
 # DARK CLOUD COVER
 # ---------------------------------------------------------------------------
 
-def _detect_dark_cloud_cover(df: pd.DataFrame, strict: Dict[str, Any]) -> List[PatternHit]:
+def _detect_dark_cloud_cover(df: pd.DataFrame, strict: Dict[str, Any], *, start: int = 0) -> List[PatternHit]:
     o = df["open"].astype(float)
     h = df["high"].astype(float)
     l = df["low"].astype(float)
@@ -1714,7 +1716,7 @@ def _detect_dark_cloud_cover(df: pd.DataFrame, strict: Dict[str, Any]) -> List[P
     lookback = int(strict["TREND_LOOKBACK"])
     trend_min = float(strict["STAR_TREND_MIN_PCT"])
 
-    for i in range(1, len(df)):
+    for i in range(max(1, int(start)), len(df)):
         o1, c1, h1, l1 = float(o.iloc[i - 1]), float(c.iloc[i - 1]), float(h.iloc[i - 1]), float(l.iloc[i - 1])
         o2, c2, h2, l2 = float(o.iloc[i]), float(c.iloc[i]), float(h.iloc[i]), float(l.iloc[i])
 
@@ -2503,4 +2505,279 @@ def detect_pattern_indices(
         except Exception:
             pass
 
-    return expanded
\ No newline at end of file
+    return expanded
+
+# ---------------------------------------------------------------------------
+# FORMING: valutazione della candela in formazione (hit provvisorie)
+# - la finestra delle barre chiuse (FORMING_WINDOW_BARS, sufficiente per trend context /
+#   lookback dei pattern candlestick e break/rejection) viene tenuta per (coin, tf):
+#   colonne numpy + contesto delle barre chiuse (_forming_context: ultima hit
+#   break/rejection per il cooldown), calcolati una volta quando chiude una barra
+# - a ogni tick si valuta solo l'ultima riga: i detector girano con start=ultimo indice
+#   (il lookback legge la finestra, il cooldown arriva dal contesto), niente ricalcolo
+#   delle barre chiuse
+# - una hit provvisoria resta attiva finché la barra non chiude (CLOSED) o le
+#   condizioni smettono di valere (FAILED); entrambi gli stati vengono emessi una volta
+# ---------------------------------------------------------------------------
+
+FORMING_PATTERNS: List[str] = [
+    ENGULFING,
+    HAMMER,
+    SHOOTING_STAR,
+    PIERCING_LINE,
+    DARK_CLOUD_COVER,
+    MORNING_STAR,
+    EVENING_STAR,
+    BREAK_HIGH,
+    BREAK_LOW,
+    REJECTION_HIGH,
+    REJECTION_LOW,
+]
+
+FORMING_WINDOW_BARS = _env_int("ORIONE_FORMING_WINDOW_BARS", 60)
+
+# oltre questa frazione di barra trascorsa lo stato passa a NEAR_COMPLETE
+FORMING_NEAR_COMPLETE = 0.8
+
+# FormingTracker: finestre chiuse tenute (coin, tf) e stati client (client, coin, tf), LRU
+FORMING_MAX_SERIES = _env_int("ORIONE_FORMING_MAX_SERIES", 512)
+FORMING_MAX_CLIENT_STATES = _env_int("ORIONE_FORMING_MAX_CLIENT_STATES", 4096)
+
+_FORMING_COLS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+def _tf_ms_forming(tf: Optional[str]) -> int:
+    t = (tf or "").strip().lower()
+    mult = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}.get(t[-1:], 60_000)
+    try:
+        return int(t[:-1]) * mult
+    except Exception:
+        return 60_000
+
+
+def _forming_base(pat: str) -> str:
+    p = str(pat or "").lower().strip()
+    for suf in ("_raw", "_confirmed"):
+        if p.endswith(suf):
+            return p[: -len(suf)]
+    return p
+
+
+def _forming_context(closed: pd.DataFrame, timeframe: Optional[str]) -> Dict[str, int]:
+    """Ultima hit break/rejection sulle barre chiuse (seed del cooldown per l'ultima barra)."""
+    strict = _strict_for_tf(timeframe)
+    ctx = {"brk_last_hit": -10_000, "rej_last_hit": -10_000}
+    if closed is None or closed.empty:
+        return ctx
+    brk = _detect_break_high_low(closed, strict)
+    rej = _detect_rejection_high_low(closed, strict)
+    if brk:
+        ctx["brk_last_hit"] = max(int(h["index"]) for h in brk)
+    if rej:
+        ctx["rej_last_hit"] = max(int(h["index"]) for h in rej)
+    return ctx
+
+
+def _forming_last_hits(
+    df: pd.DataFrame,
+    timeframe: Optional[str],
+    patterns_to_check: Optional[Sequence[str]],
+    ctx: Dict[str, int],
+) -> List[PatternHit]:
+    """Hit dei FORMING_PATTERNS sulla sola ultima riga di df (df = barre chiuse + formazione)."""
+    strict = _strict_for_tf(timeframe)
+    active = _resolve_patterns(patterns_to_check or FORMING_PATTERNS)
+    n = len(df)
+    i = n - 1
+    hits: List[PatternHit] = []
+    for pat, fn, min_len in (
+        (ENGULFING, _detect_engulfing, 2),
+        (HAMMER, _detect_hammer, 1),
+        (SHOOTING_STAR, _detect_shooting_star, 1),
+        (PIERCING_LINE, _detect_piercing_line, 2),
+        (DARK_CLOUD_COVER, _detect_dark_cloud_cover, 2),
+        (MORNING_STAR, _detect_morning_star, 3),
+        (EVENING_STAR, _detect_evening_star, 3),
+    ):
+        if pat in active and n >= min_len:
+            hits.extend(fn(df, strict, start=i))
+    if (BREAK_HIGH in active) or (BREAK_LOW in active):
+        hits.extend(_detect_break_high_low(df, strict, start=i, last_hit_i=int(ctx.get("brk_last_hit", -10_000))))
+    if (REJECTION_HIGH in active) or (REJECTION_LOW in active):
+        hits.extend(_detect_rejection_high_low(df, strict, start=i, last_hit_i=int(ctx.get("rej_last_hit", -10_000))))
+    return hits
+
+
+def _forming_results(
+    hits: List[PatternHit],
+    timeframe: Optional[str],
+    *,
+    bar_ts: int,
+    now_ms: Optional[int],
+) -> List[Dict[str, Any]]:
+    tf_ms = _tf_ms_forming(timeframe)
+    now = int(now_ms) if now_ms is not None else int(time.time() * 1000)
+    completion = min(1.0, max(0.0, (now - bar_ts) / tf_ms)) if bar_ts else 0.0
+    state = "NEAR_COMPLETE" if completion >= FORMING_NEAR_COMPLETE else "FORMING"
+
+    out: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for h in sorted(hits, key=lambda h: -float(h.get("strength") or 0.0)):
+        d = (h.get("direction") or "").upper()
+        direction = "bullish" if d == "BULL" else "bearish" if d == "BEAR" else "neutral"
+        base = _forming_base(str(h.get("pattern") or h.get("name") or ""))
+        if (base, direction) in out:
+            continue
+        out[(base, direction)] = {
+            "pattern": base,
+            "tf": timeframe,
+            "direction": direction,
+            "strength": float(h.get("strength") or 0.0),
+            "completion": round(completion, 3),
+            "state": state,
+            "bar_ts": bar_ts,
+            "provisional": True,
+        }
+    return list(out.values())
+
+
+def detect_forming(
+    data: Any,
+    timeframe: Optional[str] = None,
+    *,
+    coin: Optional[str] = None,
+    patterns_to_check: Optional[Sequence[str]] = None,
+    now_ms: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hit provvisorie sull'ultima riga di `data` (= barra in formazione), senza stato.
+    Ogni hit: pattern, direction (bullish/bearish), completion (0..1), state, bar_ts, strength.
+    Valuta solo FORMING_PATTERNS. Senza stato il contesto delle barre chiuse va
+    ricalcolato a ogni chiamata: per i tick ripetuti usare FormingTracker.
+    """
+    try:
+        df = _to_df(data)
+    except Exception:
+        return []
+    if df is None or df.empty:
+        return []
+    df = df.tail(max(3, int(FORMING_WINDOW_BARS))).reset_index(drop=True)
+    try:
+        bar_ts = int(df["timestamp"].iloc[-1])
+    except Exception:
+        bar_ts = 0
+    ctx = _forming_context(df.iloc[:-1], timeframe)
+    hits = _forming_last_hits(df, timeframe, patterns_to_check, ctx)
+    return _forming_results(hits, timeframe, bar_ts=bar_ts, now_ms=now_ms)
+
+
+class FormingTracker:
+    """
+    Stato tra un tick e l'altro, thread-safe:
+    - set_closed(): finestra delle barre chiuse per (coin, tf), condivisa
+      (aggiornata solo quando chiude una barra)
+    - update(): valuta la barra in formazione sopra quella finestra; con `client`
+      segue le hit attive di quel client ed emette CLOSED / FAILED una volta per
+      client, senza `client` ritorna solo le hit correnti (FORMING / NEAR_COMPLETE)
+    Finestre e stati client sono LRU (FORMING_MAX_SERIES / FORMING_MAX_CLIENT_STATES).
+    """
+
+    def __init__(
+        self,
+        patterns_to_check: Optional[Sequence[str]] = None,
+        window_bars: int = FORMING_WINDOW_BARS,
+        *,
+        max_series: int = FORMING_MAX_SERIES,
+        max_client_states: int = FORMING_MAX_CLIENT_STATES,
+    ) -> None:
+        self.patterns = list(patterns_to_check) if patterns_to_check else list(FORMING_PATTERNS)
+        self.window_bars = max(3, int(window_bars))
+        self.max_series = max(1, int(max_series))
+        self.max_client_states = max(1, int(max_client_states))
+        self._lock = threading.Lock()
+        self._closed: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._active: "OrderedDict[Tuple[str, str, str], Dict[Tuple[str, str], Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _lru_put(d: "OrderedDict[Any, Any]", key: Any, value: Any, cap: int) -> None:
+        d[key] = value
+        d.move_to_end(key)
+        while len(d) > cap:
+            d.popitem(last=False)
+
+    def closed_last_ts(self, coin: str, tf: str) -> Optional[int]:
+        with self._lock:
+            w = self._closed.get((coin, tf))
+        return int(w["timestamp"][-1]) if w is not None and len(w["timestamp"]) else None
+
+    def set_closed(self, coin: str, tf: str, data: Any) -> None:
+        df = _to_df(data).tail(self.window_bars - 1).reset_index(drop=True)
+        w: Dict[str, Any] = {}
+        for k in _FORMING_COLS:
+            if k in df.columns:
+                w[k] = df[k].to_numpy(dtype="int64" if k == "timestamp" else "float64", copy=True)
+        w["_ctx"] = _forming_context(df, tf)
+        # la finestra non viene più modificata dopo l'inserimento: i lettori la usano fuori dal lock
+        with self._lock:
+            self._lru_put(self._closed, (coin, tf), w, self.max_series)
+
+    def _evaluate(self, coin: str, tf: str, w: Dict[str, Any], bar: Dict[str, Any], now_ms: Optional[int]) -> List[Dict[str, Any]]:
+        # solo l'ultima riga è nuova: colonne chiuse + 1 valore, detector con start=ultimo indice
+        cols = {
+            k: np.append(w[k], np.asarray([bar.get(k, 0.0)], dtype=w[k].dtype))
+            for k in _FORMING_COLS
+            if k in w
+        }
+        df = pd.DataFrame(cols)
+        hits = _forming_last_hits(df, tf, self.patterns, w["_ctx"])
+        return _forming_results(hits, tf, bar_ts=int(bar["timestamp"]), now_ms=now_ms)
+
+    def update(
+        self,
+        coin: str,
+        tf: str,
+        bar: Dict[str, Any],
+        *,
+        now_ms: Optional[int] = None,
+        client: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        bar = barra in formazione {timestamp, open, high, low, close[, volume]}.
+        Ritorna le hit attive (FORMING / NEAR_COMPLETE); con `client` anche quelle
+        che per quel client sono appena terminate (CLOSED / FAILED).
+        """
+        bar_ts = int(bar["timestamp"])
+        with self._lock:
+            w = self._closed.get((coin, tf))
+            if w is not None:
+                self._closed.move_to_end((coin, tf))
+
+        # fresca = finisce esattamente sulla barra prima di quella in formazione
+        last_ts = int(w["timestamp"][-1]) if w is not None and len(w["timestamp"]) else None
+        fresh = last_ts is not None and bar_ts - _tf_ms_forming(tf) <= last_ts < bar_ts
+        key = (str(client), coin, tf)
+        if not fresh:
+            # finestra chiusa mancante o non ancora aggiornata: nessuna valutazione,
+            # gli stati del client restano quelli dell'ultimo tick valutato
+            if client is None:
+                return []
+            with self._lock:
+                return list((self._active.get(key) or {}).values())
+
+        cur = {(h["pattern"], h["direction"]): h for h in self._evaluate(coin, tf, w, bar, now_ms)}
+        if client is None:
+            return list(cur.values())
+
+        with self._lock:
+            prev = self._active.get(key) or {}
+            ended: List[Dict[str, Any]] = []
+            # la barra che stavamo seguendo è chiusa: le sue hit provvisorie terminano
+            if prev and any(h["bar_ts"] < bar_ts for h in prev.values()):
+                ended = [dict(h, state="CLOSED") for h in prev.values()]
+                prev = {}
+            ended += [dict(h, state="FAILED") for k, h in prev.items() if k not in cur]
+            self._lru_put(self._active, key, cur, self.max_client_states)
+        return list(cur.values()) + ended
+
+    def active(self, coin: str, tf: str, client: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list((self._active.get((str(client), coin, tf)) or {}).values())
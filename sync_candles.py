@@ -0,0 +1,136 @@
+# tools/sync_candles.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from candle_store import get_store
+from download_hl_ohlcv_range_multi import (
+    DERIVE_FROM_1M,
+    HYPER_PAIRS,
+    MAX_CONCURRENT_JOBS,
+    TFS,
+    _hyper_to_coin_key,
+    fetch_range_batch,
+)
+from hyper_rest import TokenBucket, aclose_client, hl_limiter
+from ohlcv_resample import derivable_from_1m, resample_arrays, tf_to_ms
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+# finestra rolling da tenere aggiornata nello store
+SYNC_DAYS = 90
+
+# HL serve solo le ultime ~5000 candle per TF: i buchi più vecchi non si possono riempire,
+# quindi non li richiediamo a ogni run
+HL_HISTORY_BARS = 5000
+
+# buchi separati da poche barre presenti -> una sola richiesta
+MERGE_GAP_BARS = 30
+
+def _last_closed_open_ms(tf: str, now_ms: int) -> int:
+    step = tf_to_ms(tf)
+    return now_ms - (now_ms % step) - step
+
+async def sync_fetch(
+    *,
+    coin_key: str,
+    tf: str,
+    start_ms: int,
+    end_ms: int,
+    limiter: Optional[TokenBucket],
+) -> Tuple[int, int]:
+    """Scarica solo gli intervalli mancanti nello store. Ritorna (intervalli, barre nuove)."""
+    store = get_store()
+    step = tf_to_ms(tf)
+    fetch_start = max(int(start_ms), int(end_ms) - HL_HISTORY_BARS * step)
+
+    intervals = store.missing_intervals(coin_key, tf, fetch_start, end_ms, merge_gap_bars=MERGE_GAP_BARS)
+    added = 0
+    for a, b in intervals:
+        got = await fetch_range_batch(coin_key=coin_key, tf=tf, start_ms=a, end_ms=b + step - 1, limiter=limiter)
+        if len(got):
+            added += store.write(coin_key, tf, got.columns())
+    return len(intervals), added
+
+def sync_derived(*, coin_key: str, tf: str, start_ms: int, end_ms: int) -> Tuple[int, int]:
+    """Riempie i buchi di `tf` ricostruendo i bucket completi dalle 1m già nello store (no rete)."""
+    store = get_store()
+    step = tf_to_ms(tf)
+
+    intervals = store.missing_intervals(coin_key, tf, start_ms, end_ms)
+    added = 0
+    for a, b in intervals:
+        src = store.read(coin_key, "1m", a, b + step - 1)
+        if len(src["ts"]) == 0:
+            continue
+        r = resample_arrays(
+            src["ts"], src["open"], src["high"], src["low"], src["close"], src["volume"],
+            tf=tf,
+            only_complete=True,
+        )
+        added += store.write(coin_key, tf, r)
+    return len(intervals), added
+
+async def sync_coin(*, label: str, hyper: str, tfs: List[str], limiter: Optional[TokenBucket]) -> None:
+    coin_key = _hyper_to_coin_key(hyper)
+    if not coin_key:
+        print(f"[SKIP] {label} hyper='{hyper}' -> coin_key vuoto")
+        return
+
+    now_ms = int(time.time() * 1000)
+    start_ms = now_ms - SYNC_DAYS * 86_400_000
+
+    fetch_tfs = list(tfs)
+    derived: List[str] = []
+    if DERIVE_FROM_1M:
+        derived = derivable_from_1m(tfs)
+        fetch_tfs = ["1m"]
+
+    for tf in fetch_tfs:
+        t0 = time.perf_counter()
+        n_int, added = await sync_fetch(
+            coin_key=coin_key,
+            tf=tf,
+            start_ms=start_ms,
+            end_ms=_last_closed_open_ms(tf, now_ms),
+            limiter=limiter,
+        )
+        print(f"[SYNC] {label} ({coin_key}) tf={tf} buchi={n_int} nuove={added} {time.perf_counter() - t0:.2f}s")
+
+    for tf in derived:
+        n_int, added = sync_derived(
+            coin_key=coin_key,
+            tf=tf,
+            start_ms=start_ms,
+            end_ms=_last_closed_open_ms(tf, now_ms),
+        )
+        print(f"[SYNC] {label} ({coin_key}) tf={tf} buchi={n_int} nuove={added} (da 1m)")
+
+async def main() -> None:
+    print("[STORE]", get_store().root.resolve(), f"finestra={SYNC_DAYS}d")
+    limiter = hl_limiter()
+    sem = asyncio.Semaphore(max(1, int(MAX_CONCURRENT_JOBS)))
+    t0 = time.perf_counter()
+
+    async def _one(label: str, hyper: str) -> None:
+        async with sem:
+            try:
+                await sync_coin(label=label, hyper=hyper, tfs=list(TFS), limiter=limiter)
+            except Exception as e:
+                print(f"[ERR] {label} ({hyper}) -> {type(e).__name__}: {e}")
+
+    await asyncio.gather(*(_one(label, hyper) for label, hyper in HYPER_PAIRS))
+    print(f"[DONE] {time.perf_counter() - t0:.1f}s")
+
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await aclose_client()
+
+if __name__ == "__main__":
+    asyncio.run(_run())
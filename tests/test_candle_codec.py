@@ -0,0 +1,60 @@
+# tests/test_candle_codec.py
+from __future__ import annotations
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from candle_codec import VOLUME_DECIMALS, decode, encode, infer_decimals  # noqa: E402
+from candle_store import CandleStore  # noqa: E402
+from ohlcv_resample import OHLCV_KEYS, resample_arrays  # noqa: E402
+
+T0 = 1_700_000_000_000 - (1_700_000_000_000 % 86_400_000)
+
+def _synthetic_1m(n: int = 3 * 1440, seed: int = 11):
+    rng = np.random.default_rng(seed)
+    close = np.round(0.0072 + np.cumsum(rng.integers(-3, 4, n)) * 1e-6, 6)
+    close = np.maximum(close, 1e-4)
+    open_ = np.r_[close[0], close[:-1]]
+    return {
+        "ts": T0 + np.arange(n, dtype=np.int64) * 60_000,
+        "open": open_,
+        "high": np.round(np.maximum(open_, close) + rng.integers(0, 3, n) * 1e-6, 6),
+        "low": np.round(np.minimum(open_, close) - rng.integers(0, 3, n) * 1e-6, 6),
+        "close": close,
+        "volume": np.round(rng.uniform(0, 5000, n), 1),
+    }
+
+def test_roundtrip_exact_on_large_prices():
+    for x in ([1234567.891], [123456789.5, 2000000000.25]):
+        a = np.asarray(x)
+        k = infer_decimals(a)
+        cols = {"ts": np.arange(len(x), dtype=np.int64) * 60_000, "open": a, "high": a, "low": a, "close": a,
+                "volume": np.ones(len(x))}
+        back = decode(encode(cols))
+        assert np.array_equal(back["close"], a), k
+
+def test_nan_rejected():
+    with pytest.raises(ValueError):
+        infer_decimals(np.array([1.0, np.nan]))
+
+@pytest.mark.parametrize("tf", ["3m", "5m", "1h"])
+def test_compact_store_accepts_resampled(tmp_path, tf):
+    src = _synthetic_1m()
+    r = resample_arrays(*(src[k] for k in OHLCV_KEYS), tf=tf, only_complete=True)
+    # volumi sommati in float: non decimali esatti
+    with pytest.raises(ValueError):
+        infer_decimals(r["volume"])
+
+    store = CandleStore(tmp_path, codec="compact")
+    assert store.write("PENGU", tf, r) == len(r["ts"])
+    back = store.read("PENGU", tf)
+
+    assert np.array_equal(back["ts"], r["ts"])
+    for k in ("open", "high", "low", "close"):
+        assert np.array_equal(back[k], r[k]), k
+    assert np.allclose(back["volume"], r["volume"], rtol=0, atol=0.5 * 10.0**-VOLUME_DECIMALS)
@@ -0,0 +1,384 @@
+# backend/orione/trade_candles.py
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from hl_stream import Bar, _maybe_await
+from hyper_rest import CandleBatch, _env_int
+from ohlcv_resample import bucket_start, tf_to_ms
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+# attesa oltre il confine del bucket prima di chiudere la barra (trade in ritardo)
+TRADE_LATE_GRACE_MS = _env_int("TRADE_LATE_GRACE_MS", 250)
+
+# tid recenti tenuti per scartare i duplicati (es. dopo una riconnessione WS)
+TRADE_DEDUP_WINDOW = 50_000
+
+BarCloseCallback = Callable[[str, str, Bar], Union[None, Awaitable[None]]]
+
+class _Forming:
+    __slots__ = ("ts", "o", "h", "l", "c", "v", "n", "t0", "t1")
+
+    def __init__(self, ts: int, px: float, sz: float, t: Tuple[int, int] = (0, 0)) -> None:
+        self.ts = ts
+        self.o = self.h = self.l = self.c = px
+        self.v = sz
+        self.n = 1
+        self.t0 = self.t1 = t  # (time, tid) primo / ultimo trade: open e close seguono il time, non l'arrivo
+
+    def add(self, px: float, sz: float, t: Tuple[int, int] = (0, 0)) -> None:
+        if px > self.h:
+            self.h = px
+        if px < self.l:
+            self.l = px
+        if t >= self.t1:
+            self.c, self.t1 = px, t
+        if t < self.t0:
+            self.o, self.t0 = px, t
+        self.v += sz
+        self.n += 1
+
+    def merge(self, b: Bar, t0: Tuple[int, int], t1: Tuple[int, int]) -> None:
+        _, o, h, l, c, v = b
+        if h > self.h:
+            self.h = h
+        if l < self.l:
+            self.l = l
+        if t1 >= self.t1:
+            self.c, self.t1 = c, t1
+        if t0 < self.t0:
+            self.o, self.t0 = o, t0
+        self.v += v
+
+    def bar(self) -> Bar:
+        return (self.ts, self.o, self.h, self.l, self.c, self.v)
+
+class TradeAggregator:
+    """
+    Costruisce barre OHLCV da trade HL ({"coin","px","sz","time","tid",...}) per una coin.
+
+    - base 1m con confini esatti: bucket = time - time % 60_000 (stesso schema delle candle HL)
+    - la barra si chiude appena il tempo (trade o advance(now_ms)) supera fine bucket + grace_ms;
+      fino ad allora i trade in ritardo finiscono nel bucket giusto (grace_ms=0: chiusura immediata)
+    - trade più in ritardo della grace: corretti sulla barra chiusa (late_patched) e notificati
+      via on_bar_revised, così il replay resta identico alle candle REST; open / close seguono il
+      (time, tid) del trade anche qui (più vecchio dell'open -> nuovo open, più nuovo del close -> nuovo close)
+    - TF derivati (es. 5m, 15m) accumulati dalle 1m chiuse; chiusi insieme all'ultima 1m del bucket
+      o, se quella non ha trade, a tempo da advance / flush(now_ms) a fine bucket + grace_ms
+    - bucket senza trade non producono barre
+    """
+
+    def __init__(
+        self,
+        coin: str,
+        tfs: Iterable[str] = ("1m",),
+        *,
+        grace_ms: int = TRADE_LATE_GRACE_MS,
+        on_bar_close: Optional[BarCloseCallback] = None,
+        on_bar_revised: Optional[BarCloseCallback] = None,
+        keep_closed: int = 5000,
+    ) -> None:
+        self.coin = str(coin)
+        self.base_tf = "1m"
+        self.base_ms = tf_to_ms(self.base_tf)
+        self.tfs = [t for t in dict.fromkeys(str(x).lower() for x in tfs) if t != self.base_tf]
+        for t in self.tfs:
+            if tf_to_ms(t) % self.base_ms:
+                raise ValueError(f"tf {t} non multiplo di 1m")
+        self.grace_ms = max(0, int(grace_ms))
+        self.on_bar_close = on_bar_close
+        self.on_bar_revised = on_bar_revised
+
+        self._open: Dict[int, _Forming] = {}        # bucket 1m ancora aperti (al più 2 con grace > 0)
+        self._last_closed: Optional[int] = None
+        self._derived: Dict[str, Optional[_Forming]] = {t: None for t in self.tfs}
+        self.closed: Dict[str, Deque[Bar]] = {t: deque(maxlen=int(keep_closed)) for t in [self.base_tf, *self.tfs]}
+        # (time, tid) di primo / ultimo trade per barra chiusa, allineato a self.closed
+        self._closed_keys: Dict[str, Deque[Tuple[Tuple[int, int], Tuple[int, int]]]] = {
+            t: deque(maxlen=int(keep_closed)) for t in [self.base_tf, *self.tfs]
+        }
+
+        self._seen: Set[int] = set()
+        self._seen_q: Deque[int] = deque()
+        self.trades = 0
+        self.duplicates = 0
+        self.late_patched = 0
+        self.late_dropped = 0
+
+    # ----------------------------
+    # input
+    # ----------------------------
+    def _dup(self, tid: Any) -> bool:
+        if tid is None:
+            return False
+        try:
+            k = int(tid)
+        except Exception:
+            return False
+        if k in self._seen:
+            return True
+        self._seen.add(k)
+        self._seen_q.append(k)
+        if len(self._seen_q) > TRADE_DEDUP_WINDOW:
+            self._seen.discard(self._seen_q.popleft())
+        return False
+
+    async def add_trade(self, t: Dict[str, Any]) -> None:
+        if str(t.get("coin") or self.coin) != self.coin:
+            return
+        try:
+            ts = int(t["time"])
+            px = float(t["px"])
+            sz = float(t["sz"])
+        except Exception:
+            return
+        tid = t.get("tid")
+        if self._dup(tid):
+            self.duplicates += 1
+            return
+        self.trades += 1
+        try:
+            key = (ts, int(tid))
+        except Exception:
+            key = (ts, self.trades)
+
+        b = bucket_start(ts, self.base_tf)
+        # il trade stesso fa avanzare l'orologio: chiude i bucket scaduti
+        await self.advance(ts)
+        cur = self._open.get(b)
+        if cur is not None:
+            cur.add(px, sz, key)
+        elif self._last_closed is not None and b <= self._last_closed:
+            await self._late(b, px, sz, key)
+        else:
+            self._open[b] = _Forming(b, px, sz, key)
+
+    async def on_trade_msg(self, coin: str, t: Dict[str, Any]) -> None:
+        """Adattatore per HLStreamClient(on_trade=...)."""
+        await self.add_trade(t)
+
+    async def advance(self, now_ms: int) -> None:
+        """Chiude (in ordine) le barre il cui bucket + grace è finito prima di now_ms, derivati compresi."""
+        while self._open:
+            b = min(self._open)
+            if int(now_ms) < b + self.base_ms + self.grace_ms:
+                break
+            await self._close_base(self._open.pop(b))
+        # derivato la cui ultima 1m non ha avuto trade: nessuna _close_base lo chiude
+        for tf in self.tfs:
+            d = self._derived[tf]
+            if d is not None and int(now_ms) >= d.ts + tf_to_ms(tf) + self.grace_ms:
+                self._derived[tf] = None
+                await self._emit(tf, d)
+
+    # ----------------------------
+    # chiusura / derivati
+    # ----------------------------
+    async def _emit(self, tf: str, cur: _Forming) -> None:
+        bar = cur.bar()
+        self.closed[tf].append(bar)
+        self._closed_keys[tf].append((cur.t0, cur.t1))
+        if self.on_bar_close is not None:
+            await _maybe_await(self.on_bar_close(self.coin, tf, bar))
+
+    async def _close_base(self, cur: _Forming) -> None:
+        self._last_closed = cur.ts
+        bar = cur.bar()
+        await self._emit(self.base_tf, cur)
+
+        for tf in self.tfs:
+            step = tf_to_ms(tf)
+            b = bucket_start(bar[0], tf)
+            d = self._derived[tf]
+            if d is not None and d.ts != b:
+                self._derived[tf] = None
+                await self._emit(tf, d)
+                d = None
+            if d is None and self.closed[tf] and self.closed[tf][-1][0] == b:
+                # derivato già chiuso a tempo (advance): la 1m arrivata dopo lo corregge
+                await self._revise(tf, bar, cur.t0, cur.t1)
+                continue
+            if d is None:
+                d = _Forming(b, bar[1], 0.0, cur.t0)
+                d.h, d.l = bar[2], bar[3]
+                self._derived[tf] = d
+            d.merge(bar, cur.t0, cur.t1)
+            if bar[0] + self.base_ms >= b + step:
+                # ultima 1m del bucket: chiude subito senza aspettare la successiva
+                self._derived[tf] = None
+                await self._emit(tf, d)
+
+    async def _revise(self, tf: str, bar: Bar, t0: Tuple[int, int], t1: Tuple[int, int]) -> bool:
+        """
+        Unisce `bar` (primo / ultimo trade t0 / t1) alla barra chiusa del suo bucket se ancora
+        in memoria: open / close cambiano solo se t0 / t1 sono più vecchi / più nuovi.
+        """
+        bt = bucket_start(bar[0], tf)
+        q = self.closed[tf]
+        keys = self._closed_keys[tf]
+        for i in range(len(q) - 1, -1, -1):
+            ts, o, h, l, c, v = q[i]
+            if ts < bt:
+                break
+            if ts == bt:
+                k0, k1 = keys[i]
+                if t0 < k0:
+                    o, k0 = bar[1], t0
+                if t1 >= k1:
+                    c, k1 = bar[4], t1
+                keys[i] = (k0, k1)
+                q[i] = (ts, o, max(h, bar[2]), min(l, bar[3]), c, v + bar[5])
+                if self.on_bar_revised is not None:
+                    await _maybe_await(self.on_bar_revised(self.coin, tf, q[i]))
+                return True
+        return False
+
+    async def _late(self, b: int, px: float, sz: float, key: Tuple[int, int]) -> None:
+        """Trade per un bucket già chiuso: corregge la barra chiusa se ancora in memoria."""
+        bar = (b, px, px, px, px, sz)
+        if await self._revise(self.base_tf, bar, key, key):
+            self.late_patched += 1
+        else:
+            self.late_dropped += 1
+        for tf in self.tfs:
+            d = self._derived[tf]
+            if d is not None and d.ts == bucket_start(b, tf):
+                # TF derivato ancora in formazione
+                d.merge(bar, key, key)
+            else:
+                await self._revise(tf, bar, key, key)
+
+    async def flush(self, now_ms: Optional[int] = None) -> None:
+        """
+        Senza now_ms chiude tutto ciò che è in formazione (fine replay); con now_ms chiude
+        a tempo solo le barre (1m e derivate) scadute a now_ms, anche senza trade nuovi.
+        """
+        if now_ms is not None:
+            await self.advance(int(now_ms))
+            return
+        for b in sorted(self._open):
+            await self._close_base(self._open.pop(b))
+        for tf in self.tfs:
+            d = self._derived[tf]
+            if d is not None:
+                self._derived[tf] = None
+                await self._emit(tf, d)
+
+    def batch(self, tf: str = "1m") -> CandleBatch:
+        bars = list(self.closed.get(tf.lower()) or [])
+        if not bars:
+            return CandleBatch.empty(self.coin, tf)
+        a = np.asarray(bars, dtype=np.float64)
+        return CandleBatch(self.coin, tf, a[:, 0].astype(np.int64), a[:, 1], a[:, 2], a[:, 3], a[:, 4], a[:, 5])
+
+    async def run_clock(self, every_ms: int = 50) -> None:
+        """Chiusura a tempo anche senza trade: da lanciare accanto allo stream."""
+        while True:
+            await self.advance(int(time.time() * 1000))
+            await asyncio.sleep(max(1, int(every_ms)) / 1000.0)
+
+# ----------------------------
+# replay offline
+# ----------------------------
+def load_trades(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """File registrato: JSONL, una riga = un trade HL oppure un messaggio {"channel":"trades","data":[...]}."""
+    out: List[Dict[str, Any]] = []
+    with Path(path).open() as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                msg = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(msg, dict) and msg.get("channel") == "trades":
+                out.extend(t for t in (msg.get("data") or []) if isinstance(t, dict))
+            elif isinstance(msg, dict):
+                out.append(msg)
+    return out
+
+async def replay_trades(
+    trades: Iterable[Dict[str, Any]],
+    coin: str,
+    tfs: Iterable[str] = ("1m",),
+    *,
+    grace_ms: int = TRADE_LATE_GRACE_MS,
+) -> TradeAggregator:
+    """Replay in ordine di arrivo (non riordinato: i ritardi del file restano ritardi)."""
+    agg = TradeAggregator(coin, tfs, grace_ms=grace_ms, keep_closed=1_000_000)
+    for t in trades:
+        await agg.add_trade(t)
+    await agg.flush()
+    return agg
+
+def compare_batches(a: CandleBatch, b: CandleBatch, *, rtol: float = 1e-9) -> Dict[str, int]:
+    """Confronto su ts comuni (es. aggregato vs REST): barre uguali / diverse / solo da una parte."""
+    common, ia, ib = np.intersect1d(a.ts, b.ts, assume_unique=True, return_indices=True)
+    same = np.ones(common.shape[0], dtype=bool)
+    for k in ("open", "high", "low", "close", "volume"):
+        same &= np.isclose(getattr(a, k)[ia], getattr(b, k)[ib], rtol=rtol, atol=0.0)
+    return {
+        "common": int(common.shape[0]),
+        "equal": int(same.sum()),
+        "different": int((~same).sum()),
+        "only_a": int(a.ts.shape[0] - common.shape[0]),
+        "only_b": int(b.ts.shape[0] - common.shape[0]),
+    }
+
+async def _main(argv: List[str]) -> None:
+    """
+    python trade_candles.py record <COIN> <file.jsonl>   registra trade dal WS HL
+    python trade_candles.py replay <COIN> <file.jsonl>   ricostruisce 1m e confronta con REST
+    """
+    from hl_stream import HLStreamClient
+    from hyper_rest import _hl_rest_candles_batch, aclose_client
+
+    mode, coin, path = argv[0], argv[1], Path(argv[2])
+    try:
+        if mode == "record":
+            f = path.open("a")
+
+            def _rec(_coin: str, t: Dict[str, Any]) -> None:
+                f.write(json.dumps(t) + "\n")
+
+            cli = HLStreamClient([], trades=[coin], on_trade=_rec, backfill=False)
+            try:
+                await cli.run()
+            finally:
+                f.close()
+            return
+
+        trades = load_trades(path)
+        agg = await replay_trades(trades, coin)
+        mine = agg.batch("1m")
+        if not len(mine):
+            print("[REPLAY] nessuna barra")
+            return
+        # prima/ultima barra parziali nella registrazione: fuori dal confronto
+        inner = mine.slice_ts(int(mine.ts[0]) + 1, int(mine.ts[-1]) - 1)
+        rest = await _hl_rest_candles_batch(
+            coin, "1m", limit=len(mine) + 2, end_ts_ms=int(mine.ts[-1]), use_cache=False
+        )
+        cmp = compare_batches(inner, rest)
+        print(
+            f"[REPLAY] trade={agg.trades} dup={agg.duplicates} late_patched={agg.late_patched} "
+            f"late_dropped={agg.late_dropped} barre={len(mine)} vs REST {cmp}"
+        )
+    finally:
+        await aclose_client()
+
+if __name__ == "__main__":
+    import sys
+
+    asyncio.run(_main(sys.argv[1:]))